@@ -0,0 +1,18 @@
+# health_routes.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.startup import startup_state
+
+router = APIRouter()
+
+# 存活检查：进程能响应即可
+@router.get("/live")
+async def live():
+    return {"status": "ok"}
+
+# 就绪检查：建表、模型加载和预热推理全部完成后返回 200，否则返回 503，负载均衡据此决定是否转发流量
+@router.get("/ready")
+async def ready():
+    snapshot = startup_state.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
@@ -5,8 +5,9 @@ import numpy as np
 import tempfile
 import os
 from app.models.ppocr_model import PPOCRModel
-from typing import Union
+from typing import List, Optional, Union
 import random
+import cv2
 
 # router = APIRouter()
 
@@ -62,72 +63,205 @@ def simulate_ppocr(image_path):
         'confidence': 0.95
     }
 
-from paddleocr import PaddleOCR
+from app.models.model_factory import create_ocr_model
+from app.models.ppocr_model import OCRLine, best_line, load_bgr_image
+from app.api.ship_id_routes import hull_index
+from app.utils.ocr_gate import create_ocr_gate, OCR_RUN, OCR_DEFER
+from app.utils.ocr_cache import create_ocr_cache
+from app.utils.worker_pool import get_worker_pool
+import copy
 import numpy as np
+import threading
 
-# 初始化 PaddleOCR（建议全局只初始化一次）
-ocr_model = PaddleOCR(use_angle_cls=True, lang='ch')
+# OCR 引擎（PPOCRModel）全局只初始化一次，启用多进程推理池时由子进程各自持有
+# 服务启动时由 init_ocr 加载（见 app/services/startup.py），导入本模块不会加载模型
+worker_pool = None
+ocr_model = None
+_init_lock = threading.Lock()
+_initialized = False
+
+# OCR 文本与船舶档案中船号的最低相似度，达到时 matched_ship_id 返回档案中的船号
+OCR_MATCH_MIN_SCORE = float(os.getenv("OCR_MATCH_MIN_SCORE", 0.8))
+
+def init_ocr():
+    """加载 OCR 模型，重复调用无副作用；未在启动时调用时会在第一次识别时自动加载"""
+    global worker_pool, ocr_model, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        worker_pool = get_worker_pool()
+        if worker_pool is None:
+            ocr_model = create_ocr_model()
+            ocr_model.hull_index = hull_index
+        _initialized = True
+
+def warmup_ocr(image: Optional[np.ndarray] = None, iterations: int = 1):
+    """预热 OCR：文字检测、方向分类与识别各跑一遍，使用推理池时每个进程各预热一次"""
+    init_ocr()
+    if image is None:
+        # 白底黑字的合成图，保证识别分支也会被执行
+        image = np.full((64, 256, 3), 255, dtype=np.uint8)
+        cv2.putText(image, "A1234", (20, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 3)
+    for _ in range(iterations):
+        if worker_pool is not None:
+            futures = [worker_pool.ocr(image) for _ in range(worker_pool.num_workers)]
+            for future in futures:
+                future.result()
+        else:
+            ocr_model.detect_and_recognize(image)
+
+def _run_ocr_batch(images: List[np.ndarray]) -> List[List[OCRLine]]:
+    if not _initialized:
+        init_ocr()
+    if worker_pool is not None:
+        return worker_pool.ocr_batch(images).result()
+    return ocr_model.recognize_batch(images)
 
 def ppocr_v4(image: Union[str, bytes, np.ndarray]):
     """
     支持文件路径（str）或图像字节流（bytes/np.ndarray）的 OCR 检测。
     返回格式：
     {
-        'ship_id': str,
+        'ship_id': str,                 # 识别出的船号文本
         'ship_id_bbox': [x1, y1, x2, y2],
-        'confidence': float
+        'confidence': float,
+        'quad': [[x, y], ...],          # 船号文字的四点框
+        'ocr_text': str,                # 识别出的原始文本
+        'matched_ship_id': str | None,  # 匹配到的档案船号，未匹配为 None
+        'match_score': float            # 与档案船号的相似度，未匹配为 0
     }
     """
-    # 如果是字符串路径
     print(f"开始识别, 类型: {type(image)}")
-    if isinstance(image, str):
-        if not os.path.exists(image):
-            raise FileNotFoundError(f"Image path does not exist: {image}")
-        result = ocr_model.ocr(image, cls=True)
-
-    # 如果是字节流或 numpy array
-    else:
-        # 如果是 bytes，转成 numpy
-        if isinstance(image, bytes):
-            import cv2
-            np_arr = np.frombuffer(image, np.uint8)
-            image_np = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        elif isinstance(image, np.ndarray):
-            image_np = image
+    # 路径、字节流只解码一次，数组直接交给 OCR，不落盘，并走感知哈希缓存
+    return _ocr_arrays([load_bgr_image(image)])[0]
+
+def ppocr_v4_batch(images: List[Union[str, bytes, np.ndarray]], cache_scope=None) -> List[dict]:
+    """
+    批量 OCR：一帧（或多帧）内所有船舶裁剪图一起识别，文字行合并成批次做方向分类和识别
+
+    返回与输入一一对应的列表，每项格式与 ppocr_v4 相同。
+    cache_scope（如视频ID）不同的裁剪图不会共用缓存结果；为 None 时不使用缓存，
+    避免不相关的单次请求之间互相命中。
+    """
+    if not images:
+        return []
+    print(f"开始批量识别, 共 {len(images)} 张")
+    return _ocr_arrays([load_bgr_image(image) for image in images], cache_scope)
+
+# OCR 结果缓存：相邻抽帧中同一艘停泊船的裁剪图几乎相同，按感知哈希（dHash）复用识别结果
+ocr_cache = create_ocr_cache()
+
+def _scale_geometry(result: dict, sx: float, sy: float, to_pixels: bool) -> dict:
+    """按比例缩放结果中的 ship_id_bbox 和 quad，to_pixels 为 True 时取整为像素坐标"""
+    cast = (lambda v: int(round(v))) if to_pixels else float
+    scaled = dict(result)
+    x1, y1, x2, y2 = result['ship_id_bbox']
+    scaled['ship_id_bbox'] = [cast(x1 * sx), cast(y1 * sy), cast(x2 * sx), cast(y2 * sy)]
+    if result.get('quad'):
+        scaled['quad'] = [[cast(x * sx), cast(y * sy)] for x, y in result['quad']]
+    return scaled
+
+def _ocr_arrays(arrays: List[np.ndarray], cache_scope=None) -> List[dict]:
+    """
+    先查缓存，未命中的一起批量 OCR 后写回缓存
+
+    感知哈希与尺寸无关，缓存中的框按裁剪图宽高归一化保存，命中时再换算到当前裁剪图的像素坐标。
+    """
+    results: List[Optional[dict]] = [None] * len(arrays)
+    keys = [None] * len(arrays)
+    misses = []
+    for i, array in enumerate(arrays):
+        if ocr_cache is not None and cache_scope is not None and array.size:
+            keys[i] = ocr_cache.make_key(array, cache_scope)
+            cached = ocr_cache.get(keys[i])
+            if cached is not None:
+                h, w = array.shape[:2]
+                results[i] = _scale_geometry(copy.deepcopy(cached), w, h, True)
+                continue
+        misses.append(i)
+
+    if misses:
+        for i, lines in zip(misses, _run_ocr_batch([arrays[i] for i in misses])):
+            results[i] = _format_ocr_result(lines)
+            if keys[i] is not None:
+                h, w = arrays[i].shape[:2]
+                ocr_cache.put(keys[i], _scale_geometry(copy.deepcopy(results[i]), 1.0 / w, 1.0 / h, False))
+    if len(misses) < len(arrays):
+        print(f"OCR 缓存命中 {len(arrays) - len(misses)}/{len(arrays)}")
+    return results
+
+def get_ocr_cache_stats() -> dict:
+    if ocr_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ocr_cache.stats()}
+
+# OCR 门控：尺寸过小、模糊或按类别策略不需要识别的裁剪图不进入 OCR
+ocr_gate = create_ocr_gate()
+
+def skipped_ocr_result(reason: str) -> dict:
+    """被门控跳过的裁剪图的结果，格式与 ppocr_v4 相同，额外带 skip_reason"""
+    return {**_empty_ocr_result(), 'skip_reason': reason}
+
+def ppocr_v4_gated(images: List[np.ndarray], category_ids: List[int], allow_defer: bool = False,
+                   cache_scope=None) -> List[Optional[dict]]:
+    """
+    先经过 OCR 门控，只对通过的裁剪图批量 OCR
+
+    Args:
+        images (List[np.ndarray]): BGR 裁剪图
+        category_ids (List[int]): 对应的检测类别ID（从1开始）
+        allow_defer (bool): 调用方能否稍后再识别；为 False 时推迟的裁剪图按跳过处理
+        cache_scope: OCR 缓存作用域，见 ppocr_v4_batch，为 None 时不使用缓存
+
+    Returns:
+        List[Optional[dict]]: 与输入一一对应；跳过的带 skip_reason，推迟的为 None
+    """
+    results: List[Optional[dict]] = [None] * len(images)
+    run_indices = []
+    for i, (image, category_id) in enumerate(zip(images, category_ids)):
+        decision, reason, metrics = ocr_gate.check(image, category_id)
+        if decision == OCR_RUN:
+            run_indices.append(i)
+        elif decision == OCR_DEFER and allow_defer:
+            continue
         else:
-            raise ValueError("Unsupported image input type.")
+            print(f"跳过 OCR: {reason} {metrics}")
+            results[i] = skipped_ocr_result(reason)
 
-        # 写入本地文件（OCR 只支持路径）
-        output_dir = "output/temp"
-        os.makedirs(output_dir, exist_ok=True)
-        temp_image_path = os.path.join(output_dir, "ppocr_v4.jpg")
-        from PIL import Image
-        pil_image = Image.fromarray(image_np[..., ::-1])  # BGR to RGB
-        pil_image.save(temp_image_path)
-        result = ocr_model.ocr(temp_image_path, cls=True)
+    for i, result in zip(run_indices, ppocr_v4_batch([images[i] for i in run_indices], cache_scope)):
+        results[i] = result
+    return results
 
+def get_ocr_gate_stats() -> dict:
+    return ocr_gate.stats()
+
+def _empty_ocr_result() -> dict:
+    """没有识别到船号时的结果，字段与 ppocr_v4 的返回格式一致"""
+    return {
+        'ship_id': "无法检测",
+        'ship_id_bbox': [0, 0, 0, 0],
+        'confidence': 0.0,
+        'quad': [],
+        'ocr_text': "",
+        'matched_ship_id': None,
+        'match_score': 0.0
+    }
+
+def _format_ocr_result(lines: List[OCRLine]) -> dict:
+    """从单张图片的 OCR 结果中选出置信度最高的一行作为船号，并与船舶档案中的船号匹配"""
     # 无结果或结果为空
-    if not result or not result[0]:
+    line = best_line(lines)
+    if line is None:
         print("无法识别到船号")
-        return {
-            'ship_id': "无法检测",
-            'ship_id_bbox': [0, 0, 0, 0],
-            'confidence': 0.0
-        }
-
-    # 选置信度最高的结果
-    best_line = max(result[0], key=lambda x: x[1][1] if x[1][1] is not None else 0)
-    box_points = best_line[0]
-    text = best_line[1][0]
-    confidence = best_line[1][1] or 0.0
-
-    # 提取矩形框
-    x_coords = [point[0] for point in box_points]
-    y_coords = [point[1] for point in box_points]
-    bbox = [int(min(x_coords)), int(min(y_coords)), int(max(x_coords)), int(max(y_coords))]
+        return _empty_ocr_result()
 
+    matched = hull_index.match(line.text, OCR_MATCH_MIN_SCORE)
     return {
-        'ship_id': text,
-        'ship_id_bbox': bbox,
-        'confidence': round(confidence, 3)
-    }
\ No newline at end of file
+        'ship_id': line.text,
+        'ship_id_bbox': line.box,
+        'confidence': round(line.score, 3),
+        'quad': line.quad,
+        'ocr_text': line.text,
+        'matched_ship_id': matched[0] if matched else None,
+        'match_score': round(matched[1], 3) if matched else 0.0
+    }
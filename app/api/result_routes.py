@@ -8,6 +8,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from app.utils.db_migrate import add_column_if_missing
 
 router = APIRouter()
 load_dotenv()
@@ -49,22 +50,53 @@ def init_result_table():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     ) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
     """)
+    # OCR 门控跳过时记录原因，为空表示执行了 OCR
+    add_column_if_missing(cursor, "results", "ocr_skip_reason", "VARCHAR(50) NULL")
+    # 跟踪：一条记录对应一艘船的一次经过，记录首末出现时间、命中帧数与船号投票数
+    add_column_if_missing(cursor, "results", "track_id", "INT NULL")
+    add_column_if_missing(cursor, "results", "first_timestamp", "VARCHAR(50) NULL")
+    add_column_if_missing(cursor, "results", "last_timestamp", "VARCHAR(50) NULL")
+    add_column_if_missing(cursor, "results", "hits", "INT NULL")
+    add_column_if_missing(cursor, "results", "ocr_votes", "INT NULL")
     conn.commit()
     cursor.close()
     conn.close()
 
+def make_frame_id(region_url: str) -> str:
+    hash_input = f"{region_url}_{datetime.now().timestamp()}"
+    return "fid_" + hashlib.sha256(hash_input.encode()).hexdigest()[:12]
+
 # 写入单条检测结果（供后端处理调用）
 def save_result_to_db(video_id: int, ship_id: str, bbox: str, region_url: str,
-                      timestamp: str, category: int, confidence: float):
-    hash_input = f"{region_url}_{datetime.now().timestamp()}"
-    frame_id = "fid_" + hashlib.sha256(hash_input.encode()).hexdigest()[:12]
+                      timestamp: str, category: int, confidence: float,
+                      ocr_skip_reason: Optional[str] = None):
+    save_results_to_db([{
+        "video_id": video_id,
+        "ship_id": ship_id,
+        "bbox": bbox,
+        "region_url": region_url,
+        "timestamp": timestamp,
+        "category": category,
+        "confidence": confidence,
+        "ocr_skip_reason": ocr_skip_reason
+    }])
+
+# 批量写入检测结果，一个连接、一次提交
+def save_results_to_db(results: List[dict]):
+    if not results:
+        return
+    rows = [(r["video_id"], make_frame_id(r["region_url"]), r["category"], r["ship_id"], r["bbox"],
+             r["region_url"], r["timestamp"], r["confidence"], r.get("ocr_skip_reason"),
+             r.get("track_id"), r.get("first_timestamp"), r.get("last_timestamp"), r.get("hits"), r.get("ocr_votes"))
+            for r in results]
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO results (video_id, frame_id, category, ship_id, bbox, region_url, timestamp, confidence)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (video_id, frame_id, category, ship_id, bbox, region_url, timestamp, confidence))
+    cursor.executemany("""
+        INSERT INTO results (video_id, frame_id, category, ship_id, bbox, region_url, timestamp, confidence, ocr_skip_reason,
+                             track_id, first_timestamp, last_timestamp, hits, ocr_votes)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, rows)
     conn.commit()
     cursor.close()
     conn.close()
@@ -81,6 +113,12 @@ class Result(BaseModel):
     timestamp: str
     confidence: float
     created_at: str
+    ocr_skip_reason: Optional[str] = None
+    track_id: Optional[int] = None
+    first_timestamp: Optional[str] = None
+    last_timestamp: Optional[str] = None
+    hits: Optional[int] = None
+    ocr_votes: Optional[int] = None
 
 def parse_result_row(row):
     return {
@@ -93,7 +131,13 @@ def parse_result_row(row):
         "region_url": row[5],
         "timestamp": row[6],
         "confidence": row[7],
-        "created_at": row[8].strftime("%Y-%m-%d %H:%M:%S")
+        "created_at": row[8].strftime("%Y-%m-%d %H:%M:%S"),
+        "ocr_skip_reason": row[9],
+        "track_id": row[10],
+        "first_timestamp": row[11],
+        "last_timestamp": row[12],
+        "hits": row[13],
+        "ocr_votes": row[14]
     }
 
 @router.get("/get_results", response_model=List[Result])
@@ -131,7 +175,8 @@ async def get_results(
     where_clause = " AND ".join(conditions) if conditions else ""
     
     sql = f"""
-        SELECT video_id, frame_id, category, ship_id, bbox, region_url, timestamp, confidence, created_at
+        SELECT video_id, frame_id, category, ship_id, bbox, region_url, timestamp, confidence, created_at, ocr_skip_reason,
+               track_id, first_timestamp, last_timestamp, hits, ocr_votes
         FROM results
         {f"WHERE {where_clause}" if where_clause else ""}
         ORDER BY created_at DESC
@@ -260,7 +305,3 @@ async def get_all_datas():
         "daily_pass_counts": complete_daily_counts,
         "category_counts": category_counts
     }
-
-
-# 初始化数据库
-init_result_table()
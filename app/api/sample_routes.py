@@ -1,35 +1,45 @@
 import asyncio
 import os
 import tempfile
+import uuid
 import cv2
 import json
 import numpy as np
 
-from fastapi import APIRouter, File, UploadFile
+from typing import Optional
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
 
-from app.api.yolov8_routes import yolov8_detect
-from app.api.ppocr_routes import ppocr_v4
+from app.api.yolov8_routes import yolov8_detect_async, get_detect_stats, get_worker_stats
+from app.api.ppocr_routes import ppocr_v4_batch, ppocr_v4_gated, get_ocr_gate_stats, get_ocr_cache_stats
 from app.utils.pic2base64 import encode_ndarray_to_base64
+from app.utils.roi import RegionOfInterest
+from app.utils.video_source import VideoSource
+from app.utils.upload_stream import create_upload_copy, upload_max_bytes
+from app.utils.motion_gate import create_motion_gate
 
 router = APIRouter()
 
+# 实时流未指定抽帧间隔时使用的默认值（秒）
+STREAM_SAMPLE_INTERVAL = float(os.getenv("STREAM_SAMPLE_INTERVAL", 1))
+
 @router.post("/test_image")
-async def detect_image(image: UploadFile = File(...)):
+async def detect_image(image: UploadFile = File(...), latency_budget_ms: Optional[float] = Form(None)):
     contents = await image.read()
     np_arr = np.frombuffer(contents, np.uint8)
     img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
 
-    detections = yolov8_detect(img)
+    detections, input_size = await yolov8_detect_async(img, latency_budget_ms)
     print(f"检测到 {len(detections)} 个船舶")
     results = []
 
+    # ---------- 处理船舶 bbox，收集所有裁剪区域 ----------
+    ships = []
     for idx, det in enumerate(detections, start=1):
         print(f"船舶 {idx}: {det['category']}")
         
         bbox = list(map(int, det["bbox"]))  # [x1, y1, x2, y2]
         x1, y1, x2, y2 = bbox
-        # ---------- 处理船舶 bbox ----------
         print(f"船舶 bbox: {bbox}")
         if x1 < 0: x1 = 0
         if y1 < 0: y1 = 0
@@ -40,13 +50,16 @@ async def detect_image(image: UploadFile = File(...)):
             continue
         region = img[y1:y2, x1:x2].copy()  # 裁剪区域图像
         print(f"裁剪区域大小: {region.shape}")
+        ships.append((idx, det, bbox, (x1, y1, x2, y2), region))
+
+    # ---------- 船号识别：所有船舶一起批量 OCR ----------
+    ocr_results = await asyncio.to_thread(ppocr_v4_batch, [ship[4] for ship in ships])
 
+    for (idx, det, bbox, (x1, y1, x2, y2), region), ocr_result in zip(ships, ocr_results):
         # ---------- 绘制船舶 bbox 在原图上 ----------
         img_with_ship_box = img.copy()
         cv2.rectangle(img_with_ship_box, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
-        # ---------- 船号识别 ----------
-        ocr_result = ppocr_v4(region)
         ship_number = ocr_result.get("ship_id", "")
         number_bbox = ocr_result.get("ship_id_bbox", [])  # 相对于 region 的 bbox
 
@@ -70,92 +83,130 @@ async def detect_image(image: UploadFile = File(...)):
             "visualized_number_on_crop": number_crop_img_b64
         })
 
-    return {"results": results}
+    return {"input_size": input_size, "results": results}
+
+# 检测一帧（只检测 ROI 外接矩形内的像素，结果还原到整帧坐标），并对所有船舶批量 OCR
+async def detect_and_recognize(frame, frame_roi: Optional[RegionOfInterest], roi_crop, roi_offset,
+                               latency_budget_ms: Optional[float], cache_scope: str):
+    if frame_roi is None:
+        detections, input_size = await yolov8_detect_async(frame, latency_budget_ms)
+    else:
+        detections, input_size = [], None
+        if roi_crop.size:
+            detections, input_size = await yolov8_detect_async(
+                roi_crop, latency_budget_ms,
+                dets_filter=lambda dets: frame_roi.filter_raw(dets, roi_offset, frame.shape))
+            detections = frame_roi.restore(detections, roi_offset, frame.shape)
+
+    # 本帧所有船舶裁剪图经过 OCR 门控后一起批量 OCR（实时流没有“稍后”，推迟的按跳过处理）
+    ship_crops = []
+    for det in detections:
+        x1, y1, x2, y2 = map(int, det["bbox"])
+        ship_crops.append(frame[y1:y2, x1:x2])
+    ocr_results = await asyncio.to_thread(
+        ppocr_v4_gated, ship_crops, [det["category_id"] for det in detections], False, cache_scope)
+
+    result_list = []
+    for det, ocr_result in zip(detections, ocr_results):
+        x1, y1, x2, y2 = map(int, det["bbox"])
+        ship_id_bbox_crop = ocr_result.get("ship_id_bbox", [])
+        if ship_id_bbox_crop:
+            sx1, sy1, sx2, sy2 = map(int, ship_id_bbox_crop)
+            ship_id_bbox_global = [x1 + sx1, y1 + sy1, x1 + sx2, y1 + sy2]
+        else:
+            ship_id_bbox_global = []
+
+        result_list.append({
+            "category": det["category"],
+            "ship_id": ocr_result.get("ship_id", ""),
+            "ship_bbox": [x1, y1, x2, y2],
+            "ship_confidence": round(float(det.get("confidence", 0.9)), 3),
+            "ship_id_bbox": ship_id_bbox_global,
+            "ship_id_confidence": round(float(ocr_result.get("confidence", 0.85)), 3),
+            "ocr_skip_reason": ocr_result.get("skip_reason")
+        })
+    return result_list, input_size
 
 @router.post("/test_video")
-async def stream_video_detect(video: UploadFile = File(...)):
-    # 保存上传的视频到临时文件
-    temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    temp.write(await video.read())
-    temp.close()
+async def stream_video_detect(video: UploadFile = File(...), latency_budget_ms: Optional[float] = Form(None),
+                              roi: Optional[str] = Form(None, description="ROI 多边形 JSON（原始帧坐标），如 [[x,y],...]"),
+                              sample_interval: Optional[float] = Form(None, description="抽帧间隔（秒），默认 STREAM_SAMPLE_INTERVAL")):
+    try:
+        roi = RegionOfInterest.parse(roi)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ROI: {e}")
+    if sample_interval is not None and not sample_interval > 0:
+        raise HTTPException(status_code=400, detail="sample_interval must be positive")
+    max_bytes = upload_max_bytes()
+    if max_bytes and getattr(video, "size", None) and video.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Video exceeds {max_bytes} bytes")
+
+    # 上传的临时文件在后台分块复制到本地（同时计算内容哈希），不整体读入内存；
+    # 已复制的部分足够打开视频时就开始抽帧，不必等复制完成
+    fd, temp_path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    upload = create_upload_copy(video, temp_path, detach=True).start()
 
     async def gen():
-        cap = None
+        source = VideoSource.from_growing_file(upload, sample_interval or STREAM_SAMPLE_INTERVAL)
         try:
-            cap = cv2.VideoCapture(temp.name)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            if fps <= 0 or np.isnan(fps):
-                fps = 25.0
-            frame_interval = int(fps)
-            frame_id = 0
+            # 解码与等待数据都在线程中进行，不阻塞事件循环
+            await asyncio.to_thread(source.open)
+            frames = iter(source)
             max_width = 1280
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
+            frame_roi = roi
+            cache_scope = f"stream:{uuid.uuid4().hex}"  # 同一个视频流内的帧共用 OCR 缓存
+            motion_gate = create_motion_gate()  # 每个视频流一个场景变化门控
+            result_list, input_size = [], None
+
+            while True:
+                item = await asyncio.to_thread(next, frames, None)
+                if item is None:
                     break
-
-                if frame_id % frame_interval != 0:
-                    frame_id += 1
-                    continue
-
-                timestamp = round(frame_id / fps, 2)
+                frame_id, timestamp, frame = item
+                timestamp = round(timestamp, 2)
                 print(f"Processing frame {frame_id} at timestamp {timestamp:.2f}s")
 
                 if frame.shape[1] > max_width:
                     scale = max_width / frame.shape[1]
                     frame = cv2.resize(frame, None, fx=scale, fy=scale)
+                    if roi is not None and frame_roi is roi:
+                        frame_roi = roi.scaled(scale)
 
-                detections = yolov8_detect(frame)
-                frame_drawn = frame.copy()
-                result_list = []
-
-                for det in detections:
-                    x1, y1, x2, y2 = map(int, det["bbox"])
-                    ship_crop = frame[y1:y2, x1:x2].copy()
-                    ship_category = det["category"]
-                    ship_confidence = round(float(det.get("score", 0.9)), 3)
-
-                    ocr_result = ppocr_v4(ship_crop)
-                    ship_id = ocr_result.get("ship_id", "")
-                    ship_id_bbox_crop = ocr_result.get("ship_id_bbox", [])
-                    ship_id_conf = round(float(ocr_result.get("ship_id_score", 0.85)), 3)
-
-                    if ship_id_bbox_crop:
-                        sx1, sy1, sx2, sy2 = map(int, ship_id_bbox_crop)
-                        ship_id_bbox_global = [x1 + sx1, y1 + sy1, x1 + sx2, y1 + sy2]
-                        cv2.rectangle(frame_drawn, (ship_id_bbox_global[0], ship_id_bbox_global[1]),
-                                      (ship_id_bbox_global[2], ship_id_bbox_global[3]), (0, 0, 255), 2)
-                    else:
-                        ship_id_bbox_global = []
+                # 画面（ROI 内）与上一次检测时相比没有变化时跳过检测和 OCR，沿用上一次的结果
+                roi_crop, roi_offset = (frame, None) if frame_roi is None else frame_roi.crop(frame)
+                inferred, motion_reason, motion_score = await asyncio.to_thread(
+                    motion_gate.check, roi_crop if roi_crop.size else frame, timestamp)
+                if inferred:
+                    result_list, input_size = await detect_and_recognize(
+                        frame, frame_roi, roi_crop, roi_offset, latency_budget_ms, cache_scope)
 
+                frame_drawn = frame.copy()
+                for result in result_list:
+                    x1, y1, x2, y2 = result["ship_bbox"]
+                    if result["ship_id_bbox"]:
+                        sx1, sy1, sx2, sy2 = result["ship_id_bbox"]
+                        cv2.rectangle(frame_drawn, (sx1, sy1), (sx2, sy2), (0, 0, 255), 2)
                     cv2.rectangle(frame_drawn, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
-                    result_list.append({
-                        "category": ship_category,
-                        "ship_id": ship_id,
-                        "ship_bbox": [x1, y1, x2, y2],
-                        "ship_confidence": ship_confidence,
-                        "ship_id_bbox": ship_id_bbox_global,
-                        "ship_id_confidence": ship_id_conf
-                    })
-
                 visualized_b64 = encode_ndarray_to_base64(frame_drawn)
 
                 yield json.dumps({
                     "status": "ok",
                     "frame_id": frame_id,
                     "timestamp": timestamp,
+                    "input_size": input_size,
+                    "motion": {"inferred": inferred, "reason": motion_reason, "score": motion_score},
                     "visualized_frame": visualized_b64,
                     "results": result_list
                 }) + "\n"
                 await asyncio.sleep(0)  # 推动 event loop 输出帧
 
-                frame_id += 1
-
             # 所有帧处理完毕，发送一个结束信号
             yield json.dumps({
-                "status": "done"
+                "status": "done",
+                "content_hash": upload.hexdigest,
+                "motion_stats": motion_gate.stats()
             }) + "\n"
 
         except Exception as e:
@@ -165,9 +216,27 @@ async def stream_video_detect(video: UploadFile = File(...)):
             }) + "\n"
 
         finally:
-            if cap:
-                cap.release()
-            if os.path.exists(temp.name):
-                os.remove(temp.name)
-
-    return StreamingResponse(gen(), media_type="application/json", status_code=200)
\ No newline at end of file
+            # 停止仍在进行的复制并删除临时文件
+            source.close()
+
+    return StreamingResponse(gen(), media_type="application/json", status_code=200)
+
+@router.get("/detect_stats")
+async def detect_stats():
+    """检测微批调度器的运行统计（队列深度、批大小分布、平均等待）"""
+    return get_detect_stats()
+
+@router.get("/worker_stats")
+async def worker_stats():
+    """推理进程池中各进程的存活、就绪与负载情况"""
+    return get_worker_stats()
+
+@router.get("/ocr_gate_stats")
+async def ocr_gate_stats():
+    """OCR 门控的统计：执行、跳过、推迟的数量及跳过原因分布"""
+    return get_ocr_gate_stats()
+
+@router.get("/ocr_cache_stats")
+async def ocr_cache_stats():
+    """OCR 感知哈希缓存的命中率、条目数与淘汰次数"""
+    return get_ocr_cache_stats()
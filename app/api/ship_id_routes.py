@@ -7,6 +7,7 @@ import random
 from difflib import SequenceMatcher
 import os
 from dotenv import load_dotenv
+from app.utils.hull_index import HullNumberIndex
 
 router = APIRouter()
 load_dotenv()
@@ -48,6 +49,19 @@ def get_db_connection():
         database=os.getenv("MYSQL_DB_NAME")
     )
 
+# ---------- 船号候选索引 ----------
+# OCR 结果与档案船号匹配时使用，启动时载入，档案增删改时同步更新
+hull_index = HullNumberIndex()
+
+def load_hull_index():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT ship_id FROM ship_profiles")
+    hull_index.load(row[0] for row in cursor.fetchall())
+    cursor.close()
+    conn.close()
+    print(f"船号索引载入 {len(hull_index)} 条")
+
 # ---------- 初始化数据库表 ----------
 def init_ship_profile_table():
     conn = get_db_connection()
@@ -123,6 +137,7 @@ async def create_ship_profile(data: ShipProfileCreate):
     finally:
         cursor.close()
         conn.close()
+    hull_index.add(data.ship_id)
 
     return {
         "id": id,
@@ -161,6 +176,7 @@ async def update_ship_profile(id: int, update: ShipProfileUpdate):
     finally:
         cursor.close()
         conn.close()
+    hull_index.replace(row[3], new_ship_id)
 
     return {
         "id": id,
@@ -174,10 +190,14 @@ async def update_ship_profile(id: int, update: ShipProfileUpdate):
 async def delete_ship_profile(id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute("SELECT ship_id FROM ship_profiles WHERE id = %s", (id,))
+    row = cursor.fetchone()
     cursor.execute("DELETE FROM ship_profiles WHERE id = %s", (id,))
     conn.commit()
     cursor.close()
     conn.close()
+    if row:
+        hull_index.remove(row[0])
     return {"success": True, "message": f"Ship profile {id} deleted."}
 
 def calculate_similarity(a: str, b: str) -> float:
@@ -215,7 +235,4 @@ async def search_ship_profiles(q: str):
 # 接口 /categories 返回一个类别字典，方便前端使用
 @router.get("/categories")
 async def get_categories():
-    return CATEGORY_MAP 
-
-# ---------- 初始化表 ----------
-init_ship_profile_table()
+    return CATEGORY_MAP
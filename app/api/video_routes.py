@@ -1,20 +1,33 @@
 # video_routes.py
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, Form
-from typing import List
+import socket
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import Dict, Iterable, List, Optional, Tuple
 import threading
+import json
+import math
 import mysql.connector
 from datetime import datetime
 from pydantic import BaseModel
 import asyncio
 from dotenv import load_dotenv
-import requests
-from .result_routes import save_result_to_db
-from .yolov8_routes import simulate_yolov8_detect, yolov8_detect
-from .ppocr_routes import simulate_ppocr, ppocr_v4
+from .result_routes import save_results_to_db
+from .yolov8_routes import simulate_yolov8_detect, yolov8_detect, yolov8_detect_with_size
+from .ppocr_routes import simulate_ppocr, ppocr_v4, ppocr_v4_batch, ppocr_v4_gated, skipped_ocr_result
 from app.utils.lsky_pro import upload_to_lsky
-import tempfile
+from app.utils.roi import RegionOfInterest
+from app.utils.db_migrate import add_column_if_missing
+from app.utils.ocr_gate import REASON_DEFER_OVERFLOW
+from app.utils.video_source import VideoSource, GrowingFileError, FileTooLargeError
+from app.utils.frame_sampler import split_frame_range
+from app.utils.upload_stream import create_upload_copy
+from app.utils.pipeline import Pipeline, PipelineCancelled, PipelineGroup, PipelineRegistry, PipelineStage
+from app.utils.job_scheduler import JobScheduler
+from app.utils.motion_gate import MotionGate, create_motion_gate
+from app.utils.ship_tracker import (REASON_NO_CROP, SegmentTrackMerger, ShipTracker, Track, create_ship_tracker,
+                                    vote_hull_number)
+from app.utils.checkpoint import CheckpointMarker, CheckpointWatermark
 import uuid
 import cv2
 
@@ -23,10 +36,52 @@ router = APIRouter()
 # 加载环境变量
 load_dotenv()
 
+# 按类别推迟 OCR 的目标在视频处理完后统一识别，最多保留的数量与每批识别的数量
+OCR_DEFER_MAX = int(os.getenv("OCR_DEFER_MAX", 256))
+OCR_DEFER_BATCH = int(os.getenv("OCR_DEFER_BATCH", 16))
+
+# 视频处理流水线：各阶段输入队列容量、检测与上传并发数、OCR 单次最多合并的目标数、每次批量写库的条数
+VIDEO_PIPELINE_QUEUE_SIZE = int(os.getenv("VIDEO_PIPELINE_QUEUE_SIZE", 8))
+VIDEO_PIPELINE_DETECT_WORKERS = int(os.getenv("VIDEO_PIPELINE_DETECT_WORKERS", 1))
+VIDEO_PIPELINE_OCR_BATCH = int(os.getenv("VIDEO_PIPELINE_OCR_BATCH", 16))
+VIDEO_PIPELINE_UPLOAD_WORKERS = int(os.getenv("VIDEO_PIPELINE_UPLOAD_WORKERS", 4))
+VIDEO_PIPELINE_DB_BATCH = int(os.getenv("VIDEO_PIPELINE_DB_BATCH", 32))
+
+# 正在运行和最近完成的视频处理流水线，供 /pipeline_stats 查询
+video_pipelines = PipelineRegistry()
+
+# 检查点间隔（视频时间，秒），0 为不保存；服务重启或失败后从最近的检查点继续处理
+VIDEO_CHECKPOINT_INTERVAL = float(os.getenv("VIDEO_CHECKPOINT_INTERVAL", 60))
+
+# 长视频分段并行处理：同时处理的分段数（1 为不分段）、每段的最短时长（秒），不够分两段的视频不分段
+VIDEO_SEGMENT_WORKERS = int(os.getenv("VIDEO_SEGMENT_WORKERS", 1))
+VIDEO_SEGMENT_MIN_SECONDS = float(os.getenv("VIDEO_SEGMENT_MIN_SECONDS", 600))
+
+# 视频任务队列：同时处理的视频数、最多排队的任务数、空闲时轮询队列的间隔（秒）、启动时是否重新排队被中断的任务
+VIDEO_JOB_WORKERS = int(os.getenv("VIDEO_JOB_WORKERS", 1))
+VIDEO_JOB_QUEUE_MAX = int(os.getenv("VIDEO_JOB_QUEUE_MAX", 100))
+VIDEO_JOB_POLL_INTERVAL = float(os.getenv("VIDEO_JOB_POLL_INTERVAL", 5))
+VIDEO_JOB_REQUEUE_INTERRUPTED = os.getenv("VIDEO_JOB_REQUEUE_INTERRUPTED", "true").lower() in ("1", "true", "yes")
+# 多实例共用任务表：本进程的标识、处理中任务的心跳间隔（秒），
+# 心跳超过 VIDEO_JOB_HEARTBEAT_TIMEOUT 秒未更新的任务视为所在实例已失联，重新排队。
+# 默认标识为 主机名:进程号:随机串，每次启动都不同，uvicorn --workers 的各进程不会重新排队彼此正在处理的任务；
+# 退出进程留下的任务在心跳超时后重新排队。显式设置时每个进程必须各不相同，重启后会立即重新排队自己留下的任务
+VIDEO_JOB_INSTANCE_ID = os.getenv("VIDEO_JOB_INSTANCE_ID", "") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+VIDEO_JOB_HEARTBEAT_INTERVAL = float(os.getenv("VIDEO_JOB_HEARTBEAT_INTERVAL", 15))
+VIDEO_JOB_HEARTBEAT_TIMEOUT = float(os.getenv("VIDEO_JOB_HEARTBEAT_TIMEOUT", 120))
+
+# 上传视频的保存目录，数据库中只记录文件名
+UPLOAD_DIR = os.path.abspath("output/videos")
+
+# 视频未单独设置抽帧间隔时使用的默认值（秒）
+VIDEO_SAMPLE_INTERVAL = float(os.getenv("VIDEO_SAMPLE_INTERVAL", 3))
+
 # 状态枚举值
 STATUS_PROCESSING = 1
 STATUS_COMPLETED = 2
 STATUS_FAILED = 3
+STATUS_QUEUED = 4
+STATUS_CANCELLED = 5
 
 # 连接 MySQL 数据库
 def get_db_connection():
@@ -56,6 +111,28 @@ def init_db():
     ) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
     """)
 
+    # 感兴趣区域多边形（JSON，整帧坐标），为空表示整帧检测
+    add_column_if_missing(cursor, "videos", "roi", "TEXT NULL")
+    # 抽帧间隔（秒），为空表示使用 VIDEO_SAMPLE_INTERVAL
+    add_column_if_missing(cursor, "videos", "sample_interval", "FLOAT NULL")
+    # 任务队列：优先级越大越先处理，同优先级按入队顺序
+    add_column_if_missing(cursor, "videos", "priority", "INT NOT NULL DEFAULT 0")
+    add_column_if_missing(cursor, "videos", "started_at", "TIMESTAMP NULL")
+    add_column_if_missing(cursor, "videos", "finished_at", "TIMESTAMP NULL")
+    # 处理中任务所在的实例（VIDEO_JOB_INSTANCE_ID）与最近一次心跳
+    add_column_if_missing(cursor, "videos", "worker_instance", "VARCHAR(128) NULL")
+    add_column_if_missing(cursor, "videos", "heartbeat_at", "TIMESTAMP NULL")
+    # 上传视频的内容哈希（UPLOAD_HASH_ALGORITHM），URL 添加的视频为空
+    add_column_if_missing(cursor, "videos", "content_hash", "VARCHAR(128) NULL")
+    # 场景变化门控：实际检测的帧数与沿用上一帧结果的静止帧数
+    add_column_if_missing(cursor, "videos", "frames_inferred", "INT NULL")
+    add_column_if_missing(cursor, "videos", "frames_skipped", "INT NULL")
+    # 检查点：该帧及之前的结果都已入库，checkpoint_state 为此时的跟踪器状态（JSON）
+    add_column_if_missing(cursor, "videos", "checkpoint_frame", "INT NULL")
+    add_column_if_missing(cursor, "videos", "checkpoint_timestamp", "FLOAT NULL")
+    add_column_if_missing(cursor, "videos", "checkpoint_state", "MEDIUMTEXT NULL")
+    add_column_if_missing(cursor, "videos", "checkpoint_at", "TIMESTAMP NULL")
+
     # 添加示例数据（每条语句分开执行）
     example_data = [
         ('视频1', 'http://example.com/video1.mp4', STATUS_PROCESSING),
@@ -81,113 +158,568 @@ def status_to_text(status: int) -> str:
         return "处理完成"
     elif status == STATUS_FAILED:
         return "处理失败"
+    elif status == STATUS_QUEUED:
+        return "排队中"
+    elif status == STATUS_CANCELLED:
+        return "已取消"
     return "处理中"
 
+# 上传的视频在数据库中只记录文件名，处理时还原为绝对路径
+def resolve_video_path(video_url: str) -> str:
+    if video_url.startswith("http") or os.path.isabs(video_url):
+        return video_url
+    upload_path = os.path.join(UPLOAD_DIR, video_url)
+    return upload_path if os.path.exists(upload_path) else video_url
+
+# 排队任务数
+def count_queued_jobs(cursor) -> int:
+    cursor.execute("SELECT COUNT(*) FROM videos WHERE status = %s", (STATUS_QUEUED,))
+    return cursor.fetchone()[0]
+
+# 所有排队任务的位置（从1开始），按优先级从高到低、同优先级按入队顺序
+def get_queue_positions(cursor) -> Dict[int, int]:
+    cursor.execute("SELECT id FROM videos WHERE status = %s ORDER BY priority DESC, id ASC", (STATUS_QUEUED,))
+    return {row[0]: position for position, row in enumerate(cursor.fetchall(), start=1)}
+
+# 领取优先级最高的排队任务并标记为处理中；条件更新保证多个工作线程/进程不会领取同一个任务
+def claim_next_video_job():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute("""
+                SELECT id, video_url FROM videos WHERE status = %s
+                ORDER BY priority DESC, id ASC LIMIT 1
+            """, (STATUS_QUEUED,))
+            row = cursor.fetchone()
+            conn.commit()  # 结束快照读，下一次查询能看到其他连接的更新
+            if row is None:
+                return None
+            cursor.execute("""
+                UPDATE videos SET status = %s, started_at = NOW(), finished_at = NULL,
+                                  worker_instance = %s, heartbeat_at = NOW()
+                WHERE id = %s AND status = %s
+            """, (STATUS_PROCESSING, VIDEO_JOB_INSTANCE_ID, row[0], STATUS_QUEUED))
+            conn.commit()
+            if cursor.rowcount == 1:
+                return row[0], (row[0], resolve_video_path(row[1]))
+    finally:
+        cursor.close()
+        conn.close()
+
+# 被中断的处理中任务重新排队（有检查点时从检查点继续）：心跳超时的任务，以及 include_own 时本实例上次运行留下的任务；
+# 其他实例正在处理的任务不受影响
+def requeue_interrupted_jobs(include_own: bool = True) -> int:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE videos SET status = %s, started_at = NULL, worker_instance = NULL, heartbeat_at = NULL
+        WHERE status = %s AND (worker_instance IS NULL OR heartbeat_at IS NULL
+                               OR heartbeat_at < NOW() - INTERVAL %s SECOND OR (%s AND worker_instance = %s))
+    """, (STATUS_QUEUED, STATUS_PROCESSING, int(VIDEO_JOB_HEARTBEAT_TIMEOUT), include_own, VIDEO_JOB_INSTANCE_ID))
+    count = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return count
+
+# 读取视频配置的 ROI 与抽帧间隔
+def get_video_settings(cursor, video_id: int):
+    cursor.execute("SELECT roi, sample_interval FROM videos WHERE id = %s", (video_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None, VIDEO_SAMPLE_INTERVAL
+    return RegionOfInterest.parse(row[0]), row[1] or VIDEO_SAMPLE_INTERVAL
+
+# 保存检查点（在流水线的写库线程中调用）
+def save_video_checkpoint(video_id: int, marker: CheckpointMarker):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE videos SET checkpoint_frame = %s, checkpoint_timestamp = %s, checkpoint_state = %s, checkpoint_at = NOW()
+        WHERE id = %s
+    """, (marker.frame_index, marker.timestamp, json.dumps(marker.state), video_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"视频 {video_id} 保存检查点：第 {marker.frame_index} 帧 ({format_timestamp(marker.timestamp)})")
+
+# 读取检查点，没有时返回 None
+def load_video_checkpoint(cursor, video_id: int) -> Optional[CheckpointMarker]:
+    cursor.execute("SELECT checkpoint_frame, checkpoint_timestamp, checkpoint_state FROM videos WHERE id = %s", (video_id,))
+    row = cursor.fetchone()
+    if not row or row[0] is None:
+        return None
+    return CheckpointMarker(row[0], row[1], json.loads(row[2]))
+
+def clear_video_checkpoint(cursor, video_id: int):
+    cursor.execute("""
+        UPDATE videos SET checkpoint_frame = NULL, checkpoint_timestamp = NULL, checkpoint_state = NULL, checkpoint_at = NULL
+        WHERE id = %s
+    """, (video_id,))
+
+# 删除检查点之后写入的结果：检查点时仍活跃的轨迹和之后新建的轨迹会在恢复后重新输出
+def discard_results_after_checkpoint(cursor, video_id: int, tracker: ShipTracker) -> int:
+    active_ids = tracker.active_ids()
+    conditions = "track_id >= %s" + (f" OR track_id IN ({','.join(['%s'] * len(active_ids))})" if active_ids else "")
+    cursor.execute(f"DELETE FROM results WHERE video_id = %s AND ({conditions})", (video_id, tracker.next_id, *active_ids))
+    return cursor.rowcount
+
+# 在 ROI 内检测，返回整帧坐标下的结果
+def detect_in_roi(frame, roi: Optional[RegionOfInterest]):
+    if roi is None:
+        return yolov8_detect_with_size(frame)
+    crop, offset = roi.crop(frame)
+    if crop.size == 0:
+        return [], None
+    # 多边形外的框在阈值筛选之前丢弃，不参与"高置信度优先"的选择
+    detections, input_size = yolov8_detect_with_size(
+        crop, dets_filter=lambda dets: roi.filter_raw(dets, offset, frame.shape))
+    return roi.restore(detections, offset, frame.shape), input_size
+
+# 裁剪图写入本地后上传图床，返回图片直链（上传失败时为 None）
+def upload_ship_region(region) -> Optional[str]:
+    region_path = f"output/frames/{uuid.uuid4().hex}.jpg"
+    os.makedirs(os.path.dirname(region_path), exist_ok=True)
+    cv2.imwrite(region_path, region)
+    return upload_to_lsky(region_path)
+
+# 视频时间格式化为 分:秒
+def format_timestamp(seconds: float) -> str:
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
+
+# 一条轨迹（一艘船的一次经过）的数据库记录
+def track_result_row(video_id: int, track: Track, ocr_results: dict, region_url: Optional[str]) -> dict:
+    return {
+        "video_id": video_id,
+        "ship_id": ocr_results['ship_id'],
+        "bbox": str(ocr_results['ship_id_bbox']),
+        "region_url": region_url,
+        "timestamp": format_timestamp(track.first_timestamp),
+        "category": track.category_id,
+        "confidence": round(track.max_confidence, 3),
+        "ocr_skip_reason": ocr_results.get('skip_reason'),
+        "track_id": track.track_id,
+        "first_timestamp": format_timestamp(track.first_timestamp),
+        "last_timestamp": format_timestamp(track.last_timestamp),
+        "hits": track.hits,
+        "ocr_votes": ocr_results.get('votes')
+    }
+
+# 场景变化门控：在解码线程中按顺序比较（ROI 内的）画面，静止帧只向下游传递帧号和时间戳
+def gate_frames(frames: Iterable, gate: MotionGate, roi: Optional[RegionOfInterest]):
+    for frame_index, timestamp, frame in frames:
+        region = frame if roi is None else roi.crop(frame)[0]
+        infer, _, _ = gate.check(region if region.size else frame, timestamp)
+        yield frame_index, timestamp, frame if infer else None
+
+# 按顺序编号的帧 (序号, 帧号, 时间戳, 帧)，经过场景门控时静止帧为 None
+def numbered_frames(frames: Iterable, motion_gate: Optional[MotionGate], roi: Optional[RegionOfInterest]):
+    if motion_gate is not None:
+        frames = gate_frames(frames, motion_gate, roi)
+    return ((seq,) + item for seq, item in enumerate(frames))
+
+# 检测 → 跟踪 阶段：输入 numbered_frames 的帧，输出结束的轨迹（以及检查点标记）
+def detect_track_stages(roi: Optional[RegionOfInterest], tracker: ShipTracker,
+                        checkpoint_interval: float = 0.0) -> List[PipelineStage]:
+    # 跟踪阶段只有一个线程，以下状态无需加锁
+    pending = {}  # 多个检测线程可能乱序完成，按序号重排后再交给跟踪器
+    next_seq = 0
+    last_detections = []  # 最近一次实际检测的结果，静止帧沿用
+    last_checkpoint = None  # 上一个检查点的视频时间
+
+    def detect(items, emit):
+        for seq, frame_index, timestamp, frame in items:
+            if frame is None:
+                # 画面与上一次检测时相比没有变化：由跟踪阶段沿用上一次的检测结果
+                emit((seq, frame_index, timestamp, None, None))
+                continue
+            # 只检测 ROI 外接矩形内的像素，积压时调度器会自动降低输入尺寸
+            yolov8_results, input_size = detect_in_roi(frame, roi)
+            print(f"帧 {frame_index} 检测到 {len(yolov8_results)} 个目标 (输入尺寸 {input_size})")
+            crops = []
+            for det in yolov8_results:
+                x1, y1, x2, y2 = det['bbox']
+                # 拷贝裁剪图，整帧不必等到下游处理完才释放
+                crops.append(frame[y1:y2, x1:x2].copy())
+            # 没有目标的帧也要交给跟踪器，离开画面的轨迹才能按时结束
+            emit((seq, frame_index, timestamp, yolov8_results, crops))
+
+    def track(items, emit):
+        nonlocal next_seq, last_detections, last_checkpoint
+        for item in items:
+            pending[item[0]] = item
+        while next_seq in pending:
+            _, frame_index, timestamp, detections, crops = pending.pop(next_seq)
+            next_seq += 1
+            if detections is None:
+                detections = last_detections
+            else:
+                last_detections = detections
+            for finished in tracker.update(frame_index, timestamp, detections, crops):
+                emit(finished)
+            if last_checkpoint is None:
+                last_checkpoint = timestamp
+            elif checkpoint_interval > 0 and timestamp - last_checkpoint >= checkpoint_interval:
+                # 本帧已经交给跟踪器，保存此时的跟踪器状态，随轨迹一起传给下游
+                last_checkpoint = timestamp
+                emit(CheckpointMarker(frame_index, timestamp, {"tracker": tracker.state()}))
+
+    def finish_tracks(emit):
+        for finished in tracker.finish():
+            emit(finished)
+
+    return [
+        PipelineStage("detect", detect, workers=VIDEO_PIPELINE_DETECT_WORKERS, queue_size=VIDEO_PIPELINE_QUEUE_SIZE),
+        PipelineStage("track", track, queue_size=VIDEO_PIPELINE_QUEUE_SIZE, batch_size=VIDEO_PIPELINE_QUEUE_SIZE,
+                      finish=finish_tracks),
+    ]
+
+# OCR → 上传图床 → 写库 阶段：输入结束的轨迹（以及检查点标记），每条轨迹写一条结果
+def output_stages(video_id: int, checkpoints: CheckpointWatermark) -> List[PipelineStage]:
+    cache_scope = f"video:{video_id}"
+    deferred = []  # OCR 阶段只有一个线程：按类别策略推迟的轨迹
+
+    def ocr(items, emit):
+        tracks = []
+        for item in items:
+            if isinstance(item, CheckpointMarker):
+                # 检查点之前的轨迹（包括推迟识别的）都要先输出，登记时的输出数量才是检查点之前的全部轨迹
+                ocr_tracks(tracks, emit)
+                tracks = []
+                flush_deferred(emit)
+                checkpoints.register(item)
+            else:
+                tracks.append(item)
+        ocr_tracks(tracks, emit)
+
+    def ocr_tracks(tracks: List[Track], emit):
+        # 只识别每条轨迹质量最高的几张裁剪图，队列中已到达的轨迹一起经过 OCR 门控后批量识别
+        if not tracks:
+            return
+        images = [crop[4] for t in tracks for crop in t.crops]
+        print(f"开始对 {len(tracks)} 条轨迹的 {len(images)} 张裁剪图进行 OCR")
+        results = ppocr_v4_gated(images, [t.category_id for t in tracks for _ in t.crops],
+                                 allow_defer=True, cache_scope=cache_scope)
+        offset = 0
+        for t in tracks:
+            track_results = results[offset:offset + len(t.crops)]
+            offset += len(t.crops)
+            if any(result is None for result in track_results):
+                # 按类别策略推迟的轨迹，整段视频处理完后再统一识别
+                if len(deferred) < OCR_DEFER_MAX:
+                    deferred.append(t)
+                    continue
+                track_results = [result or skipped_ocr_result(REASON_DEFER_OVERFLOW) for result in track_results]
+            emit_track(t, track_results, emit)
+
+    def flush_deferred(emit):
+        # 识别推迟的轨迹：视频处理完后，或者到达检查点时
+        if deferred:
+            print(f"视频 {video_id} 开始识别 {len(deferred)} 条推迟的轨迹")
+        for i in range(0, len(deferred), OCR_DEFER_BATCH):
+            chunk = deferred[i:i + OCR_DEFER_BATCH]
+            results = ppocr_v4_batch([crop[4] for t in chunk for crop in t.crops], cache_scope)
+            offset = 0
+            for t in chunk:
+                emit_track(t, results[offset:offset + len(t.crops)], emit)
+                offset += len(t.crops)
+        deferred.clear()
+
+    def emit_track(t: Track, track_results: List[dict], emit):
+        # 多张裁剪图的识别结果投票得到船号，上传投票胜出的那张裁剪图
+        if track_results:
+            ocr_results, best = vote_hull_number(track_results)
+            region = t.crops[best][4]
+        else:
+            ocr_results, region = skipped_ocr_result(REASON_NO_CROP), None
+        print(f"轨迹 {t.track_id} ({format_timestamp(t.first_timestamp)}-{format_timestamp(t.last_timestamp)}，"
+              f"{t.hits} 帧) 船牌号: {ocr_results['ship_id']}")
+        t.crops = []  # 其余裁剪图不再需要
+        emit((checkpoints.next_seq(), t, ocr_results, region))
+
+    def upload(items, emit):
+        for seq, t, ocr_results, region in items:
+            region_url = upload_ship_region(region) if region is not None else None
+            emit((seq, track_result_row(video_id, t, ocr_results, region_url)))
+
+    def persist(items, emit):
+        save_results_to_db([row for _, row in items])
+        checkpoints.done(seq for seq, _ in items)
+
+    return [
+        # 输入以轨迹为单位，每条轨迹带若干张裁剪图
+        PipelineStage("ocr", ocr, queue_size=VIDEO_PIPELINE_QUEUE_SIZE * 4, batch_size=VIDEO_PIPELINE_OCR_BATCH,
+                      finish=flush_deferred),
+        PipelineStage("upload", upload, workers=VIDEO_PIPELINE_UPLOAD_WORKERS, queue_size=VIDEO_PIPELINE_QUEUE_SIZE * 4),
+        PipelineStage("persist", persist, queue_size=VIDEO_PIPELINE_DB_BATCH * 2, batch_size=VIDEO_PIPELINE_DB_BATCH),
+    ]
+
+# 构建视频处理流水线：解码 → 检测 → 跟踪 → OCR → 上传图床 → 写库，各阶段并发执行
+def build_video_pipeline(video_id: int, frames: Iterable, roi: Optional[RegionOfInterest],
+                         cancel_event: Optional[threading.Event] = None,
+                         motion_gate: Optional[MotionGate] = None,
+                         tracker: Optional[ShipTracker] = None,
+                         checkpoint_interval: float = 0.0) -> Pipeline:
+    tracker = tracker if tracker is not None else create_ship_tracker()
+    # 每条输出的轨迹按顺序编号，检查点之前的轨迹全部写库后才提交检查点
+    checkpoints = CheckpointWatermark(lambda marker: save_video_checkpoint(video_id, marker))
+    stages = detect_track_stages(roi, tracker, checkpoint_interval) + output_stages(video_id, checkpoints)
+    pipeline = Pipeline(f"video-{video_id}", numbered_frames(frames, motion_gate, roi), stages, cancel_event=cancel_event)
+    if motion_gate is not None:
+        pipeline.add_stats("motion_gate", motion_gate.stats)
+    pipeline.add_stats("tracker", tracker.stats)
+    if checkpoint_interval > 0:
+        pipeline.add_stats("checkpoint", checkpoints.stats)
+    return pipeline
+
+# 长视频分段并行处理的帧号范围；设置为不分段、视频不够长或不是已在本地的完整文件时返回空列表
+def plan_video_segments(source: VideoSource) -> List[Tuple[int, Optional[int]]]:
+    if VIDEO_SEGMENT_WORKERS < 2 or source.local_path is None or source.frame_count <= 0:
+        return []
+    duration = source.frame_count / source.fps
+    parts = min(VIDEO_SEGMENT_WORKERS, int(duration // max(VIDEO_SEGMENT_MIN_SECONDS, 1.0)))
+    if parts < 2:
+        return []
+    return split_frame_range(source.frame_count, source.step, parts)
+
+# 在解码线程中打开分段，各段的解码器互不影响
+def segment_frames(source: VideoSource):
+    source.open()
+    try:
+        yield from source
+    finally:
+        source.close()
+
+# 构建分段并行处理的流水线：每段各自 解码 → 检测 → 跟踪 并发运行，
+# 各段的轨迹按时间顺序合并（跨越分段边界的船合并为一条）后再 OCR → 上传图床 → 写库
+def build_segmented_pipeline(video_id: int, video_path: str, segments: List[Tuple[int, Optional[int]]], fps: float,
+                             sample_interval: float, roi: Optional[RegionOfInterest],
+                             cancel_event: Optional[threading.Event], tracker: ShipTracker,
+                             motion_gates: List[MotionGate]) -> Tuple[Pipeline, PipelineGroup]:
+    merger = SegmentTrackMerger(tracker)
+    segment_tracks = []
+    segment_pipelines = []
+    for index, (start_frame, end_frame) in enumerate(segments):
+        source = VideoSource(video_path, sample_interval, cancel_event=cancel_event,
+                             start_frame=start_frame, end_frame=end_frame)
+        motion_gate = create_motion_gate()
+        segment_tracker = merger.segment_tracker()
+        tracks = []
+        stages = detect_track_stages(roi, segment_tracker) + [
+            PipelineStage("collect", lambda items, emit, tracks=tracks: tracks.extend(items),
+                          queue_size=VIDEO_PIPELINE_QUEUE_SIZE, batch_size=VIDEO_PIPELINE_QUEUE_SIZE),
+        ]
+        segment_pipeline = Pipeline(f"video-{video_id}-segment-{index + 1}",
+                                    numbered_frames(segment_frames(source), motion_gate, roi), stages,
+                                    cancel_event=cancel_event)
+        segment_pipeline.add_stats("source", source.stats)
+        segment_pipeline.add_stats("motion_gate", motion_gate.stats)
+        segment_pipeline.add_stats("tracker", segment_tracker.stats)
+        video_pipelines.add(segment_pipeline)
+        motion_gates.append(motion_gate)
+        segment_tracks.append(tracks)
+        segment_pipelines.append(segment_pipeline)
+    group = PipelineGroup(segment_pipelines)
+
+    def merged_tracks():
+        # 作为下面 output_pipeline 的数据源，在它的解码线程中运行；它出错或被取消时不再等待各段
+        group.start()
+        for index, (start_frame, end_frame) in enumerate(segments):
+            while not group.wait(index, timeout=0.5):
+                if output_pipeline.stopped:
+                    return
+            print(f"视频 {video_id} 第 {index + 1}/{len(segments)} 段完成，{len(segment_tracks[index])} 条轨迹")
+            # 最后一段读到视频结尾，没有固定的结束时间
+            end_timestamp = end_frame / fps if end_frame is not None else math.inf
+            yield from merger.add_segment(segment_tracks[index], start_frame / fps, end_timestamp)
+            segment_tracks[index].clear()
+        yield from merger.finish()
+
+    # 分段处理不保存检查点
+    checkpoints = CheckpointWatermark(lambda marker: None)
+    output_pipeline = Pipeline(f"video-{video_id}", merged_tracks(), output_stages(video_id, checkpoints),
+                               source_name="segments", cancel_event=cancel_event)
+    output_pipeline.add_stats("segments", merger.stats)
+    return output_pipeline, group
+
 # 保存处理结果到数据库
-async def process_video(video_id: int, video_url: str):
+async def process_video(video_id: int, video_url: str, cancel_event: Optional[threading.Event] = None):
     conn = get_db_connection()
     cursor = conn.cursor()
+    source = None
+    segment_group = None
+    motion_gate = create_motion_gate()
+    motion_gates = [motion_gate]
+    tracker = create_ship_tracker()
 
     try:
+        roi, sample_interval = get_video_settings(cursor, video_id)
+        if roi is not None:
+            print(f"视频 {video_id} 使用 ROI: {roi.to_list()}")
+
         # 更新视频状态为处理中
         cursor.execute("UPDATE videos SET status = %s WHERE id = %s", (STATUS_PROCESSING, video_id))
         print(f"视频 {video_id} 状态更新为【处理中】")
+
+        # 有检查点时从检查点之后的帧继续，跟踪器还原到检查点时的状态；
+        # 上次运行在检查点之后写入的结果会重新输出，先删除（没有检查点时删除上次运行的全部结果）
+        checkpoint = load_video_checkpoint(cursor, video_id)
+        start_frame = 0
+        if checkpoint is not None:
+            tracker.load_state(checkpoint.state["tracker"])
+            start_frame = checkpoint.frame_index + 1
+            print(f"视频 {video_id} 从检查点恢复：第 {checkpoint.frame_index} 帧 ({format_timestamp(checkpoint.timestamp)})，"
+                  f"{len(tracker.active_ids())} 条活跃轨迹")
+        discarded = discard_results_after_checkpoint(cursor, video_id, tracker)
+        if discarded:
+            print(f"视频 {video_id} 删除上次运行未完成部分的 {discarded} 条结果")
         conn.commit()
 
-        # 下载或读取视频
-        if video_url.startswith("http"):
-            video_path = tempfile.mktemp(suffix=".mp4")
-            with open(video_path, 'wb') as f:
-                f.write(requests.get(video_url).content)
-        else:
-            video_path = video_url
+        # 打开视频：远程视频按 VIDEO_URL_MODE 流式下载到磁盘、边下载边解码或由解码后端直接打开
+        # 只解码需要的帧：间隔短时 grab 跳过其余帧，间隔长时直接按帧号跳转
+        source = VideoSource(video_url, sample_interval, cancel_event=cancel_event, start_frame=start_frame)
+        source.open()
 
-        if not os.path.exists(video_path):
-            raise FileNotFoundError(f"视频文件不存在: {video_path}")
+        if cancel_event is not None and cancel_event.is_set():
+            raise PipelineCancelled(f"video-{video_id}")
 
         # 清空输出帧目录
         shutil.rmtree("output/frames", ignore_errors=True)
 
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if not fps or fps == 0:
-            fps = 30  # 默认帧率
-            print(f"视频 {video_id} FPS 获取失败，使用默认值: {fps}")
-
-        frame_interval = int(fps * 3)  # 每3秒抽一帧
-        print(f"视频 {video_id} FPS: {fps}，每 {frame_interval} 帧抽一帧")
+        print(f"视频 {video_id} {source.describe()}")
 
-        frame_index = 0
+        # 足够长的本地视频（含下载完成的）切成若干段并行处理；从检查点恢复时不分段
+        segments = plan_video_segments(source) if checkpoint is None else []
+        if segments:
+            print(f"视频 {video_id} 分 {len(segments)} 段并行处理: " +
+                  "，".join(f"{format_timestamp(start / source.fps)}-{format_timestamp(end / source.fps)}"
+                           for start, end in segments))
+            # 各段重新打开视频文件，整段视频的解码器不再需要（下载的临时文件保留到任务结束）
+            source.release()
+            motion_gates = []
+            pipeline, segment_group = build_segmented_pipeline(video_id, source.local_path, segments, source.fps,
+                                                               sample_interval, roi, cancel_event, tracker, motion_gates)
+        else:
+            # 解码线程与检测、OCR、上传、写库各阶段并发执行，阶段之间用有界队列做背压
+            pipeline = build_video_pipeline(video_id, source, roi, cancel_event, motion_gate, tracker,
+                                            VIDEO_CHECKPOINT_INTERVAL)
+        video_pipelines.add(pipeline)
         print(f"视频 {video_id} 开始抽帧处理")
+        stats = pipeline.run()
+        if segment_group is None:
+            sampling = source.stats()
+        else:
+            sampling = [segment_pipeline.stats()["source"] for segment_pipeline in segment_group.pipelines]
+        print(f"视频 {video_id} 处理完成，抽帧: {sampling}，流水线: {stats['stages']}，"
+              f"场景门控: {[gate.stats() for gate in motion_gates]}，跟踪: {stats.get('segments') or stats.get('tracker')}")
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                print(f"视频 {video_id} 处理完成")
-                break
+        # 更新视频状态为完成，检查点不再需要
+        cursor.execute("UPDATE videos SET status = %s, finished_at = NOW() WHERE id = %s", (STATUS_COMPLETED, video_id))
+        clear_video_checkpoint(cursor, video_id)
+        conn.commit()
 
-            if frame_index % frame_interval != 0:
-                frame_index += 1
-                continue
+    except Exception as e:
+        # 取消时下载/解码可能以其他异常结束，以取消信号为准
+        if isinstance(e, PipelineCancelled) or (cancel_event is not None and cancel_event.is_set()):
+            print(f"视频 {video_id} 已取消")
+            status = STATUS_CANCELLED
+        else:
+            print(f"视频 {video_id} 处理失败，错误：{str(e)}")
+            status = STATUS_FAILED
+        cursor.execute("UPDATE videos SET status = %s, finished_at = NOW() WHERE id = %s", (status, video_id))
+        conn.commit()
 
-            timestamp = frame_index / fps
-            timestamp_str = f"{int(timestamp // 60):02d}:{int(timestamp % 60):02d}"
+    finally:
+        if segment_group is not None:
+            segment_group.stop()
+        if source is not None:
+            source.close()
+        motion_stats = [gate.stats() for gate in motion_gates]
+        cursor.execute("UPDATE videos SET frames_inferred = %s, frames_skipped = %s WHERE id = %s",
+                       (sum(item["inferred"] for item in motion_stats), sum(item["skipped"] for item in motion_stats),
+                        video_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
 
-            yolov8_results = yolov8_detect(frame)  # 模拟检测
-            print(f"帧 {frame_index} 检测到 {len(yolov8_results)} 个目标")
 
-            for det in yolov8_results:
-                x1, y1, x2, y2 = det['bbox']
-                region = frame[y1:y2, x1:x2]
-                region_path = f"output/frames/{uuid.uuid4().hex}.jpg"
-                os.makedirs(os.path.dirname(region_path), exist_ok=True)
-                cv2.imwrite(region_path, region)
-
-                print(f"开始对帧 {frame_index} 的目标进行 OCR")
-                ocr_results = ppocr_v4(region_path)
-                ship_id = ocr_results['ship_id']
-                ship_id_bbox = ocr_results['ship_id_bbox']
-
-                # 上传图床
-                ship_id_url = upload_to_lsky(region_path)
-
-                # 保存数据库
-                save_result_to_db(
-                    video_id=video_id,
-                    ship_id=ship_id,
-                    bbox=str(ship_id_bbox),
-                    region_url=ship_id_url,
-                    timestamp=timestamp_str,
-                    category=det['category_id'],
-                    confidence=det['confidence']
-                )
-
-                print(f"帧 {frame_index} OCR 完成，识别到船牌号: {ship_id}")
-
-            frame_index += 1
-
-        # 更新视频状态为完成
-        cursor.execute("UPDATE videos SET status = %s WHERE id = %s", (STATUS_COMPLETED, video_id))
-        conn.commit()
+# 新增：将 process_video 包装成一个普通的同步函数
+def run_process_video(video_id, video_url, cancel_event: Optional[threading.Event] = None):
+    asyncio.run(process_video(video_id, video_url, cancel_event))
 
-    except Exception as e:
-        print(f"视频 {video_id} 处理失败，错误：{str(e)}")
-        cursor.execute("UPDATE videos SET status = %s WHERE id = %s", (STATUS_FAILED, video_id))
+# 刷新本实例正在处理的任务的心跳，并重新排队其他实例失联后留下的任务
+def heartbeat_video_jobs(video_ids: List[int]):
+    if video_ids:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE videos SET heartbeat_at = NOW()
+            WHERE worker_instance = %s AND status = %s AND id IN ({','.join(['%s'] * len(video_ids))})
+        """, (VIDEO_JOB_INSTANCE_ID, STATUS_PROCESSING, *video_ids))
         conn.commit()
+        cursor.close()
+        conn.close()
+    if VIDEO_JOB_REQUEUE_INTERRUPTED:
+        count = requeue_interrupted_jobs(include_own=False)
+        if count:
+            print(f"{count} 个失联实例上的视频任务已重新排队")
+            video_jobs.notify()
 
+# 视频任务调度器：固定数量的工作线程从 videos 表中按优先级领取排队任务
+video_jobs = JobScheduler(claim_next_video_job, run_process_video, workers=VIDEO_JOB_WORKERS,
+                          poll_interval=VIDEO_JOB_POLL_INTERVAL, name="video",
+                          heartbeat_fn=heartbeat_video_jobs, heartbeat_interval=VIDEO_JOB_HEARTBEAT_INTERVAL)
+
+# 服务启动后调用：重新排队被中断的任务，启动工作线程
+def start_video_jobs():
+    if VIDEO_JOB_REQUEUE_INTERRUPTED:
+        count = requeue_interrupted_jobs()
+        if count:
+            print(f"{count} 个被中断的视频任务已重新排队")
+    video_jobs.start()
+
+def stop_video_jobs():
+    video_jobs.stop()
+
+# 插入一条排队中的视频任务并唤醒工作线程，返回 (video_id, 队列位置)
+def enqueue_video(video_name: str, video_url: str, roi: Optional[RegionOfInterest],
+                  sample_interval: Optional[float], priority: int, content_hash: Optional[str] = None):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO videos (video_name, video_url, roi, sample_interval, priority, status, content_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (video_name, video_url, roi.to_json() if roi else None, sample_interval, priority, STATUS_QUEUED,
+              content_hash))
+        conn.commit()
+        video_id = cursor.lastrowid
+        position = get_queue_positions(cursor).get(video_id)
     finally:
         cursor.close()
         conn.close()
 
+    video_jobs.notify()
+    return video_id, position
 
-# 新增：将 process_video 包装成一个普通的同步函数
-def run_process_video(video_id, video_url):
-    asyncio.run(process_video(video_id, video_url))
+# 队列已满时拒绝新任务
+def check_queue_capacity_or_429():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    queued = count_queued_jobs(cursor)
+    cursor.close()
+    conn.close()
+    if queued >= VIDEO_JOB_QUEUE_MAX:
+        raise HTTPException(status_code=429, detail=f"Video job queue is full ({queued} queued)")
 
 # 定义请求的 schema
 class Video(BaseModel):
     video_name: str
     video_url: str
+    roi: Optional[List[List[float]]] = None
+    sample_interval: Optional[float] = None
+    priority: int = 0
 
 class VideoResponse(BaseModel):
     id: int
@@ -195,47 +727,78 @@ class VideoResponse(BaseModel):
     video_url: str
     status: str
     created_at: str
+    roi: Optional[List[List[float]]] = None
+    sample_interval: Optional[float] = None
+    priority: int = 0
+    queue_position: Optional[int] = None
+    content_hash: Optional[str] = None
 
-# 初始化数据库
-init_db()
+class VideoROI(BaseModel):
+    roi: Optional[List[List[float]]] = None
 
-# 视频添加接口
-@router.post("/add_video", response_model=VideoResponse)
-async def add_video(video: Video):
+class VideoPriority(BaseModel):
+    priority: int
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+class VideoJobStatus(BaseModel):
+    id: int
+    status: str
+    priority: int
+    queue_position: Optional[int] = None
+    queued_total: int
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    frames_inferred: Optional[int] = None
+    frames_skipped: Optional[int] = None
+    checkpoint_frame: Optional[int] = None
+    checkpoint_timestamp: Optional[float] = None
+    checkpoint_at: Optional[str] = None
+    worker_instance: Optional[str] = None
+    heartbeat_at: Optional[str] = None
 
-    # 插入视频数据
-    cursor.execute("INSERT INTO videos (video_name, video_url) VALUES (%s, %s)", 
-                  (video.video_name, video.video_url))
-    conn.commit()
+def parse_roi_or_400(value) -> Optional[RegionOfInterest]:
+    try:
+        return RegionOfInterest.parse(value)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid ROI: {e}")
 
-    # 获取刚插入的 video_id
-    video_id = cursor.lastrowid
+def check_sample_interval_or_400(value: Optional[float]) -> Optional[float]:
+    if value is not None and not value > 0:
+        raise HTTPException(status_code=400, detail="sample_interval must be positive")
+    return value
 
-    cursor.close()
-    conn.close()
+# 视频添加接口
+@router.post("/add_video", response_model=VideoResponse)
+async def add_video(video: Video):
+    roi = parse_roi_or_400(video.roi)
+    sample_interval = check_sample_interval_or_400(video.sample_interval)
+    check_queue_capacity_or_429()
 
-    # 异步模拟视频处理
-    print(f"开始处理视频: {video_id} ({video.video_url})")
-    thread = threading.Thread(target=run_process_video, args=(video_id, video.video_url))
-    thread.start()
+    # 插入排队中的视频任务，由任务调度器的工作线程按优先级处理
+    video_id, position = enqueue_video(video.video_name, video.video_url, roi, sample_interval, video.priority)
+    print(f"视频 {video_id} 已加入队列 ({video.video_url})，位置 {position}")
 
     return {
         "id": video_id,
         "video_name": video.video_name,
         "video_url": video.video_url,
-        "status": "处理中",
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "status": status_to_text(STATUS_QUEUED),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "roi": roi.to_list() if roi else None,
+        "sample_interval": sample_interval,
+        "priority": video.priority,
+        "queue_position": position
     }
 
 @router.post("/upload_video", response_model=VideoResponse)
-async def upload_video(file: UploadFile = File(...), video_name: str = Form(...)):
-    # 创建存储目录
-    save_dir = "output/videos"
-    # 生成绝对路径
-    save_dir = os.path.abspath(save_dir)
+async def upload_video(file: UploadFile = File(...), video_name: str = Form(...),
+                       roi: Optional[str] = Form(None, description="ROI 多边形 JSON，如 [[x,y],...]"),
+                       sample_interval: Optional[float] = Form(None, description="抽帧间隔（秒），默认 VIDEO_SAMPLE_INTERVAL"),
+                       priority: int = Form(0, description="优先级，越大越先处理")):
+    roi = parse_roi_or_400(roi)
+    sample_interval = check_sample_interval_or_400(sample_interval)
+    check_queue_capacity_or_429()
+    # 存储目录（绝对路径）
+    save_dir = UPLOAD_DIR
     # 检查目录是否存在，不存在则创建
     if not os.path.exists(save_dir):
         os.makedirs(save_dir, exist_ok=True)
@@ -245,37 +808,134 @@ async def upload_video(file: UploadFile = File(...), video_name: str = Form(...)
     filename = f"{video_name}_{timestamp}.mp4"
     save_path = os.path.join(save_dir, filename)
 
-    # 保存文件到本地
-    with open(save_path, "wb") as buffer:
-        buffer.write(await file.read())
+    # 从上传的临时文件分块复制到本地，同时计算内容哈希，内存中只保留一个分块
+    upload = create_upload_copy(file, save_path)
+    try:
+        await asyncio.to_thread(upload.run)
+    except GrowingFileError as e:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise HTTPException(status_code=413 if isinstance(e, FileTooLargeError) else 400, detail=str(e))
+    print(f"视频 {video_name} 上传完成: {upload.stats()}")
+
+    # 数据库只记录文件名，领取任务时还原为 UPLOAD_DIR 下的绝对路径
+    video_id, position = enqueue_video(video_name, filename, roi, sample_interval, priority, upload.hexdigest)
+    print(f"视频 {video_id} 已加入队列 ({save_path})，位置 {position}")
 
-    # 数据库记录
+    return {
+        "id": video_id,
+        "video_name": video_name,
+        "video_url": save_path,
+        "status": status_to_text(STATUS_QUEUED),
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "roi": roi.to_list() if roi else None,
+        "sample_interval": sample_interval,
+        "priority": priority,
+        "queue_position": position,
+        "content_hash": upload.hexdigest
+    }
+
+# 设置/清除视频的感兴趣区域，对之后的处理生效
+@router.put("/set_roi/{video_id}")
+async def set_video_roi(video_id: int, data: VideoROI):
+    roi = parse_roi_or_400(data.roi)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM videos WHERE id = %s", (video_id,))
+    if cursor.fetchone() is None:
+        cursor.close()
+        conn.close()
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    cursor.execute("UPDATE videos SET roi = %s WHERE id = %s", (roi.to_json() if roi else None, video_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    return {"id": video_id, "roi": roi.to_list() if roi else None}
+
+# 调整排队任务的优先级，只对排队中的任务有效
+@router.put("/set_priority/{video_id}")
+async def set_video_priority(video_id: int, data: VideoPriority):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE videos SET priority = %s WHERE id = %s AND status = %s",
+                   (data.priority, video_id, STATUS_QUEUED))
+    conn.commit()
+    # 优先级不变时受影响行数为 0，以更新后的状态判断
+    cursor.execute("SELECT status FROM videos WHERE id = %s", (video_id,))
+    row = cursor.fetchone()
+    updated = row is not None and row[0] == STATUS_QUEUED
+    position = get_queue_positions(cursor).get(video_id) if updated else None
+    cursor.close()
+    conn.close()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not updated:
+        raise HTTPException(status_code=409, detail=f"Only queued videos can be reprioritized: {status_to_text(row[0])}")
+    return {"id": video_id, "priority": data.priority, "queue_position": position}
+
+# 取消任务：排队中的直接标记为已取消，处理中的通知流水线停止
+@router.post("/cancel/{video_id}")
+async def cancel_video(video_id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
-    relative_path = save_path
-    cursor.execute("INSERT INTO videos (video_name, video_url) VALUES (%s, %s)", 
-                  (video_name, filename))
+    cursor.execute("UPDATE videos SET status = %s, finished_at = NOW() WHERE id = %s AND status = %s",
+                   (STATUS_CANCELLED, video_id, STATUS_QUEUED))
     conn.commit()
-    video_id = cursor.lastrowid
+    cancelled = cursor.rowcount == 1
+    cursor.execute("SELECT status FROM videos WHERE id = %s", (video_id,))
+    row = cursor.fetchone()
     cursor.close()
     conn.close()
 
-    # 异步处理
-    print(f"开始处理视频: {video_name} ({relative_path})")
-    thread = threading.Thread(target=run_process_video, args=(video_id, relative_path))
-    thread.start()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if cancelled:
+        return {"id": video_id, "status": status_to_text(STATUS_CANCELLED)}
+    if row[0] == STATUS_PROCESSING:
+        if not video_jobs.cancel(video_id):
+            raise HTTPException(status_code=409, detail="Video is not being processed by this server")
+        return {"id": video_id, "status": "取消中"}
+    raise HTTPException(status_code=409, detail=f"Video already finished: {status_to_text(row[0])}")
 
+# 重新排队失败或已取消的任务，有检查点时从检查点继续处理
+@router.post("/resume/{video_id}")
+async def resume_video(video_id: int):
+    check_queue_capacity_or_429()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE videos SET status = %s, started_at = NULL, finished_at = NULL WHERE id = %s AND status IN (%s, %s)",
+                   (STATUS_QUEUED, video_id, STATUS_FAILED, STATUS_CANCELLED))
+    conn.commit()
+    resumed = cursor.rowcount == 1
+    cursor.execute("SELECT status, checkpoint_frame, checkpoint_timestamp FROM videos WHERE id = %s", (video_id,))
+    row = cursor.fetchone()
+    position = get_queue_positions(cursor).get(video_id) if resumed else None
+    cursor.close()
+    conn.close()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not resumed:
+        raise HTTPException(status_code=409, detail=f"Only failed or cancelled videos can be resumed: {status_to_text(row[0])}")
+    video_jobs.notify()
     return {
         "id": video_id,
-        "video_name": video_name,
-        "video_url": relative_path,
-        "status": "处理中",
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "status": status_to_text(STATUS_QUEUED),
+        "queue_position": position,
+        "checkpoint_frame": row[1],
+        "checkpoint_timestamp": row[2]
     }
 
 # 视频删除接口
 @router.delete("/delete_video/{video_id}")
 async def delete_video(video_id: int):
+    # 正在处理的视频先停止流水线
+    video_jobs.cancel(video_id)
+
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -295,17 +955,24 @@ async def get_all_videos():
     cursor = conn.cursor()
 
     # 查询所有视频
-    cursor.execute("SELECT id, video_name, video_url, status, created_at FROM videos")
+    cursor.execute("SELECT id, video_name, video_url, status, created_at, roi, sample_interval, priority, content_hash FROM videos")
     rows = cursor.fetchall()
+    positions = get_queue_positions(cursor)
 
     videos = []
     for row in rows:
+        roi = RegionOfInterest.parse(row[5])
         videos.append({
             "id": row[0],
             "video_name": row[1],
             "video_url": row[2],
             "status": status_to_text(row[3]),
-            "created_at": row[4].strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": row[4].strftime("%Y-%m-%d %H:%M:%S"),
+            "roi": roi.to_list() if roi else None,
+            "sample_interval": row[6],
+            "priority": row[7],
+            "queue_position": positions.get(row[0]),
+            "content_hash": row[8]
         })
 
     cursor.close()
@@ -328,4 +995,48 @@ async def get_video_ids():
     cursor.close()
     conn.close()
 
-    return video_ids
\ No newline at end of file
+    return video_ids
+
+# 单个视频任务的状态与队列位置
+@router.get("/status/{video_id}", response_model=VideoJobStatus)
+async def get_video_status(video_id: int):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT status, priority, started_at, finished_at, frames_inferred, frames_skipped,
+               checkpoint_frame, checkpoint_timestamp, checkpoint_at, worker_instance, heartbeat_at
+        FROM videos WHERE id = %s
+    """, (video_id,))
+    row = cursor.fetchone()
+    positions = get_queue_positions(cursor)
+    cursor.close()
+    conn.close()
+
+    if row is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return {
+        "id": video_id,
+        "status": status_to_text(row[0]),
+        "priority": row[1],
+        "queue_position": positions.get(video_id),
+        "queued_total": len(positions),
+        "started_at": row[2].strftime("%Y-%m-%d %H:%M:%S") if row[2] else None,
+        "finished_at": row[3].strftime("%Y-%m-%d %H:%M:%S") if row[3] else None,
+        "frames_inferred": row[4],
+        "frames_skipped": row[5],
+        "checkpoint_frame": row[6],
+        "checkpoint_timestamp": row[7],
+        "checkpoint_at": row[8].strftime("%Y-%m-%d %H:%M:%S") if row[8] else None,
+        "worker_instance": row[9],
+        "heartbeat_at": row[10].strftime("%Y-%m-%d %H:%M:%S") if row[10] else None
+    }
+
+# 任务调度器的工作线程与正在执行的任务
+@router.get("/job_stats")
+async def job_stats():
+    return video_jobs.stats()
+
+@router.get("/pipeline_stats")
+async def pipeline_stats():
+    """正在运行和最近完成的视频处理流水线：各阶段吞吐、利用率、队列深度与阻塞时间"""
+    return video_pipelines.stats()
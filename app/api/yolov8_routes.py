@@ -1,25 +1,31 @@
+import asyncio
 import cv2
 from fastapi import APIRouter, UploadFile, File, Form
 from io import BytesIO
 from PIL import Image
 import numpy as np
 import random
-from typing import List, Dict, Union
+from typing import Callable, List, Dict, Optional, Tuple, Union
 import os
-from app.models.yolov8_model import YOLOv8Model
+import threading
+import time
+from dotenv import load_dotenv
+from app.models.yolov8_model import YOLOv8Model, CATEGORY_NAMES, select_detections
+from app.models.model_factory import create_yolov8_model
+from app.utils.batch_scheduler import MicroBatchScheduler
+from app.utils.adaptive_resolution import ResolutionPolicy, parse_int_list
+from app.utils.worker_pool import get_worker_pool
 
 # router = APIRouter()
+load_dotenv()
 
-# 模型路径配置
-weights_path = "E:/Graduate_Design/ShipDetect-Backend/resources/models/yolov8_m_50.pdparams"
-config_path = "E:/Graduate_Design/ShipDetect-Backend/configs/default_config.yaml"
-
-model = YOLOv8Model(
-    weights_path=weights_path,
-    config_path=config_path,
-    use_gpu=True,
-    threshold=0.3
-)
+# 模型路径与推理后端配置见 app/models/model_factory.py（YOLOV8_BACKEND 等环境变量）
+# 启用多进程推理池（INFER_WORKERS > 0）时模型只在子进程中加载
+# 模型在服务启动时由 init_yolov8 加载（见 app/services/startup.py），导入本模块不会加载模型
+worker_pool = None
+model = None
+detect_scheduler: Optional[MicroBatchScheduler] = None
+_init_lock = threading.Lock()
 
 # @router.post("/predict")
 # async def predict(img_path: str = Form(..., description="The path to the image for object detection.")):
@@ -57,6 +63,145 @@ def simulate_yolov8_detect(frame):
         })
     return results
 
+def _parse_class_thresholds(value: str) -> Dict[int, float]:
+    """解析形如 "5:0.4,6:0.35" 的按类别阈值（类别ID与 CATEGORY_MAP 一致，从1开始）"""
+    thresholds = {}
+    for item in value.split(","):
+        if ":" in item:
+            category_id, thr = item.split(":", 1)
+            thresholds[int(category_id) - 1] = float(thr)
+    return thresholds
+
+# 检测筛选阈值
+DETECT_SCORE_THRESHOLD = float(os.getenv("DETECT_SCORE_THRESHOLD", 0.3))
+DETECT_HIGH_THRESHOLD = float(os.getenv("DETECT_HIGH_THRESHOLD", 0.5))
+DETECT_CLASS_THRESHOLDS = _parse_class_thresholds(os.getenv("DETECT_CLASS_THRESHOLDS", ""))
+
+def _select_detections(dets: np.ndarray) -> List[Dict]:
+    """按置信度筛选 [N, 6] 检测数组，只把最终选中的框转换为与 simulate_yolov8_detect 相同的字段"""
+    selected = select_detections(
+        dets,
+        score_threshold=DETECT_SCORE_THRESHOLD,
+        high_threshold=DETECT_HIGH_THRESHOLD,
+        class_thresholds=DETECT_CLASS_THRESHOLDS
+    )
+    class_ids = selected[:, 0].astype(np.int64).tolist()
+    scores = np.round(selected[:, 1].astype(np.float64), 2).tolist()
+    boxes = selected[:, 2:6].astype(np.int64).tolist()
+    return [
+        {
+            "bbox": box,
+            "confidence": score,
+            "category_id": class_id + 1,  # 模型的 category_id 从0开始，+1 以匹配 CATEGORY_MAP
+            "category": CATEGORY_NAMES.get(class_id, f"unknown_{class_id}"),
+        }
+        for class_id, score, box in zip(class_ids, scores, boxes)
+    ]
+
+def _to_bgr_array(frame: Union[str, np.ndarray, Image.Image]) -> np.ndarray:
+    if isinstance(frame, str):
+        image = cv2.imread(frame)  # 直接传入文件路径进行预测
+        if image is None:
+            raise FileNotFoundError(f"Image path {frame} does not exist or cannot be decoded.")
+        return image
+    if isinstance(frame, np.ndarray):
+        return frame
+    if isinstance(frame, Image.Image):
+        return cv2.cvtColor(np.asarray(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
+    raise ValueError("Unsupported image type.")
+
+# 按负载自适应输入尺寸：队列变深或请求带有延迟预算时降低分辨率
+DETECT_ADAPTIVE_RESOLUTION = os.getenv("DETECT_ADAPTIVE_RESOLUTION", "false").lower() in ("1", "true", "yes")
+resolution_policy = ResolutionPolicy(
+    sizes=parse_int_list(os.getenv("DETECT_INPUT_SIZES", "640,480,320")),
+    depth_thresholds=parse_int_list(os.getenv("DETECT_ADAPTIVE_DEPTHS", "4,12")),
+)
+
+def _detect_batch(items: List[tuple]) -> List[tuple]:
+    """
+    调度器的批处理函数，items 为 (图像, 延迟预算ms) 列表，返回 (检测数组, 输入尺寸) 列表
+    """
+    frames = [item[0] for item in items]
+    budgets = [item[1] for item in items if item[1]]
+    input_size = resolution_policy.choose(
+        queue_depth=detect_scheduler.queue_depth(),
+        latency_budget_ms=min(budgets) if budgets else None,
+        adaptive=DETECT_ADAPTIVE_RESOLUTION
+    )
+
+    # 只做最低阈值的预筛选，返回原始数组，最终筛选在 _select_detections 中完成
+    min_threshold = min([DETECT_SCORE_THRESHOLD, *DETECT_CLASS_THRESHOLDS.values()])
+    start = time.perf_counter()
+    if worker_pool is not None:
+        dets, input_size = worker_pool.detect_batch(frames, min_threshold, input_size).result()
+    else:
+        dets = model.predict_arrays_raw(frames, threshold=min_threshold, input_size=input_size)
+        input_size = model.effective_input_size(input_size)
+    resolution_policy.observe(input_size, (time.perf_counter() - start) * 1000)
+    return [(d, input_size) for d in dets]
+
+def init_yolov8():
+    """
+    加载检测模型并启动微批调度器，重复调用无副作用
+
+    服务启动时由 lifespan 调用；脚本中直接调用 yolov8_detect 时会在第一次检测时自动加载。
+    """
+    global worker_pool, model, detect_scheduler
+    with _init_lock:
+        if detect_scheduler is not None:
+            return
+        worker_pool = get_worker_pool()
+        if worker_pool is None:
+            model = create_yolov8_model(threshold=0.3)
+
+        # 微批调度：所有接口和后台视频任务的检测请求在这里合并成批次
+        # 使用推理池时每个进程各有一个批次在途
+        scheduler = MicroBatchScheduler(
+            batch_fn=_detect_batch,
+            max_batch_size=int(os.getenv("DETECT_MAX_BATCH_SIZE", os.getenv("YOLOV8_BATCH_SIZE", 8))),
+            max_wait_ms=float(os.getenv("DETECT_MAX_WAIT_MS", 10)),
+            num_workers=worker_pool.num_workers if worker_pool is not None else 1,
+            name="yolov8",
+        )
+        scheduler.start()
+        detect_scheduler = scheduler
+
+def shutdown_yolov8():
+    """停止微批调度器（推理进程池由 startup 统一关闭）"""
+    global detect_scheduler
+    with _init_lock:
+        if detect_scheduler is not None:
+            detect_scheduler.stop(timeout=5)
+            detect_scheduler = None
+
+def _get_scheduler() -> MicroBatchScheduler:
+    if detect_scheduler is None:
+        init_yolov8()
+    return detect_scheduler
+
+def warmup_yolov8(image: Optional[np.ndarray] = None, iterations: int = 1) -> List[int]:
+    """
+    预热检测模型：对每个可能用到的输入尺寸各推理 iterations 次，使首个真实请求不再承担算子编译/缓存的开销
+
+    绕过调度器直接推理，不计入自适应分辨率的耗时统计。使用推理池时每轮向每个进程各发一批。
+
+    Returns:
+        List[int]: 已预热的输入尺寸
+    """
+    init_yolov8()
+    frame = image if image is not None else np.zeros((640, 640, 3), dtype=np.uint8)
+    sizes = resolution_policy.sizes if DETECT_ADAPTIVE_RESOLUTION else [resolution_policy.max_size]
+    for size in sizes:
+        for _ in range(iterations):
+            if worker_pool is not None:
+                futures = [worker_pool.detect_batch([frame], DETECT_SCORE_THRESHOLD, size)
+                           for _ in range(worker_pool.num_workers)]
+                for future in futures:
+                    future.result()
+            else:
+                model.predict_arrays_raw([frame], threshold=DETECT_SCORE_THRESHOLD, input_size=size)
+    return sizes
+
 def yolov8_detect(frame: Union[str, np.ndarray, Image.Image]) -> List[Dict]:
     """
     调用 YOLOv8 进行检测，并统一返回与 simulate_yolov8_detect 相同格式的结果。
@@ -67,45 +212,56 @@ def yolov8_detect(frame: Union[str, np.ndarray, Image.Image]) -> List[Dict]:
     - category_id: int
     - category: str
     """
+    detections, _ = yolov8_detect_with_size(frame)
+    return detections
+
+def yolov8_detect_with_size(
+    frame: Union[str, np.ndarray, Image.Image],
+    latency_budget_ms: Optional[float] = None,
+    dets_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None
+) -> Tuple[List[Dict], int]:
+    """
+    与 yolov8_detect 相同，额外返回本次推理实际使用的输入尺寸
+
+    Args:
+        frame: 图片路径、BGR 数组或 PIL 图像
+        latency_budget_ms (float, optional): 本次请求的延迟预算，超出时自动降低输入尺寸
+        dets_filter (Callable, optional): 在阈值筛选之前过滤原始 [N, 6] 检测数组（如 ROI 多边形）
+    """
     # 预测
     print(f"开始检测, 类型: {type(frame)}")
-    if isinstance(frame, str):
-        results = model.predict(frame, threshold=0.3)  # 直接传入文件路径进行预测
-    else:
-        # 写入到一个文件中，然后再通过路径进行检测
-
-        temp = "./output/temp/yolov8_detect.jpg"
-        if isinstance(frame, np.ndarray):
-            cv2.imwrite(temp, frame)
-        elif isinstance(frame, Image.Image):
-            frame.save(temp)
-        else:
-            raise ValueError("Unsupported image type.")
-        # 预测
-        results = model.predict(temp, threshold=0.3)
-        # results = model.predict_image(frame, threshold=0.3)
-    
-    print(f"检测完成, 结果: {results}")
+    # 交给调度器与其他请求合并成批次推理
+    dets, input_size = _get_scheduler().submit((_to_bgr_array(frame), latency_budget_ms)).result()
+    if dets_filter is not None:
+        dets = dets_filter(dets)
 
-    # 筛选逻辑
-    high_conf = [r for r in results if r["score"] >= 0.5]
-    if high_conf:
-        selected = high_conf
-    else:
-        mid_conf = [r for r in results if r["score"] >= 0.3]
-        if mid_conf:
-            selected = [max(mid_conf, key=lambda r: r["score"])]
-        else:
-            return []
-
-    # 转换字段名为模拟输出格式
-    formatted = []
-    for r in selected:
-        formatted.append({
-            "bbox": r["bbox"],
-            "confidence": round(r["score"], 2),
-            "category_id": r["category_id"] + 1,  # 如果你的category_id原本从0开始，可以+1以匹配模拟逻辑
-            "category": r["category"],
-        })
+    detections = _select_detections(dets)
+    print(f"检测完成, 输入尺寸 {input_size}, 候选 {len(dets)} 个, 结果: {detections}")
+    return detections, input_size
+
+async def yolov8_detect_async(
+    frame: Union[np.ndarray, Image.Image],
+    latency_budget_ms: Optional[float] = None,
+    dets_filter: Optional[Callable[[np.ndarray], np.ndarray]] = None
+) -> Tuple[List[Dict], int]:
+    """yolov8_detect_with_size 的协程版本，等待批次结果时不阻塞事件循环"""
+    dets, input_size = await asyncio.wrap_future(
+        _get_scheduler().submit((_to_bgr_array(frame), latency_budget_ms)))
+    if dets_filter is not None:
+        dets = dets_filter(dets)
+    return _select_detections(dets), input_size
+
+def get_detect_stats() -> Dict:
+    """检测调度器的队列深度与批大小统计，以及各输入尺寸的使用情况"""
+    if detect_scheduler is None:
+        return {"running": False}
+    stats = detect_scheduler.stats()
+    stats["adaptive_resolution"] = DETECT_ADAPTIVE_RESOLUTION
+    stats["resolution"] = resolution_policy.stats()
+    return stats
 
-    return formatted
\ No newline at end of file
+def get_worker_stats() -> Dict:
+    """推理进程池的健康状态，未启用时返回空信息"""
+    if worker_pool is None:
+        return {"num_workers": 0, "workers": []}
+    return worker_pool.stats()
@@ -1,8 +1,17 @@
 # 入口文件
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.api import sample_routes, yolov8_routes, ppocr_routes, video_routes, result_routes, ship_id_routes
+from app.api import sample_routes, yolov8_routes, ppocr_routes, video_routes, result_routes, ship_id_routes, health_routes
+from app.services import startup
 
-app = FastAPI()
+# 生命周期：导入路由不再加载模型和建表，启动后在后台线程中完成，进度见 /health/ready
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.start_background_startup()
+    yield
+    startup.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # 注册路由
 app.include_router(sample_routes.router, prefix="/api/sample", tags=["Sample"])
@@ -12,6 +21,7 @@ app.include_router(video_routes.router, prefix="/api/video", tags=["Video Proces
 app.include_router(result_routes.router, prefix="/api/result", tags=["Result"])
 app.include_router(sample_routes.router, prefix="/api/picture", tags=["Picture Processing"])
 app.include_router(ship_id_routes.router, prefix="/api/ship_id", tags=["Ship ID"])
+app.include_router(health_routes.router, prefix="/health", tags=["Health"])
 
 # 中间件，防止跨域报错，允许所有来源
 from fastapi.middleware.cors import CORSMiddleware
@@ -0,0 +1,166 @@
+# 导出 YOLOv8 静态图推理模型，并与 Trainer 动态图结果做一致性检查
+# 用法：python -m app.models.export_yolov8 --output_dir output_inference --onnx --check_dir resources/images
+import argparse
+import glob
+import os
+import subprocess
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from app.models.model_factory import YOLOV8_WEIGHTS_PATH, YOLOV8_CONFIG_PATH
+from app.models.yolov8_model import YOLOv8Model
+from app.models.yolov8_infer_model import YOLOv8InferModel, BACKEND_PADDLE, BACKEND_ONNX
+
+
+def export_inference_model(
+    model: YOLOv8Model,
+    output_dir: str = 'output_inference',
+    fuse_conv_bn: bool = True,
+    to_onnx: bool = False,
+    opset_version: int = 11,
+) -> str:
+    """
+    使用 Trainer.export 导出静态图模型，可选再转换为 ONNX
+
+    Args:
+        model (YOLOv8Model): 已加载权重的动态图模型
+        output_dir (str): 导出根目录
+        fuse_conv_bn (bool): 是否在导出时融合 Conv+BN（对应配置中的 export.fuse_conv_bn）
+        to_onnx (bool): 是否额外通过 paddle2onnx 生成 model.onnx
+        opset_version (int): ONNX opset 版本
+
+    Returns:
+        str: 推理模型所在目录
+    """
+    # export.nms 保持配置中的 true，导出的模型直接输出 NMS 之后的 bbox / bbox_num
+    model.cfg['export']['fuse_conv_bn'] = fuse_conv_bn
+    model.trainer.export(output_dir)
+
+    model_name = os.path.splitext(os.path.split(model.cfg.filename)[-1])[0]
+    save_dir = os.path.join(output_dir, model_name)
+    print(f"Inference model exported to {save_dir}")
+
+    if to_onnx:
+        model_file = 'model.json' if os.path.exists(os.path.join(save_dir, 'model.json')) else 'model.pdmodel'
+        subprocess.run([
+            'paddle2onnx',
+            '--model_dir', save_dir,
+            '--model_filename', model_file,
+            '--params_filename', 'model.pdiparams',
+            '--opset_version', str(opset_version),
+            '--save_file', os.path.join(save_dir, 'model.onnx'),
+        ], check=True)
+        print(f"ONNX model saved to {os.path.join(save_dir, 'model.onnx')}")
+
+    return save_dir
+
+
+def _box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+
+def check_parity(
+    reference: YOLOv8Model,
+    candidate: YOLOv8Model,
+    image_paths: List[str],
+    threshold: float = 0.3,
+    iou_threshold: float = 0.9,
+    score_tolerance: float = 0.05,
+) -> Dict:
+    """
+    比较两个后端在同一批图片上的检测结果
+
+    同类别且 IoU >= iou_threshold 的框视为匹配，匹配框的置信度差超过 score_tolerance 或存在未匹配的框即判为不一致。
+    两个后端的切片推理参数不同时同样判为不一致（切片推理的结果会不同）。
+
+    Returns:
+        Dict: 总体是否一致以及每张图片的明细
+    """
+    reference_params, candidate_params = reference.slice_params(), candidate.slice_params()
+    slice_mismatch = {key: [value, candidate_params.get(key)] for key, value in reference_params.items()
+                      if candidate_params.get(key) != value}
+
+    details = []
+    for image_path in image_paths:
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        ref = reference.predict_array(image, threshold=threshold)
+        cand = candidate.predict_array(image, threshold=threshold)
+
+        cand_boxes = np.array([r['bbox'] for r in cand], dtype=np.float32).reshape(-1, 4)
+        used = np.zeros(len(cand), dtype=bool)
+        min_iou, max_score_diff, unmatched = 1.0, 0.0, 0
+        for r in ref:
+            same_class = np.array([c['category_id'] == r['category_id'] for c in cand], dtype=bool)
+            ious = _box_iou(np.array(r['bbox'], dtype=np.float32), cand_boxes) if len(cand) else np.zeros(0)
+            ious[~same_class | used] = 0
+            if len(ious) == 0 or ious.max() < iou_threshold:
+                unmatched += 1
+                continue
+            j = int(ious.argmax())
+            used[j] = True
+            min_iou = min(min_iou, float(ious[j]))
+            max_score_diff = max(max_score_diff, abs(r['score'] - cand[j]['score']))
+        unmatched += int((~used).sum())
+
+        details.append({
+            'image': image_path,
+            'reference_boxes': len(ref),
+            'candidate_boxes': len(cand),
+            'unmatched': unmatched,
+            'min_iou': round(min_iou, 4),
+            'max_score_diff': round(max_score_diff, 4),
+            'passed': unmatched == 0 and max_score_diff <= score_tolerance,
+        })
+
+    return {
+        'passed': not slice_mismatch and all(d['passed'] for d in details),
+        'slice_params_mismatch': slice_mismatch,
+        'details': details,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export YOLOv8 inference model and check parity")
+    parser.add_argument('--weights', default=YOLOV8_WEIGHTS_PATH)
+    parser.add_argument('--config', default=YOLOV8_CONFIG_PATH)
+    parser.add_argument('--output_dir', default='output_inference')
+    parser.add_argument('--no_fuse_conv_bn', action='store_true')
+    parser.add_argument('--onnx', action='store_true', help="additionally convert to model.onnx with paddle2onnx")
+    parser.add_argument('--opset_version', type=int, default=11)
+    parser.add_argument('--check_dir', default=None, help="directory of images used for the parity check")
+    parser.add_argument('--threshold', type=float, default=0.3)
+    args = parser.parse_args()
+
+    trainer_model = YOLOv8Model(args.weights, args.config, use_gpu=False, threshold=args.threshold)
+    model_dir = export_inference_model(
+        trainer_model,
+        output_dir=args.output_dir,
+        fuse_conv_bn=not args.no_fuse_conv_bn,
+        to_onnx=args.onnx,
+        opset_version=args.opset_version
+    )
+
+    if args.check_dir:
+        images = sorted(glob.glob(os.path.join(args.check_dir, '*.jpg')))
+        # 导出时对 Trainer 模型做了 Conv+BN 融合，重新加载一份作为基准
+        reference = YOLOv8Model(args.weights, args.config, use_gpu=False, threshold=args.threshold)
+        backends = [BACKEND_PADDLE] + ([BACKEND_ONNX] if args.onnx else [])
+        for backend in backends:
+            candidate = YOLOv8InferModel(model_dir, backend=backend, threshold=args.threshold, config_path=args.config)
+            report = check_parity(reference, candidate, images, threshold=args.threshold)
+            print(f"[{backend}] parity {'passed' if report['passed'] else 'FAILED'}")
+            if report['slice_params_mismatch']:
+                print(f"slice params differ (reference, candidate): {report['slice_params_mismatch']}")
+            for detail in report['details']:
+                print(detail)
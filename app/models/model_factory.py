@@ -0,0 +1,84 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 模型路径配置（可通过环境变量覆盖）
+YOLOV8_WEIGHTS_PATH = os.getenv(
+    "YOLOV8_WEIGHTS_PATH", "E:/Graduate_Design/ShipDetect-Backend/resources/models/yolov8_m_50.pdparams")
+YOLOV8_CONFIG_PATH = os.getenv(
+    "YOLOV8_CONFIG_PATH", "E:/Graduate_Design/ShipDetect-Backend/configs/default_config.yaml")
+YOLOV8_INFER_MODEL_DIR = os.getenv("YOLOV8_INFER_MODEL_DIR", "output_inference/yolov8_m_500e_coco_mydataset")
+
+# 推理后端：trainer（动态图）/ paddle_inference / onnxruntime
+YOLOV8_BACKEND = os.getenv("YOLOV8_BACKEND", "trainer")
+
+
+def env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def create_yolov8_model(threshold: float = 0.3, backend: str = None):
+    """
+    按部署配置创建检测模型，不同后端对外提供相同的 predict / predict_image / predict_arrays 接口
+
+    Args:
+        threshold (float): 默认检测阈值
+        backend (str, optional): 推理后端，默认读取 YOLOV8_BACKEND
+    """
+    backend = backend or YOLOV8_BACKEND
+    use_gpu = env_flag("YOLOV8_USE_GPU", True)
+    batch_size = int(os.getenv("YOLOV8_BATCH_SIZE", 8))
+    # 长边超过该尺寸的帧自动切片推理，0 表示关闭
+    slice_min_size = int(os.getenv("DETECT_SLICE_MIN_SIZE", 0))
+
+    if backend == "trainer":
+        from app.models.yolov8_model import YOLOv8Model
+        return YOLOv8Model(
+            weights_path=YOLOV8_WEIGHTS_PATH,
+            config_path=YOLOV8_CONFIG_PATH,
+            use_gpu=use_gpu,
+            threshold=threshold,
+            batch_size=batch_size,
+            slice_min_size=slice_min_size
+        )
+
+    from app.models.yolov8_infer_model import YOLOv8InferModel
+    cpu_threads = os.getenv("YOLOV8_CPU_THREADS")
+    return YOLOv8InferModel(
+        model_dir=YOLOV8_INFER_MODEL_DIR,
+        backend=backend,
+        use_gpu=use_gpu,
+        threshold=threshold,
+        batch_size=batch_size,
+        cpu_threads=int(cpu_threads) if cpu_threads else None,
+        enable_mkldnn=env_flag("YOLOV8_ENABLE_MKLDNN", True),
+        slice_min_size=slice_min_size,
+        config_path=YOLOV8_CONFIG_PATH
+    )
+
+
+def create_ocr_model(cpu_threads: int = None):
+    """
+    创建 OCR 引擎（PPOCRModel，内部为 PaddleOCR）
+
+    Args:
+        cpu_threads (int, optional): CPU 推理线程数，默认读取 OCR_CPU_THREADS
+    """
+    from app.models.ppocr_model import PPOCRModel
+
+    cpu_threads = cpu_threads or int(os.getenv("OCR_CPU_THREADS", 10))
+    return PPOCRModel(
+        use_angle_cls=True,
+        lang='ch',
+        show_log=True,
+        use_gpu=env_flag("OCR_USE_GPU", True),
+        cpu_threads=cpu_threads,
+        enable_mkldnn=env_flag("OCR_ENABLE_MKLDNN", False),
+        # 批量 OCR 时一帧内所有船的文字行合并识别，批次可以适当调大
+        rec_batch_num=int(os.getenv("OCR_REC_BATCH_NUM", 6)),
+        cls_batch_num=int(os.getenv("OCR_CLS_BATCH_NUM", 6))
+    )
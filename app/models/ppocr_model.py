@@ -1,127 +1,303 @@
-from paddleocr import PaddleOCR, draw_ocr
 from PIL import Image
 import numpy as np
 import cv2
+import copy
 import os
+import threading
+from typing import List, NamedTuple, Optional, Union
+
+# paddleocr 在用到时才导入：推理进程池模式下服务进程只需要反序列化 OCRLine，不必加载 paddle
+
+class OCRLine(NamedTuple):
+    """一行文字的识别结果"""
+    quad: List[List[int]]  # 四点框 [左上, 右上, 右下, 左下]
+    box: List[int]         # 外接矩形 [x1, y1, x2, y2]
+    text: str
+    score: float
+
+    @classmethod
+    def from_quad(cls, quad, text: str, score: float) -> "OCRLine":
+        points = np.asarray(quad, dtype=np.float32).reshape(4, 2)
+        x1, y1 = np.floor(points.min(axis=0)).astype(int).tolist()
+        x2, y2 = np.ceil(points.max(axis=0)).astype(int).tolist()
+        return cls(np.round(points).astype(int).tolist(), [x1, y1, x2, y2], text, float(score))
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+def load_bgr_image(image: Union[str, bytes, np.ndarray]) -> np.ndarray:
+    """
+    把图片路径、字节流或数组转换为 OCR 直接可用的 BGR uint8 连续数组
+
+    PaddleOCR 对数组输入按 BGR 处理（与 cv2.imread 读取路径的结果一致），
+    字节流只解码一次，灰度图和带透明通道的图转换为三通道。
+    """
+    if isinstance(image, str):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Image path does not exist: {image}")
+        loaded = cv2.imread(image)
+        if loaded is None:
+            raise ValueError(f"Image {image} cannot be decoded.")
+        return loaded
+    if isinstance(image, bytes):
+        image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Image bytes cannot be decoded.")
+        return image
+    if not isinstance(image, np.ndarray):
+        raise ValueError("Unsupported image input type.")
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    elif image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    if image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    # 裁剪得到的视图不连续，推理进程池传输前需要连续内存
+    return np.ascontiguousarray(image)
+
+def best_line(lines: List[OCRLine]) -> Optional[OCRLine]:
+    """置信度最高的一行"""
+    return max(lines, key=lambda line: line.score) if lines else None
+
+def quad_crop_sizes(quads: np.ndarray) -> np.ndarray:
+    """
+    每个四边形矫正后的 (宽, 高)，与 PaddleOCR get_rotate_crop_image 的取整方式一致
+
+    :param quads: [N, 4, 2]，顶点顺序为 左上、右上、右下、左下
+    :return: [N, 2] int
+    """
+    edge = lambda a, b: np.linalg.norm(quads[:, a] - quads[:, b], axis=1)
+    widths = np.maximum(edge(0, 1), edge(2, 3))
+    heights = np.maximum(edge(0, 3), edge(1, 2))
+    return np.stack([widths, heights], axis=1).astype(np.int64)
+
+def perspective_transforms(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    一次求解 N 个透视变换矩阵（等价于逐个调用 cv2.getPerspectiveTransform）
+
+    :param src: [N, 4, 2] 源四边形
+    :param dst: [N, 4, 2] 目标四边形
+    :return: [N, 3, 3]，退化（三点共线等）的四边形对应的矩阵为 NaN
+    """
+    n = len(src)
+    x, y = src[..., 0].astype(np.float64), src[..., 1].astype(np.float64)
+    u, v = dst[..., 0].astype(np.float64), dst[..., 1].astype(np.float64)
+    zeros, ones = np.zeros_like(x), np.ones_like(x)
+    # 每个点两行方程：[x, y, 1, 0, 0, 0, -u*x, -u*y]·h = u，[0, 0, 0, x, y, 1, -v*x, -v*y]·h = v
+    rows_u = np.stack([x, y, ones, zeros, zeros, zeros, -u * x, -u * y], axis=-1)
+    rows_v = np.stack([zeros, zeros, zeros, x, y, ones, -v * x, -v * y], axis=-1)
+    A = np.concatenate([rows_u, rows_v], axis=1)  # [N, 8, 8]
+    b = np.concatenate([u, v], axis=1)             # [N, 8]
+
+    matrices = np.full((n, 3, 3), np.nan)
+    valid = np.abs(np.linalg.det(A)) > 1e-9
+    if valid.any():
+        h = np.linalg.solve(A[valid], b[valid][..., None])[..., 0]
+        matrices[valid] = np.concatenate([h, np.ones((len(h), 1))], axis=1).reshape(-1, 3, 3)
+    return matrices
+
+def crop_text_regions(image: np.ndarray, quads, rotate_vertical: bool = True) -> List[np.ndarray]:
+    """
+    按文本框四边形批量做透视矫正裁剪
+
+    变换矩阵一次性求解，每个裁剪图只在自身大小的画布上做 warpPerspective，
+    开销与裁剪图面积成正比，与原图大小无关。结果与 PaddleOCR 识别前的矫正一致，可以直接送入识别器。
+    :param image: BGR 图像
+    :param quads: 四边形列表，每个为 [左上, 右上, 右下, 左下]
+    :param rotate_vertical: 高宽比不小于 1.5 的竖排文本旋转为横排
+    :return: 与 quads 一一对应的裁剪图，退化的四边形对应空数组
+    """
+    quads = np.asarray(quads, dtype=np.float32).reshape(-1, 4, 2)
+    if len(quads) == 0:
+        return []
+    sizes = quad_crop_sizes(quads)
+    w, h = sizes[:, 0].astype(np.float32), sizes[:, 1].astype(np.float32)
+    zeros = np.zeros_like(w)
+    dst = np.stack([np.stack([zeros, zeros], 1), np.stack([w, zeros], 1),
+                    np.stack([w, h], 1), np.stack([zeros, h], 1)], axis=1)
+    matrices = perspective_transforms(quads, dst)
+
+    crops = []
+    for (cw, ch), matrix in zip(sizes.tolist(), matrices):
+        if cw < 1 or ch < 1 or np.isnan(matrix).any():
+            crops.append(np.zeros((0, 0) + image.shape[2:], dtype=image.dtype))
+            continue
+        crop = cv2.warpPerspective(image, matrix, (cw, ch), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+        if rotate_vertical and ch / cw >= 1.5:
+            crop = np.rot90(crop)
+        crops.append(crop)
+    return crops
 
 class PPOCRModel:
-    def __init__(self, lang='ch', use_angle_cls=True, show_log=False):
-        self.ocr = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang, show_log=show_log)  # need to run only once to download and load model into memory
-        self.results = []  # 存储识别结果
+    """
+    PP-OCRv4 文字检测 + 识别，服务中唯一的 OCR 入口
 
-    def detect_text_regions(self, img_path, save_crops=False, crop_dir='./output/PPOOCRv4'):
+    所有方法都接受图片路径、字节流或 BGR 数组；识别结果为 OCRLine（四点框、外接矩形、文本、置信度）。
+    """
+
+    def __init__(self, lang='ch', use_angle_cls=True, show_log=False, engine=None, hull_index=None, **engine_kwargs):
+        """
+        :param engine: 已创建的 PaddleOCR 实例，为空时按 lang 等参数创建
+        :param hull_index: 船号候选索引（HullNumberIndex），fuzzy_match 使用
+        :param engine_kwargs: 传给 PaddleOCR 的其他参数（use_gpu、cpu_threads、rec_batch_num 等）
+        """
+        if engine is None:
+            from paddleocr import PaddleOCR
+            engine = PaddleOCR(use_angle_cls=use_angle_cls, lang=lang, show_log=show_log, **engine_kwargs)  # need to run only once to download and load model into memory
+        self.ocr = engine
+        self.use_angle_cls = use_angle_cls and engine.use_angle_cls
+        self.hull_index = hull_index
+        self.results = []  # 存储最近一次 detect_and_recognize 的识别文本
+        # PaddleOCR 的检测、方向分类、识别器各自复用一个预测器及其输入输出句柄，多线程调用时串行执行
+        self._lock = threading.Lock()
+
+    def detect_quads(self, image) -> np.ndarray:
+        """
+        只做文字检测
+        :param image: 图片路径、字节流或 BGR 数组
+        :return: [N, 4, 2] 四点框，按从上到下、从左到右排序
+        """
+        from paddleocr.tools.infer.predict_system import sorted_boxes
+
+        image = load_bgr_image(image)
+        with self._lock:
+            dt_boxes, _ = self.ocr.text_detector(image)
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return np.zeros((0, 4, 2), dtype=np.float32)
+        return np.asarray(sorted_boxes(dt_boxes), dtype=np.float32)
+
+    def detect_text_regions(self, img_path, save_crops=False, crop_dir='./output/PPOOCRv4', return_crops=False):
         """
         检测文本区域
-        :param img_path: 图片路径
-        :param conf_threshold: 置信度阈值
+        :param img_path: 图片路径（也可以是字节流或 BGR 数组）
         :param save_crops: 是否保存裁剪的区域
         :param crop_dir: 保存裁剪图片的目录
-        :return: 检测到的文本区域（bbox 坐标列表）
+        :param return_crops: 是否同时返回透视矫正后的裁剪图（可直接送入识别器）
+        :return: 检测到的文本区域（bbox 坐标列表）；return_crops 为 True 时返回 (boxes, crops)
         """
-        # 检查图片路径是否存在
-        if not os.path.exists(img_path):
-            raise FileNotFoundError(f"Image path {img_path} does not exist.")
-        result = self.ocr.ocr(img_path, rec=False)
-        boxes = []
-        for idx in range(len(result)):
-            res = result[idx]
-            for line in res:
-                boxes.append(line)  # 获取文本区域的坐标
-                # 每个坐标分别为 [左上角, 右上角, 右下角, 左下角]，每个坐标为 [x, y] 格式
-        
+        image = load_bgr_image(img_path)
+        quads = self.detect_quads(image)
+        # 每个坐标分别为 [左上角, 右上角, 右下角, 左下角]，每个坐标为 [x, y] 格式
+        boxes = quads.tolist()
+
+        crops = []
+        if boxes and (save_crops or return_crops):
+            crops = crop_text_regions(image, quads)
+
         if save_crops:
             # 创建目录
-            if not os.path.exists(crop_dir):
-                os.makedirs(crop_dir)
-            image = cv2.imread(img_path)
-            # 遍历检测到的文本区域，并保存裁剪的图片
-            for box in boxes:
-                # 按照顺序提取左上角、右上角、右下角、左下角的坐标
-                left_top = box[0]
-                right_top = box[1]
-                right_bottom = box[2]
-                left_bottom = box[3]
-                # 将坐标转换为整数
-                points = np.array([left_top, right_top, right_bottom, left_bottom], dtype=np.int32)
-                # 创建掩膜
-                mask = np.zeros(image.shape, dtype=np.uint8)
-                cv2.fillPoly(mask, [points], (255, 255, 255))
-                # 裁剪图片
-                crop = cv2.bitwise_and(image, mask)
-                # 获取裁剪区域的最小外接矩形
-                x, y, w, h = cv2.boundingRect(points)
-                crop = crop[y:y+h, x:x+w]
-                # 保存裁剪的图片
-                crop_name = os.path.join(crop_dir, f'crop_{idx}.jpg')
+            os.makedirs(crop_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(img_path))[0] if isinstance(img_path, str) else "image"
+            for idx, crop in enumerate(crops):
+                if crop.size == 0:
+                    continue
+                crop_name = os.path.join(crop_dir, f'{stem}_crop_{idx}.jpg')
                 cv2.imwrite(crop_name, crop)
-                idx += 1
-                print(f"Saved cropped image: {crop_name}")
+            print(f"Saved {len(crops)} cropped images to {crop_dir}")
+
+        if return_crops:
+            return boxes, crops
         return boxes
 
     def recognize_text(self, img_path, conf_threshold=0.5):
         """
-        识别图片中的文字
-        :param img_path: 图片路径
+        识别图片中的文字（不做检测，整张图作为一行文字）
+        :param img_path: 图片路径、字节流、BGR 数组，或多张文字行裁剪图的列表
         :param conf_threshold: 置信度阈值
-        :return: 文本内容列表及对应置信度
+        :return: (文本, 置信度) 列表
         """
-        result = self.ocr.ocr(img_path, det=False, cls=False)
-        texts = []
-        for idx in range(len(result)):
-            res = result[idx]
-            for line in res:
-                if line[1] >= conf_threshold:
-                    texts.append(line)
-    
-        return texts
+        if isinstance(img_path, list):
+            images = [load_bgr_image(image) for image in img_path]
+        else:
+            images = [load_bgr_image(img_path)]
+        with self._lock:
+            rec_res, _ = self.ocr.text_recognizer(images)
+        return [tuple(line) for line in rec_res if line[1] >= conf_threshold]
+
+    def recognize_batch(self, images, conf_threshold=None, cls=True) -> List[List[OCRLine]]:
+        """
+        多张图片合并 OCR
+
+        逐张做文字检测，再把所有图片的文字行合并，一次交给方向分类器和识别器（内部按 rec_batch_num 分批），
+        最后按来源图片拆回。图片可以来自同一帧的多个船舶，也可以来自多帧。
+        :param images: 图片路径、字节流或 BGR 数组的列表
+        :param conf_threshold: 置信度阈值，默认使用 PaddleOCR 的 drop_score
+        :param cls: 是否做方向分类
+        :return: 与输入一一对应的 OCRLine 列表，没有识别结果时为空列表
+        """
+        from paddleocr.tools.infer.utility import get_minarea_rect_crop
+
+        conf_threshold = self.ocr.drop_score if conf_threshold is None else conf_threshold
+        quad_mode = getattr(self.ocr.args, "det_box_type", "quad") == "quad"
+        line_crops, line_quads, owners = [], [], []
+        for idx, image in enumerate(images):
+            image = load_bgr_image(image)
+            if image.size == 0:
+                continue
+            quads = self.detect_quads(image)
+            if len(quads) == 0:
+                continue
+            if quad_mode:
+                crops = crop_text_regions(image, quads)
+            else:
+                crops = [get_minarea_rect_crop(image, copy.deepcopy(quad)) for quad in quads]
+            for quad, crop in zip(quads, crops):
+                if crop.size == 0:
+                    continue
+                line_crops.append(crop)
+                line_quads.append(quad)
+                owners.append(idx)
+
+        results: List[List[OCRLine]] = [[] for _ in images]
+        if not line_crops:
+            return results
+
+        with self._lock:
+            if cls and self.use_angle_cls:
+                line_crops, _, _ = self.ocr.text_classifier(line_crops)
+            rec_res, _ = self.ocr.text_recognizer(line_crops)
+
+        for owner, quad, (text, score) in zip(owners, line_quads, rec_res):
+            if score >= conf_threshold:
+                results[owner].append(OCRLine.from_quad(quad, text, score))
+        return results
 
     def detect_and_recognize(self, img_path, conf_threshold=0.5, visualize=False, save_results=None, font_path='static/simfang.ttf'):
         """
         先检测再识别
-        :param img_path: 图片路径
+        :param img_path: 图片路径、字节流或 BGR 数组
         :param conf_threshold: 置信度阈值
         :param visualize: 是否可视化
         :param save_results: 结果保存路径（文本文件）
         :param font_path: 字体路径
-        :return: 识别结果
+        :return: 识别结果（OCRLine 列表）
         """
-        result = self.ocr.ocr(img_path, cls=True, det=True)
-        bboxes = []
-        for idx in range(len(result)):
-            res = result[idx]
-            for line in res:
-                if line[1][1] >= conf_threshold:
-                    boxes.append(line)
-
-                    
-        # image = Image.open(img_path).convert('RGB')
-        
-        # boxes, texts, scores = [], [], []
-        # for line in result:
-        #     if line[1][1] >= conf_threshold:
-        #         boxes.append(line[0])
-        #         texts.append(line[1][0])
-        #         scores.append(line[1][1])
-        
-        # self.results = texts  # 存储识别文本
-        
-        # if visualize:
-        #     im_show = draw_ocr(image, boxes, texts, scores, font_path=font_path)
-        #     im_show = Image.fromarray(im_show)
-        #     im_show.show()
-        
-        # if save_results:
-        #     with open(save_results, 'w', encoding='utf-8') as f:
-        #         for text, score in zip(texts, scores):
-        #             f.write(f'{text}: {score}\n')
-        
-        return bboxes
-
-    def fuzzy_match(self, keyword):
+        image = load_bgr_image(img_path)
+        lines = self.recognize_batch([image], conf_threshold=conf_threshold)[0]
+        self.results = [line.text for line in lines]  # 存储识别文本
+
+        if visualize:
+            from paddleocr import draw_ocr
+            im_show = draw_ocr(Image.fromarray(image[..., ::-1]), [line.quad for line in lines],
+                               [line.text for line in lines], [line.score for line in lines], font_path=font_path)
+            Image.fromarray(im_show).show()
+
+        if save_results:
+            with open(save_results, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(f'{line.text}: {line.score}\n')
+
+        return lines
+
+    def fuzzy_match(self, keyword, min_score=0.8):
         """
         模糊匹配，提高正确率
-        :param keyword: 需要匹配的关键字
-        :return: 匹配到的文本
+        :param keyword: 需要匹配的关键字（如 OCR 得到的船号）
+        :param min_score: 最低相似度
+        :return: 设置了 hull_index 时返回候选船号中相似度不低于 min_score 的 (船号, 相似度) 列表，
+                 否则返回最近一次识别文本中包含关键字的文本
         """
+        if self.hull_index is not None:
+            return self.hull_index.search(keyword, min_score=min_score)
         matches = [text for text in self.results if keyword in text]
         return matches
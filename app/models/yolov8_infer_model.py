@@ -0,0 +1,197 @@
+import os
+import threading
+import cv2
+import yaml
+import numpy as np
+from typing import List, Dict, Optional
+from ppdet.core.workspace import load_config
+from ppdet.data.reader import Compose
+
+from app.models.yolov8_model import YOLOv8Model
+
+BACKEND_PADDLE = 'paddle_inference'
+BACKEND_ONNX = 'onnxruntime'
+
+
+def draw_detections(image: np.ndarray, results: List[Dict]) -> np.ndarray:
+    """在图像副本上画出检测框、类别与置信度"""
+    canvas = image.copy()
+    for result in results:
+        x1, y1, x2, y2 = result['bbox']
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{result['category']} {result['score']:.2f}"
+        cv2.putText(canvas, label, (x1, max(y1 - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    return canvas
+
+
+class YOLOv8InferModel(YOLOv8Model):
+    """
+    基于导出静态图的 YOLOv8 推理（Paddle Inference / ONNX Runtime）
+
+    与 YOLOv8Model 共用预处理、结果格式化和批量推理接口，只替换前向部分，
+    模型目录为 export_yolov8.py 导出的 model.pdmodel / model.pdiparams / infer_cfg.yml（以及可选的 model.onnx）。
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        backend: str = BACKEND_PADDLE,
+        use_gpu: bool = False,
+        threshold: float = 0.5,
+        device_id: int = 0,
+        batch_size: int = 8,
+        cpu_threads: Optional[int] = None,
+        enable_mkldnn: bool = True,
+        slice_min_size: int = 0,
+        config_path: Optional[str] = None,
+    ):
+        """
+        初始化静态图推理模型
+
+        Args:
+            model_dir (str): 导出的推理模型目录
+            backend (str): 推理后端，paddle_inference 或 onnxruntime
+            use_gpu (bool): 是否使用GPU
+            threshold (float): 默认检测阈值
+            device_id (int): GPU设备ID
+            batch_size (int): 批量推理时每次前向的最大图片数
+            cpu_threads (int, optional): CPU 推理线程数，默认由后端决定
+            enable_mkldnn (bool): CPU 下 Paddle Inference 是否开启 MKLDNN
+            slice_min_size (int): 图像长边超过该值时自动切片推理，0 表示不自动切片
+            config_path (str, optional): 导出所用的检测配置文件，切片推理参数与 Trainer 后端一样从中读取；
+                为空时使用默认值
+        """
+        if backend not in (BACKEND_PADDLE, BACKEND_ONNX):
+            raise ValueError(f"Unsupported backend: {backend}")
+
+        self.model_dir = model_dir
+        self.backend = backend
+        self.use_gpu = use_gpu
+        self.device_id = device_id
+        self.threshold = threshold
+        self.batch_size = max(1, batch_size)
+        self.cpu_threads = cpu_threads
+        self.enable_mkldnn = enable_mkldnn
+        self.slice_min_size = slice_min_size
+
+        self._init_slice_params(load_config(config_path) if config_path else {})
+
+        infer_cfg_path = os.path.join(model_dir, 'infer_cfg.yml')
+        if not os.path.exists(infer_cfg_path):
+            raise FileNotFoundError(f"infer_cfg.yml not found in {model_dir}")
+        with open(infer_cfg_path, encoding='utf-8') as f:
+            self.infer_cfg = yaml.safe_load(f)
+
+        print(f"Initializing {backend} predictor...")
+        if backend == BACKEND_PADDLE:
+            self.predictor = self._create_paddle_predictor()
+        else:
+            self.session = self._create_onnx_session()
+
+        self.transforms = self._build_transforms()
+        # 导出的静态图输入尺寸固定，不支持按请求切换
+        self.input_size = self._default_input_size()
+        self.dynamic_input = False
+        self._size_transforms = {}
+        # 预测器不是线程安全的，同一实例的前向推理串行执行
+        self._lock = threading.Lock()
+
+    def _create_paddle_predictor(self):
+        from paddle.inference import Config, create_predictor
+
+        # Paddle 3.x 导出为 model.json，2.x 为 model.pdmodel
+        model_file = os.path.join(self.model_dir, 'model.json')
+        if not os.path.exists(model_file):
+            model_file = os.path.join(self.model_dir, 'model.pdmodel')
+        params_file = os.path.join(self.model_dir, 'model.pdiparams')
+
+        config = Config(model_file, params_file)
+        if self.use_gpu:
+            config.enable_use_gpu(200, self.device_id)
+        else:
+            config.disable_gpu()
+            if self.cpu_threads:
+                config.set_cpu_math_library_num_threads(self.cpu_threads)
+            if self.enable_mkldnn:
+                config.enable_mkldnn()
+                config.set_mkldnn_cache_capacity(10)
+        config.switch_ir_optim(True)
+        config.enable_memory_optim()
+        config.disable_glog_info()
+        config.switch_use_feed_fetch_ops(False)
+        return create_predictor(config)
+
+    def _create_onnx_session(self):
+        import onnxruntime as ort
+
+        model_file = os.path.join(self.model_dir, 'model.onnx')
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"model.onnx not found in {self.model_dir}, export with --onnx first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.cpu_threads:
+            options.intra_op_num_threads = self.cpu_threads
+        providers = ['CPUExecutionProvider']
+        if self.use_gpu:
+            providers.insert(0, ('CUDAExecutionProvider', {'device_id': self.device_id}))
+        return ort.InferenceSession(model_file, options, providers=providers)
+
+    def _sample_transforms(self) -> List[Dict]:
+        """infer_cfg.yml 中 Preprocess 转换为 {name: args} 形式（去掉 Decode）"""
+        sample_transforms = []
+        for op in self.infer_cfg['Preprocess']:
+            op = dict(op)
+            op_type = op.pop('type')
+            if op_type == 'Decode':
+                continue
+            sample_transforms.append({op_type: op})
+        return sample_transforms
+
+    def _build_transforms(self, input_size: Optional[int] = None) -> Compose:
+        """根据 infer_cfg.yml 中的 Preprocess 构建预处理流程"""
+        return Compose(self._sample_transforms(), num_classes=len(self.infer_cfg.get('label_list', [])) or 80)
+
+    def _forward(self, samples: List[Dict]) -> List[np.ndarray]:
+        inputs = {
+            key: np.stack([s[key] for s in samples]).astype(np.float32)
+            for key in ('image', 'im_shape', 'scale_factor')
+        }
+        with self._lock:
+            if self.backend == BACKEND_PADDLE:
+                for name in self.predictor.get_input_names():
+                    self.predictor.get_input_handle(name).copy_from_cpu(inputs[name])
+                self.predictor.run()
+                output_names = self.predictor.get_output_names()
+                bbox = self.predictor.get_output_handle(output_names[0]).copy_to_cpu()
+                bbox_num = self.predictor.get_output_handle(output_names[1]).copy_to_cpu()
+            else:
+                feed = {i.name: inputs[i.name] for i in self.session.get_inputs()}
+                bbox, bbox_num = self.session.run(None, feed)[:2]
+        return np.split(bbox, np.cumsum(bbox_num)[:-1])
+
+    def predict(
+        self,
+        image_path: str,
+        threshold: Optional[float] = None,
+        save_result: bool = False,
+        output_dir: Optional[str] = None,
+        slice_infer: bool = False,
+    ) -> List[Dict]:
+        """
+        对单张图片进行推理（使用文件路径）
+
+        保存可视化结果时在原图上画出检测框，按原文件名保存到 output_dir（默认 output），与 Trainer 后端相同
+        """
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Image path {image_path} does not exist or cannot be decoded.")
+        if slice_infer:
+            results = self.predict_sliced(image, threshold=threshold)
+        else:
+            results = self.predict_array(image, threshold=threshold)
+        if save_result:
+            output_dir = output_dir or 'output'
+            os.makedirs(output_dir, exist_ok=True)
+            cv2.imwrite(os.path.join(output_dir, os.path.basename(image_path)), draw_detections(image, results))
+        return results
@@ -1,5 +1,6 @@
 import tempfile
 import os
+import threading
 from PIL import Image
 import cv2
 import numpy as np
@@ -7,11 +8,159 @@ import warnings
 from typing import List, Dict, Optional, Union
 import paddle
 from ppdet.core.workspace import load_config, AttrDict
+from ppdet.data.reader import Compose
 from ppdet.engine import Trainer
 from ppdet.utils.check import check_gpu, check_version, check_config
 
 warnings.filterwarnings('ignore')
 
+CATEGORY_NAMES = {
+    0: 'ore carrier',
+    1: 'bulk cargo carrier',
+    2: 'general cargo ship',
+    3: 'container ship',
+    4: 'fishing boat',
+    5: 'passenger ship',
+}
+
+
+def clip_detections(dets: np.ndarray, image_shape) -> np.ndarray:
+    """
+    把检测框裁剪到图像范围内，并去掉无效类别和退化的框
+
+    Args:
+        dets (np.ndarray): [N, 6] 检测结果（class_id, score, x1, y1, x2, y2）
+        image_shape: 图像的 (h, w, ...)
+
+    Returns:
+        np.ndarray: 裁剪后的 [M, 6] 检测结果
+    """
+    dets = np.asarray(dets, dtype=np.float32).reshape(-1, 6).copy()
+    h, w = image_shape[:2]
+    np.clip(dets[:, 2:6:2], 0, w, out=dets[:, 2:6:2])
+    np.clip(dets[:, 3:6:2], 0, h, out=dets[:, 3:6:2])
+    valid = (dets[:, 0] >= 0) & (dets[:, 4] > dets[:, 2]) & (dets[:, 5] > dets[:, 3])
+    return dets[valid]
+
+
+def select_detections(
+    dets: np.ndarray,
+    score_threshold: float = 0.3,
+    high_threshold: float = 0.5,
+    class_thresholds: Optional[Dict[int, float]] = None,
+) -> np.ndarray:
+    """
+    在原始 [N, 6] 数组上完成阈值筛选：
+    存在高置信度（>= high_threshold）的框时保留全部高置信度框，否则只保留中等置信度中得分最高的一个
+
+    Args:
+        dets (np.ndarray): [N, 6] 检测结果
+        score_threshold (float): 最低置信度
+        high_threshold (float): 高置信度阈值
+        class_thresholds (Dict[int, float], optional): 按 class_id（从0开始）覆盖最低置信度
+
+    Returns:
+        np.ndarray: 选中的 [M, 6] 检测结果
+    """
+    dets = np.asarray(dets, dtype=np.float32).reshape(-1, 6)
+    if len(dets) == 0:
+        return dets
+
+    class_ids = dets[:, 0].astype(np.int64)
+    scores = dets[:, 1]
+    min_scores = np.full(len(dets), score_threshold, dtype=np.float32)
+    if class_thresholds:
+        for class_id, thr in class_thresholds.items():
+            min_scores[class_ids == class_id] = thr
+    keep = scores >= min_scores
+
+    high = keep & (scores >= np.maximum(min_scores, high_threshold))
+    if high.any():
+        return dets[high]
+    if keep.any():
+        idx = np.flatnonzero(keep)
+        return dets[idx[np.argmax(scores[idx])]][None]
+    return dets[:0]
+
+
+def resize_transforms(sample_transforms: List[Dict], input_size: int) -> List[Dict]:
+    """把预处理中 Resize 的 target_size 和 Pad 的 size 替换为 input_size x input_size"""
+    resized = []
+    for t in sample_transforms:
+        (name, args), = t.items()
+        args = dict(args or {})
+        if name == 'Resize':
+            args['target_size'] = [input_size, input_size]
+        elif name == 'Pad' and 'size' in args:
+            args['size'] = [input_size, input_size]
+        resized.append({name: args})
+    return resized
+
+
+def slice_windows(height: int, width: int, slice_size, overlap_ratio) -> List[tuple]:
+    """
+    计算切片窗口的左上角坐标，最后一行/列贴齐图像边缘
+
+    Returns:
+        List[tuple]: (x, y, w, h) 列表
+    """
+    slice_h, slice_w = slice_size
+    step_y = max(1, int(slice_h * (1 - overlap_ratio[1])))
+    step_x = max(1, int(slice_w * (1 - overlap_ratio[0])))
+
+    def starts(length, size, step):
+        if length <= size:
+            return [0]
+        positions = list(range(0, length - size + 1, step))
+        if positions[-1] != length - size:
+            positions.append(length - size)
+        return positions
+
+    return [
+        (x, y, min(slice_w, width - x), min(slice_h, height - y))
+        for y in starts(height, slice_h, step_y)
+        for x in starts(width, slice_w, step_x)
+    ]
+
+
+def merge_detections(dets: np.ndarray, match_threshold: float = 0.6, match_metric: str = 'ios') -> np.ndarray:
+    """
+    按类别合并切片结果的重复框（NMS），重叠度用 IoU 或 IoS（交集 / 较小框面积）
+
+    Args:
+        dets (np.ndarray): [N, 6] 检测结果
+        match_threshold (float): 重叠度超过该值的低分框被抑制
+        match_metric (str): 'iou' 或 'ios'
+
+    Returns:
+        np.ndarray: 合并后的 [M, 6] 检测结果
+    """
+    dets = np.asarray(dets, dtype=np.float32).reshape(-1, 6)
+    if len(dets) <= 1:
+        return dets
+
+    dets = dets[np.argsort(-dets[:, 1], kind='stable')]
+    x1, y1, x2, y2 = dets[:, 2], dets[:, 3], dets[:, 4], dets[:, 5]
+    areas = (x2 - x1) * (y2 - y1)
+
+    # 两两重叠度矩阵，不同类别之间不做抑制
+    inter_w = np.clip(np.minimum(x2[:, None], x2[None]) - np.maximum(x1[:, None], x1[None]), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2[None]) - np.maximum(y1[:, None], y1[None]), 0, None)
+    inter = inter_w * inter_h
+    if match_metric == 'ios':
+        overlap = inter / np.maximum(np.minimum(areas[:, None], areas[None]), 1e-6)
+    else:
+        overlap = inter / np.maximum(areas[:, None] + areas[None] - inter, 1e-6)
+    overlap[dets[:, 0][:, None] != dets[:, 0][None]] = 0
+
+    suppressed = np.zeros(len(dets), dtype=bool)
+    for i in range(len(dets)):
+        if suppressed[i]:
+            continue
+        suppressed[i + 1:] |= overlap[i, i + 1:] > match_threshold
+    return dets[~suppressed]
+
+
 class YOLOv8Model:
     def __init__(
         self,
@@ -19,7 +168,9 @@ class YOLOv8Model:
         config_path: str,
         use_gpu: bool = True,
         threshold: float = 0.5,
-        device_id: int = 0
+        device_id: int = 0,
+        batch_size: int = 8,
+        slice_min_size: int = 0
     ):
         """
         初始化 YOLOv8 模型
@@ -30,20 +181,51 @@ class YOLOv8Model:
             use_gpu (bool): 是否使用GPU
             threshold (float): 默认检测阈值
             device_id (int): GPU设备ID
+            batch_size (int): 批量推理时每次前向的最大图片数
+            slice_min_size (int): 图像长边超过该值时自动切片推理，0 表示不自动切片
         """
         # 设置设备
         self.use_gpu = use_gpu
         self.device_id = device_id
         self.threshold = threshold
+        self.batch_size = max(1, batch_size)
+        self.slice_min_size = slice_min_size
         
         # 初始化配置
         self.cfg = self._init_config(config_path, weights_path)
+
+        self._init_slice_params(self.cfg)
         
         # 初始化训练器（用于推理）
         print("Initializing Trainer...")
         self.trainer = Trainer(self.cfg, mode='test')
         self.trainer.load_weights(self.cfg.weights)
+        self.trainer.model.eval()
+
+        # 内存推理使用的预处理（TestReader 中除 Decode 以外的变换）
+        self.transforms = self._build_transforms()
+        # 默认输入尺寸，动态图模型可以按请求切换为其他尺寸（32 的倍数）
+        self.input_size = self._default_input_size()
+        self.dynamic_input = True
+        self._size_transforms = {}
+        # 同一模型实例的前向推理串行执行，避免多线程同时调用
+        self._lock = threading.Lock()
         
+    def _init_slice_params(self, cfg):
+        """从检测配置读取切片推理参数（slice_size / overlap_ratio / match_threshold / match_metric），各后端共用"""
+        self.slice_size = tuple(cfg.get('slice_size', [640, 640]))
+        self.overlap_ratio = tuple(cfg.get('overlap_ratio', [0.25, 0.25]))
+        self.match_threshold = cfg.get('match_threshold', 0.6)
+        self.match_metric = cfg.get('match_metric', 'ios')
+
+    def slice_params(self) -> Dict:
+        return {
+            'slice_size': tuple(self.slice_size),
+            'overlap_ratio': tuple(self.overlap_ratio),
+            'match_threshold': self.match_threshold,
+            'match_metric': self.match_metric,
+        }
+
     def _init_config(self, config_path: str, weights_path: str) -> AttrDict:
         """初始化配置"""        
         cfg = load_config(config_path)
@@ -64,9 +246,212 @@ class YOLOv8Model:
         check_config(cfg)
         check_gpu(cfg.use_gpu)
         check_version()
-        
+
         return cfg
-    
+
+    def _sample_transforms(self) -> List[Dict]:
+        """TestReader 中除 Decode 以外的变换"""
+        return [t for t in self.cfg['TestReader']['sample_transforms'] if 'Decode' not in t]
+
+    def _build_transforms(self, input_size: Optional[int] = None) -> Compose:
+        """根据 TestReader 构建内存预处理流程（跳过 Decode，由 _preprocess 完成解码）"""
+        sample_transforms = self._sample_transforms()
+        if input_size:
+            sample_transforms = resize_transforms(sample_transforms, input_size)
+        return Compose(sample_transforms, num_classes=self.cfg.num_classes)
+
+    def _default_input_size(self) -> int:
+        for t in self._sample_transforms():
+            if 'Resize' in t:
+                return int(max(t['Resize']['target_size']))
+        return 640
+
+    def effective_input_size(self, input_size: Optional[int] = None) -> int:
+        """实际使用的输入尺寸：静态图等固定尺寸的模型始终使用默认尺寸"""
+        if not input_size or not self.dynamic_input:
+            return self.input_size
+        return int(input_size)
+
+    def _get_transforms(self, input_size: Optional[int] = None) -> Compose:
+        input_size = self.effective_input_size(input_size)
+        if input_size == self.input_size:
+            return self.transforms
+        if input_size not in self._size_transforms:
+            self._size_transforms[input_size] = self._build_transforms(input_size)
+        return self._size_transforms[input_size]
+
+    def _preprocess(self, image: np.ndarray, input_size: Optional[int] = None) -> Dict:
+        """
+        对已解码的 BGR 图像做 TestReader 预处理
+
+        Args:
+            image (np.ndarray): OpenCV 读取的 BGR 图像
+            input_size (int, optional): 输入尺寸，默认使用配置中的尺寸
+
+        Returns:
+            Dict: 包含 image / im_shape / scale_factor 的样本
+        """
+        # 等价于 Decode：转为 RGB 并记录原图尺寸
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        elif image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+        else:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        sample = {
+            'image': image,
+            'im_shape': np.array(image.shape[:2], dtype=np.float32),
+            'scale_factor': np.array([1., 1.], dtype=np.float32),
+        }
+        return self._get_transforms(input_size)(sample)
+
+    def _forward(self, samples: List[Dict]) -> List[np.ndarray]:
+        """
+        对预处理后的样本执行一次前向推理
+
+        Args:
+            samples (List[Dict]): _preprocess 的输出
+
+        Returns:
+            List[np.ndarray]: 每张图片的检测结果，形状为 [N, 6]（class_id, score, x1, y1, x2, y2），
+                坐标已按 scale_factor 还原到原图
+        """
+        inputs = {
+            key: paddle.to_tensor(np.stack([s[key] for s in samples]))
+            for key in ('image', 'im_shape', 'scale_factor')
+        }
+        with self._lock, paddle.no_grad():
+            outs = self.trainer.model(inputs)
+        bbox = outs['bbox'].numpy()
+        bbox_num = outs['bbox_num'].numpy()
+        return np.split(bbox, np.cumsum(bbox_num)[:-1])
+
+    def predict_array(
+        self,
+        image: np.ndarray,
+        threshold: Optional[float] = None,
+    ) -> List[Dict]:
+        """
+        对内存中的 BGR 图像直接推理，不经过临时文件
+
+        Args:
+            image (np.ndarray): OpenCV 格式的 BGR 图像
+            threshold (float, optional): 检测阈值，如果为None则使用初始化时的阈值
+
+        Returns:
+            List[Dict]: 检测结果列表
+        """
+        dets = self.predict_arrays_raw([image], threshold=threshold)[0]
+        return self._detections_to_dicts(dets)
+
+    def predict_arrays(
+        self,
+        images: List[np.ndarray],
+        threshold: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        slice_infer: bool = False,
+    ) -> List[List[Dict]]:
+        """
+        批量推理内存中的 BGR 图像，每 batch_size 张图片只做一次前向
+
+        每张图片经 Resize(keep_ratio) + Pad 后均为相同尺寸，可直接拼成 [B, 3, H, W]；
+        Pad 只在右下方填充，后处理按各自的 scale_factor 即可还原到原图坐标。
+
+        Args:
+            images (List[np.ndarray]): OpenCV 格式的 BGR 图像列表
+            threshold (float, optional): 检测阈值
+            batch_size (int, optional): 每批图片数，默认使用初始化时的 batch_size
+            slice_infer (bool): 是否切片推理
+
+        Returns:
+            List[List[Dict]]: 每张图片的检测结果列表
+        """
+        return [
+            self._detections_to_dicts(dets)
+            for dets in self.predict_arrays_raw(
+                images, threshold=threshold, batch_size=batch_size, slice_infer=slice_infer)
+        ]
+
+    def predict_arrays_raw(
+        self,
+        images: List[np.ndarray],
+        threshold: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        slice_infer: bool = False,
+        slice_min_size: Optional[int] = None,
+        input_size: Optional[int] = None,
+    ) -> List[np.ndarray]:
+        """
+        批量推理并返回未转换为字典的检测数组，便于后续用 NumPy 继续筛选
+
+        Args:
+            images (List[np.ndarray]): OpenCV 格式的 BGR 图像列表
+            threshold (float, optional): 最低置信度
+            batch_size (int, optional): 每批推理单元数（图片或切片）
+            slice_infer (bool): 是否对所有图片切片推理
+            slice_min_size (int, optional): 长边超过该值的图片自动切片，默认使用初始化时的 slice_min_size
+            input_size (int, optional): 本次推理的输入尺寸，用于按负载降低分辨率
+
+        Returns:
+            List[np.ndarray]: 每张图片的 [N, 6] 检测结果，框已裁剪到图像范围内
+        """
+        draw_threshold = threshold if threshold is not None else self.threshold
+        batch_size = max(1, batch_size or self.batch_size)
+        slice_min_size = self.slice_min_size if slice_min_size is None else slice_min_size
+
+        # 展开成推理单元 (图片序号, 偏移x, 偏移y, 图像)；大图的切片只是原图的视图，不复制像素
+        units = []
+        sliced = set()
+        for idx, img in enumerate(images):
+            h, w = img.shape[:2]
+            if slice_infer or (slice_min_size and max(h, w) > slice_min_size):
+                sliced.add(idx)
+                for x, y, tw, th in slice_windows(h, w, self.slice_size, self.overlap_ratio):
+                    units.append((idx, x, y, img[y:y + th, x:x + tw]))
+            # 整图也参与推理，保证跨越切片的大目标能被完整检出
+            units.append((idx, 0, 0, img))
+
+        # 所有图片和切片混合成批，每 batch_size 个单元做一次前向
+        per_image = [[] for _ in images]
+        for start in range(0, len(units), batch_size):
+            chunk = units[start:start + batch_size]
+            outputs = self._forward([self._preprocess(unit[3], input_size) for unit in chunk])
+            for (idx, x, y, _), dets in zip(chunk, outputs):
+                dets = dets[dets[:, 1] >= draw_threshold]
+                if x or y:
+                    dets = dets.copy()
+                    dets[:, 2:6] += np.array([x, y, x, y], dtype=dets.dtype)
+                per_image[idx].append(dets)
+
+        results = []
+        for idx, img in enumerate(images):
+            dets = np.concatenate(per_image[idx]) if per_image[idx] else np.zeros((0, 6), dtype=np.float32)
+            if idx in sliced:
+                dets = merge_detections(dets, self.match_threshold, self.match_metric)
+            results.append(clip_detections(dets, img.shape))
+        return results
+
+    def predict_sliced(
+        self,
+        image: np.ndarray,
+        threshold: Optional[float] = None,
+    ) -> List[Dict]:
+        """
+        对内存中的大图做切片推理
+
+        切片按 slice_size / overlap_ratio 划分，与整图一起批量推理，
+        结果平移回原图坐标后按 match_threshold / match_metric 合并重复框。
+
+        Args:
+            image (np.ndarray): OpenCV 格式的 BGR 图像
+            threshold (float, optional): 检测阈值
+
+        Returns:
+            List[Dict]: 检测结果列表
+        """
+        dets = self.predict_arrays_raw([image], threshold=threshold, slice_infer=True)[0]
+        return self._detections_to_dicts(dets)
+
     def predict(
         self,
         image_path: str,
@@ -88,6 +473,13 @@ class YOLOv8Model:
         Returns:
             List[Dict]: 检测结果列表
         """
+        # 不保存可视化结果时切片推理走内存批量路径
+        if slice_infer and not save_result:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise FileNotFoundError(f"Image path {image_path} does not exist or cannot be decoded.")
+            return self.predict_sliced(image, threshold=threshold)
+
         # 设置阈值
         draw_threshold = threshold if threshold is not None else self.threshold
         
@@ -102,11 +494,11 @@ class YOLOv8Model:
         if slice_infer:
             results = self.trainer.slice_predict(
                 [image_path],
-                slice_size=(640, 640),
-                overlap_ratio=[0.25, 0.25],
+                slice_size=self.slice_size,
+                overlap_ratio=self.overlap_ratio,
                 combine_method='nms',
-                match_threshold=0.6,
-                match_metric='ios', 
+                match_threshold=self.match_threshold,
+                match_metric=self.match_metric, 
                 draw_threshold=draw_threshold,
                 output_dir=self.cfg.output_dir,
                 save_results=save_result,
@@ -133,7 +525,16 @@ class YOLOv8Model:
     ) -> List[Dict]:
         """
         对图片流进行推理（使用numpy数组或PIL图像）
+
+        不需要保存可视化结果时直接走内存路径，否则写临时文件交给 Trainer
         """
+        if not save_result:
+            if isinstance(image, Image.Image):
+                image = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+            if slice_infer:
+                return self.predict_sliced(image, threshold=threshold)
+            return self.predict_array(image, threshold=threshold)
+
         # 确保图像是RGB格式
         if isinstance(image, np.ndarray):
             # OpenCV图像是BGR格式，转换为RGB
@@ -165,64 +566,47 @@ class YOLOv8Model:
 
         return results
     
-    def _format_results(self, results: List[Dict], threshold: float) -> List[Dict]:
+    def _format_results(self, results: List[Dict], threshold: Optional[float]) -> List[Dict]:
         """
         格式化推理结果
-    
+
         Args:
             results (List[Dict]): 原始推理结果
-            threshold (float): 检测阈值
+            threshold (float): 检测阈值，如果为None则使用初始化时的阈值
 
         Returns:
             List[Dict]: 格式化后的结果
         """
-        formatted_results = []
-        for result in results:
-            if 'bbox' not in result:
-                continue
+        threshold = threshold if threshold is not None else self.threshold
+        arrays = [
+            np.asarray(result['bbox'], dtype=np.float32).reshape(-1, 6)
+            for result in results if 'bbox' in result and len(result['bbox']) > 0
+        ]
+        if not arrays:
+            return []
+        dets = np.concatenate(arrays)
+        dets = dets[(dets[:, 1] >= threshold) & (dets[:, 0] >= 0)]
+        return self._detections_to_dicts(dets)
+
+    def _detections_to_dicts(self, dets: np.ndarray) -> List[Dict]:
+        """把 [N, 6] 检测数组转换为结果字典列表"""
+        class_ids = dets[:, 0].astype(np.int64).tolist()
+        scores = dets[:, 1].tolist()
+        boxes = dets[:, 2:6].astype(np.int64).tolist()
+        return [
+            {
+                'bbox': box,
+                'score': score,
+                'category_id': class_id,
+                'category': self._get_category_name(class_id)
+            }
+            for class_id, score, box in zip(class_ids, scores, boxes)
+        ]
 
-            bbox_array = result['bbox']
-        
-            # 确保bbox_array是二维数组
-            if isinstance(bbox_array, (list, np.ndarray)) and len(bbox_array) > 0:
-                # 如果是一维数组，转换为二维
-                if not isinstance(bbox_array[0], (list, np.ndarray)):
-                    bbox_array = [bbox_array]
-
-                for det in bbox_array:
-                    try:
-                        class_id = int(det[0])
-                        score = float(det[1])
-                        box = det[2:6].tolist() if hasattr(det, 'tolist') else det[2:6]
-
-                        if score < threshold:
-                            continue
-                            
-                        box = [int(coord) for coord in box]
-                        formatted_results.append({
-                            'bbox': box,
-                            'score': score,
-                            'category_id': class_id,
-                            'category': self._get_category_name(class_id)
-                        })
-                    except (IndexError, TypeError, ValueError) as e:
-                        print(f"Error processing detection: {e}, detection: {det}")
-                        continue
-                        
-        return formatted_results
-    
     def _get_category_name(self, class_id: int) -> str:
         """获取类别名称"""
-        class_names = {
-            0: 'ore carrier', 
-            1: 'bulk cargo carrier', 
-            2: 'general cargo ship', 
-            3: 'container ship', 
-            4: 'fishing boat', 
-            5: 'passenger ship',
-        }
-        return class_names.get(class_id, f'unknown_{class_id}')
-    
+        return CATEGORY_NAMES.get(class_id, f'unknown_{class_id}')
+
     def batch_predict(
         self,
         image_paths: List[str],
@@ -243,7 +627,16 @@ class YOLOv8Model:
         Returns:
             List[List[Dict]]: 每张图片的检测结果列表
         """
-        return [self.predict(img, threshold, save_result, output_dir, slice_infer) for img in image_paths]
+        if save_result:
+            return [self.predict(img, threshold, save_result, output_dir, slice_infer) for img in image_paths]
+
+        images = []
+        for img_path in image_paths:
+            image = cv2.imread(img_path)
+            if image is None:
+                raise FileNotFoundError(f"Image path {img_path} does not exist or cannot be decoded.")
+            images.append(image)
+        return self.predict_arrays(images, threshold, slice_infer=slice_infer)
     
     def batch_predict_images(
         self,
@@ -265,4 +658,12 @@ class YOLOv8Model:
         Returns:
             List[List[Dict]]: 每张图片的检测结果列表
         """
-        return [self.predict_image(img, threshold, save_result, output_dir, slice_infer) for img in images]
\ No newline at end of file
+        if save_result:
+            return [self.predict_image(img, threshold, save_result, output_dir, slice_infer) for img in images]
+
+        arrays = [
+            cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+            if isinstance(img, Image.Image) else img
+            for img in images
+        ]
+        return self.predict_arrays(arrays, threshold, slice_infer=slice_infer)
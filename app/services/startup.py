@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 检测与 OCR 模型是否并行加载（两者都很慢，且互不依赖）
+MODEL_PARALLEL_LOAD = os.getenv("MODEL_PARALLEL_LOAD", "true").lower() in ("1", "true", "yes")
+# 每个输入尺寸的预热推理次数，0 表示不预热
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", 1))
+# 预热用的图片，不设置时使用合成图
+WARMUP_IMAGE = os.getenv("WARMUP_IMAGE", "")
+# 启动时是否建表（数据库不可用时服务仍可提供纯推理接口）
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# 是否启动视频任务队列的工作线程（多实例部署时可只在部分实例上开启）
+VIDEO_JOBS_ENABLED = os.getenv("VIDEO_JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class StartupState:
+    """
+    记录服务启动的各个阶段（建表、模型加载、预热），供 /health/ready 查询
+
+    所有阶段成功完成后 ready 才为 True。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.ready = False
+
+    def begin(self, name: str):
+        with self._lock:
+            self._stages[name] = {"status": "running", "started_at": time.time(), "seconds": None, "error": None}
+
+    def end(self, name: str, error: Optional[Exception] = None):
+        with self._lock:
+            stage = self._stages[name]
+            stage["status"] = "failed" if error else "done"
+            stage["seconds"] = round(time.time() - stage["started_at"], 2)
+            stage["error"] = repr(error) if error else None
+
+    def finish(self):
+        with self._lock:
+            self.finished_at = time.time()
+            self.ready = all(s["status"] == "done" for s in self._stages.values())
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "uptime": round(time.time() - self.started_at, 1),
+                "startup_seconds": round(self.finished_at - self.started_at, 2) if self.finished_at else None,
+                "stages": {
+                    name: {k: v for k, v in stage.items() if k != "started_at"}
+                    for name, stage in self._stages.items()
+                },
+            }
+
+
+startup_state = StartupState()
+
+
+def _run_stage(name: str, fn: Callable):
+    startup_state.begin(name)
+    print(f"[startup] {name} 开始")
+    try:
+        result = fn()
+    except Exception as e:
+        startup_state.end(name, e)
+        print(f"[startup] {name} 失败: {e!r}")
+        raise
+    startup_state.end(name)
+    print(f"[startup] {name} 完成")
+    return result
+
+
+def _run_parallel(stages: List[Tuple[str, Callable]], parallel: bool):
+    """执行一组互不依赖的阶段，任一失败时在全部结束后抛出第一个异常"""
+    if not parallel:
+        for name, fn in stages:
+            _run_stage(name, fn)
+        return
+    with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="startup") as executor:
+        futures = [executor.submit(_run_stage, name, fn) for name, fn in stages]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        raise errors[0]
+
+
+def init_database():
+    """创建/迁移所有业务表，并载入船号候选索引"""
+    from app.api.video_routes import init_db
+    from app.api.result_routes import init_result_table
+    from app.api.ship_id_routes import init_ship_profile_table, load_hull_index
+
+    init_db()
+    init_result_table()
+    init_ship_profile_table()
+    load_hull_index()
+
+
+def _load_warmup_image():
+    if not WARMUP_IMAGE:
+        return None
+    image = cv2.imread(WARMUP_IMAGE)
+    if image is None:
+        print(f"[startup] 预热图片无法读取: {WARMUP_IMAGE}，改用合成图")
+    return image
+
+
+def warmup_models(iterations: int = WARMUP_ITERATIONS):
+    """检测与 OCR 各推理若干次，编译/缓存推理算子"""
+    from app.api.yolov8_routes import warmup_yolov8
+    from app.api.ppocr_routes import warmup_ocr
+
+    image = _load_warmup_image()
+    sizes = warmup_yolov8(image=image, iterations=iterations)
+    print(f"[startup] 检测模型已预热输入尺寸 {sizes}")
+    warmup_ocr(image=image, iterations=iterations)
+
+
+def run_startup():
+    """
+    服务启动流程：建表与模型加载并行执行，全部完成后再预热，最后开始处理排队的视频任务
+
+    在后台线程中运行，失败不会阻止服务启动，但 /health/ready 会一直返回 503。
+    """
+    from app.api.yolov8_routes import init_yolov8
+    from app.api.ppocr_routes import init_ocr
+    from app.api.video_routes import start_video_jobs
+
+    model_stages = [("load_yolov8", init_yolov8), ("load_ocr", init_ocr)]
+    try:
+        # 建表与模型加载互不依赖，总是并行；两个模型之间是否并行由 MODEL_PARALLEL_LOAD 控制
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as executor:
+            if INIT_DB_ON_STARTUP:
+                executor.submit(_run_stage, "init_db", init_database)
+            models_loaded = executor.submit(_run_parallel, model_stages, MODEL_PARALLEL_LOAD)
+            models_loaded.result()
+        if WARMUP_ITERATIONS > 0:
+            _run_stage("warmup", warmup_models)
+        if VIDEO_JOBS_ENABLED:
+            _run_stage("video_jobs", start_video_jobs)
+    except Exception:
+        pass  # 失败原因已记录在 startup_state 中
+    finally:
+        startup_state.finish()
+        snapshot = startup_state.snapshot()
+        print(f"[startup] 启动完成, ready={snapshot['ready']}, 耗时 {snapshot['startup_seconds']}s")
+
+
+def start_background_startup() -> threading.Thread:
+    thread = threading.Thread(target=run_startup, name="startup", daemon=True)
+    thread.start()
+    return thread
+
+
+def shutdown():
+    """停止领取视频任务，停止检测调度器与推理进程池"""
+    from app.api.video_routes import stop_video_jobs
+    from app.api.yolov8_routes import shutdown_yolov8
+    from app.utils.worker_pool import shutdown_worker_pool
+
+    stop_video_jobs()
+    shutdown_yolov8()
+    shutdown_worker_pool()
@@ -0,0 +1,91 @@
+import threading
+from typing import Dict, List, Optional, Sequence
+
+
+class ResolutionPolicy:
+    """
+    按负载选择检测输入尺寸
+
+    - 队列越深，选用的输入尺寸越小（depth_thresholds 与 sizes 从大到小一一对应）
+    - 请求带有延迟预算时，根据各尺寸实测的批次耗时（指数滑动平均）选择不超过预算的最大尺寸
+    两者取较小的尺寸。
+    """
+
+    def __init__(
+        self,
+        sizes: Sequence[int] = (640, 480, 320),
+        depth_thresholds: Sequence[int] = (4, 12),
+        ema_alpha: float = 0.2,
+    ):
+        """
+        Args:
+            sizes (Sequence[int]): 可选输入尺寸，需为 32 的倍数
+            depth_thresholds (Sequence[int]): 队列深度达到 depth_thresholds[i] 时降到 sizes[i + 1]
+            ema_alpha (float): 耗时滑动平均系数
+        """
+        self.sizes = sorted({int(s) for s in sizes}, reverse=True)
+        self.depth_thresholds = list(depth_thresholds)[:len(self.sizes) - 1]
+        self.ema_alpha = ema_alpha
+        self._latency_ms: Dict[int, float] = {}
+        self._chosen: Dict[int, int] = {size: 0 for size in self.sizes}
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self) -> int:
+        return self.sizes[0]
+
+    def _size_for_depth(self, queue_depth: int) -> int:
+        level = sum(1 for thr in self.depth_thresholds if queue_depth >= thr)
+        return self.sizes[level]
+
+    def _estimate_ms(self, size: int) -> Optional[float]:
+        """没有实测值时按输入面积从最近的已测尺寸换算"""
+        if size in self._latency_ms:
+            return self._latency_ms[size]
+        if not self._latency_ms:
+            return None
+        known = min(self._latency_ms, key=lambda s: abs(s - size))
+        return self._latency_ms[known] * (size / known) ** 2
+
+    def _size_for_budget(self, latency_budget_ms: float) -> int:
+        for size in self.sizes:
+            estimate = self._estimate_ms(size)
+            if estimate is None or estimate <= latency_budget_ms:
+                return size
+        return self.sizes[-1]
+
+    def choose(self, queue_depth: int = 0, latency_budget_ms: Optional[float] = None, adaptive: bool = True) -> int:
+        """
+        选择本批次的输入尺寸
+
+        Args:
+            queue_depth (int): 当前排队的请求数
+            latency_budget_ms (float, optional): 批次内最严格的延迟预算
+            adaptive (bool): 是否按队列深度降级
+        """
+        with self._lock:
+            size = self._size_for_depth(queue_depth) if adaptive else self.max_size
+            if latency_budget_ms:
+                size = min(size, self._size_for_budget(latency_budget_ms))
+            self._chosen[size] += 1
+            return size
+
+    def observe(self, size: int, elapsed_ms: float):
+        """记录某个尺寸一次批次推理的耗时"""
+        with self._lock:
+            previous = self._latency_ms.get(size)
+            self._latency_ms[size] = elapsed_ms if previous is None else \
+                previous + self.ema_alpha * (elapsed_ms - previous)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sizes": self.sizes,
+                "depth_thresholds": self.depth_thresholds,
+                "latency_ms": {str(k): round(v, 2) for k, v in self._latency_ms.items()},
+                "chosen": {str(k): v for k, v in self._chosen.items()},
+            }
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
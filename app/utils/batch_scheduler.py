@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatchScheduler:
+    """
+    动态微批调度器
+
+    多个调用方各自 submit 单个输入并拿到 Future，后台线程把排队中的请求合并成微批，
+    交给 batch_fn 一次处理后再把结果逐个回填到对应的 Future。
+    一个批次在凑满 max_batch_size 或最早的请求等待超过 max_wait_ms 时立即执行。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        num_workers: int = 1,
+        name: str = "batch",
+    ):
+        """
+        Args:
+            batch_fn (Callable): 批处理函数，输入列表，返回等长的结果列表
+            max_batch_size (int): 单个批次的最大请求数
+            max_wait_ms (float): 最早请求在队列中的最长等待时间（毫秒）
+            num_workers (int): 并发执行批次的线程数
+            name (str): 调度器名称，用于线程名和日志
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.num_workers = max(1, num_workers)
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._batches = 0
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._total_wait = 0.0
+        self._total_batch_time = 0.0
+
+    def start(self):
+        """启动后台批处理线程"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止后台线程，队列中尚未执行的请求会以异常结束"""
+        self._running = False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError(f"{self.name} scheduler stopped"))
+
+    def submit(self, data: Any) -> Future:
+        """
+        提交一个输入，返回对应结果的 Future
+
+        Args:
+            data (Any): 单个输入（例如一帧图像）
+
+        Returns:
+            Future: 批次执行完成后被设置结果或异常
+        """
+        if not self._running:
+            raise RuntimeError(f"{self.name} scheduler is not running")
+        future = Future()
+        self._queue.put((data, future, time.perf_counter()))
+        with self._stats_lock:
+            self._submitted += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        return future
+
+    def queue_depth(self) -> int:
+        """当前排队等待的请求数"""
+        return self._queue.qsize()
+
+    def _collect_batch(self) -> Optional[List]:
+        """阻塞等待第一个请求，然后在等待上限内尽量凑满一个批次"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 把停止信号放回去，当前批次处理完后再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        while self._running:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            start = time.perf_counter()
+            inputs = [item[0] for item in batch]
+            futures = [item[1] for item in batch]
+            try:
+                outputs = self.batch_fn(inputs)
+                if len(outputs) != len(inputs):
+                    raise RuntimeError(
+                        f"{self.name} batch_fn returned {len(outputs)} results for {len(inputs)} inputs"
+                    )
+            except Exception as e:
+                print(f"{self.name} 批处理失败: {e}")
+                for future in futures:
+                    future.set_exception(e)
+                with self._stats_lock:
+                    self._failed += len(batch)
+                continue
+            end = time.perf_counter()
+
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
+
+            with self._stats_lock:
+                self._completed += len(batch)
+                self._batches += 1
+                self._batch_sizes[len(batch)] += 1
+                self._total_wait += sum(start - item[2] for item in batch)
+                self._total_batch_time += end - start
+
+    def stats(self) -> Dict:
+        """返回队列深度与批大小等统计信息"""
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "running": self._running,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "num_workers": self.num_workers,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "batches": self._batches,
+                "avg_batch_size": round(self._completed / self._batches, 2) if self._batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "avg_queue_wait_ms": round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                "avg_batch_time_ms": round(self._total_batch_time / self._batches * 1000, 2) if self._batches else 0.0,
+            }
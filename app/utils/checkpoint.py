@@ -0,0 +1,85 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class CheckpointMarker:
+    """
+    流水线中随数据传递的检查点标记
+
+    由按帧顺序处理的阶段在处理完 frame_index 之后发出，state 是该时刻需要保存的状态（例如跟踪器）。
+    """
+
+    def __init__(self, frame_index: int, timestamp: float, state: Dict):
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+        self.state = state
+        self.required: Optional[int] = None  # 提交前必须已持久化的输出数量
+
+
+class CheckpointWatermark:
+    """
+    按持久化水位提交检查点
+
+    产生输出的阶段按顺序为每个输出分配序号（next_seq），并在检查点标记到达时登记（register）；
+    写库阶段可能乱序完成，done() 记录已持久化的序号，连续完成的最大序号（水位）达到登记时的输出数量后，
+    说明检查点之前的输出都已写库，调用 commit_fn 保存检查点。
+    多个检查点同时就绪时只提交最新的一个。
+    """
+
+    def __init__(self, commit_fn: Callable[[CheckpointMarker], None]):
+        """
+        Args:
+            commit_fn (Callable): 保存检查点，在调用 register() 或 done() 的线程中执行
+        """
+        self.commit_fn = commit_fn
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._issued = 0
+        self._watermark = 0
+        self._done = set()
+        self._pending: List[CheckpointMarker] = []
+        self._committed = 0
+        self._last: Optional[CheckpointMarker] = None
+
+    def next_seq(self) -> int:
+        with self._lock:
+            self._issued += 1
+            return self._issued
+
+    def register(self, marker: CheckpointMarker):
+        with self._lock:
+            marker.required = self._issued
+            self._pending.append(marker)
+        self._commit_ready()
+
+    def done(self, seqs: Iterable[int]):
+        with self._lock:
+            self._done.update(seqs)
+            while self._watermark + 1 in self._done:
+                self._watermark += 1
+                self._done.discard(self._watermark)
+        self._commit_ready()
+
+    def _commit_ready(self):
+        with self._commit_lock:
+            with self._lock:
+                ready = [marker for marker in self._pending if marker.required <= self._watermark]
+                if not ready:
+                    return
+                self._pending = self._pending[len(ready):]
+            marker = ready[-1]
+            self.commit_fn(marker)
+            with self._lock:
+                self._committed += 1
+                self._last = marker
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "issued": self._issued,
+                "persisted": self._watermark,
+                "pending_checkpoints": len(self._pending),
+                "committed": self._committed,
+                "last_frame": self._last.frame_index if self._last is not None else None,
+                "last_timestamp": round(self._last.timestamp, 3) if self._last is not None else None,
+            }
@@ -0,0 +1,19 @@
+# 已有表的增量字段迁移（CREATE TABLE IF NOT EXISTS 不会给旧表补字段）
+
+def add_column_if_missing(cursor, table: str, column: str, definition: str):
+    """
+    如果表中没有该字段则添加
+
+    Args:
+        cursor: MySQL 游标
+        table (str): 表名
+        column (str): 字段名
+        definition (str): 字段定义，例如 "TEXT NULL"
+    """
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        print(f"表 {table} 新增字段 {column}")
@@ -0,0 +1,157 @@
+import os
+import cv2
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SAMPLER_GRAB = "grab"
+SAMPLER_SEEK = "seek"
+SAMPLER_AUTO = "auto"
+
+# 抽帧方式：grab / seek / auto
+FRAME_SAMPLER_MODE = os.getenv("FRAME_SAMPLER_MODE", SAMPLER_AUTO).lower()
+# auto 模式下抽帧间隔达到该帧数时使用跳转，否则逐帧 grab（跳转需要从前一个关键帧开始解码，间隔太短反而更慢）
+FRAME_SAMPLER_SEEK_MIN_GAP = int(os.getenv("FRAME_SAMPLER_SEEK_MIN_GAP", 100))
+
+
+class FrameSampler:
+    """
+    按固定时间间隔从视频中抽帧
+
+    - grab：逐帧 grab() 只推进解码，只有需要的帧才 retrieve()，省掉其余帧的颜色转换和拷贝
+    - seek：直接跳转到目标帧号再读取，间隔远大于关键帧间隔时可以跳过大部分解码
+    - auto：间隔不小于 seek_min_gap 帧时用 seek，否则用 grab
+
+    跳转失败（部分容器/流不支持随机访问）时自动退回 grab 模式继续。
+    迭代得到 (帧号, 时间戳秒, BGR 帧)。
+    """
+
+    def __init__(
+        self,
+        cap: cv2.VideoCapture,
+        interval_seconds: float,
+        fps: Optional[float] = None,
+        mode: Optional[str] = None,
+        start_frame: int = 0,
+        seek_min_gap: Optional[int] = None,
+        end_frame: Optional[int] = None,
+    ):
+        """
+        Args:
+            cap (cv2.VideoCapture): 已打开的视频
+            interval_seconds (float): 抽帧间隔（秒）
+            fps (float, optional): 帧率，默认从视频读取，读取失败时为 25
+            mode (str, optional): grab / seek / auto，默认读取 FRAME_SAMPLER_MODE
+            start_frame (int): 从该帧号开始抽帧，向上对齐到抽帧网格（step 的整数倍），从中间恢复时抽到的帧与从头处理相同
+            seek_min_gap (int, optional): auto 模式使用 seek 的最小间隔帧数
+            end_frame (int, optional): 只抽取该帧号之前的帧（不含），用于分段处理，默认到视频结尾
+        """
+        self.cap = cap
+        if not fps:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps or fps <= 0 or np.isnan(fps):
+            fps = 25.0
+        self.fps = fps
+        self.step = max(1, int(round(interval_seconds * fps)))
+        self.start_frame = -(-max(0, int(start_frame)) // self.step) * self.step
+        self.end_frame = end_frame
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+        mode = (mode or FRAME_SAMPLER_MODE).lower()
+        if mode == SAMPLER_AUTO:
+            gap = FRAME_SAMPLER_SEEK_MIN_GAP if seek_min_gap is None else seek_min_gap
+            mode = SAMPLER_SEEK if self.step >= gap else SAMPLER_GRAB
+        if mode not in (SAMPLER_GRAB, SAMPLER_SEEK):
+            raise ValueError(f"Unknown frame sampler mode: {mode}")
+        self.mode = mode
+
+        self.grabbed = 0
+        self.retrieved = 0
+        self.seeks = 0
+        self.fallback = False
+
+    def __iter__(self) -> Iterator[Tuple[int, float, np.ndarray]]:
+        if self.mode == SAMPLER_SEEK:
+            yield from self._iter_seek()
+            return
+        position = 0
+        if self.start_frame > 0 and self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame) and \
+                abs(self.cap.get(cv2.CAP_PROP_POS_FRAMES) - self.start_frame) <= 1:
+            # 从中间开始时先跳到起始帧，不必从头 grab
+            self.seeks += 1
+            position = self.start_frame
+        elif self.start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        yield from self._iter_grab(position=position, target=self.start_frame)
+
+    def _before_end(self, target: int) -> bool:
+        return self.end_frame is None or target < self.end_frame
+
+    def _iter_grab(self, position: int, target: int) -> Iterator[Tuple[int, float, np.ndarray]]:
+        """从当前解码位置 position 起逐帧 grab，到达 target 时 retrieve"""
+        while self._before_end(target):
+            if not self.cap.grab():
+                return
+            self.grabbed += 1
+            if position == target:
+                ok, frame = self.cap.retrieve()
+                if not ok:
+                    return
+                self.retrieved += 1
+                yield position, position / self.fps, frame
+                target += self.step
+            position += 1
+
+    def _iter_seek(self) -> Iterator[Tuple[int, float, np.ndarray]]:
+        target = self.start_frame
+        position = 0  # 下一次 read 将返回的帧号
+        while (self.frame_count <= 0 or target < self.frame_count) and self._before_end(target):
+            if target != position:
+                if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, target) or \
+                        abs(self.cap.get(cv2.CAP_PROP_POS_FRAMES) - target) > 1:
+                    # 不支持随机访问：从头用 grab 方式继续
+                    print(f"视频不支持按帧跳转，改用 grab 抽帧（目标帧 {target}）")
+                    self.fallback = True
+                    self.mode = SAMPLER_GRAB
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    yield from self._iter_grab(position=0, target=target)
+                    return
+                self.seeks += 1
+            ok, frame = self.cap.read()
+            if not ok:
+                return
+            self.grabbed += 1
+            self.retrieved += 1
+            yield target, target / self.fps, frame
+            position = target + 1
+            target += self.step
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "fps": round(self.fps, 3),
+            "step": self.step,
+            "grabbed": self.grabbed,
+            "retrieved": self.retrieved,
+            "seeks": self.seeks,
+            "fallback": self.fallback,
+        }
+
+
+def split_frame_range(frame_count: int, step: int, parts: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    把 [0, frame_count) 按抽帧网格切成最多 parts 段，返回 [(起始帧, 结束帧), ...]
+
+    分段边界都是 step 的整数倍，各段用 FrameSampler(start_frame, end_frame) 抽到的帧合起来与不分段时完全相同；
+    每段的抽帧数相差不超过 1。frame_count 只是容器给出的估计值（常常偏少），
+    最后一段的结束帧为 None，与不分段时一样一直读到解码失败为止。
+    """
+    step = max(1, step)
+    samples = -(-max(0, frame_count) // step)
+    if samples == 0:
+        return []
+    parts = max(1, min(parts, samples))
+    starts = [samples * i // parts * step for i in range(parts)]
+    return list(zip(starts, starts[1:] + [None]))
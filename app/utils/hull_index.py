@@ -0,0 +1,126 @@
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 船号中常见的分隔符，比较前去掉
+_SEPARATORS = re.compile(r"[\s\-_.·•,，。:：/\\|]+")
+
+
+def normalize_hull_number(text: str) -> str:
+    """全角转半角、转大写并去掉空白和分隔符，"浙岱渔 03821" 与 "浙岱渔-03821" 归一化后相同"""
+    return _SEPARATORS.sub("", unicodedata.normalize("NFKC", text or "")).upper()
+
+
+def _bigrams(key: str) -> Set[str]:
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class HullNumberIndex:
+    """
+    船号候选索引
+
+    预先载入船舶档案中的全部船号，按归一化后的字符二元组建倒排索引。
+    OCR 文本先查完全相同的归一化船号；否则只对共享二元组最多的少量候选计算相似度，
+    不再对全部档案逐条做子串/相似度扫描。
+    """
+
+    def __init__(self, max_candidates: int = 20):
+        """
+        Args:
+            max_candidates (int): 参与相似度计算的最多候选数
+        """
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        # 归一化船号 -> 原始船号集合：档案只在原始船号上唯一，"AB-123" 与 "AB 123" 共用一个键
+        self._keys: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = defaultdict(set)  # 二元组 -> 归一化船号集合
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _add(self, ship_id: str):
+        key = normalize_hull_number(ship_id)
+        if not key:
+            return
+        ship_ids = self._keys.get(key)
+        if ship_ids is not None:
+            ship_ids.add(ship_id)
+            return
+        self._keys[key] = {ship_id}
+        for gram in _bigrams(key):
+            self._grams[gram].add(key)
+
+    def _remove(self, ship_id: str):
+        key = normalize_hull_number(ship_id)
+        ship_ids = self._keys.get(key)
+        if ship_ids is None:
+            return
+        ship_ids.discard(ship_id)
+        # 还有其他原始船号归一化到同一个键时保留该键
+        if ship_ids:
+            return
+        del self._keys[key]
+        for gram in _bigrams(key):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def _representative(self, key: str) -> str:
+        """同一归一化键下有多个原始船号时固定返回最小的一个"""
+        return min(self._keys[key])
+
+    def load(self, ship_ids: Iterable[str]):
+        """用给定船号替换索引的全部内容"""
+        with self._lock:
+            self._keys.clear()
+            self._grams.clear()
+            for ship_id in ship_ids:
+                self._add(ship_id)
+
+    def add(self, ship_id: str):
+        with self._lock:
+            self._add(ship_id)
+
+    def remove(self, ship_id: str):
+        with self._lock:
+            self._remove(ship_id)
+
+    def replace(self, old_ship_id: str, new_ship_id: str):
+        with self._lock:
+            self._remove(old_ship_id)
+            self._add(new_ship_id)
+
+    def search(self, text: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        返回与 text 最相似的船号
+
+        Returns:
+            List[Tuple[str, float]]: (原始船号, 相似度 0~1)，按相似度从高到低
+        """
+        query = normalize_hull_number(text)
+        if not query:
+            return []
+        with self._lock:
+            if query in self._keys:
+                return [(self._representative(query), 1.0)]
+            shared = Counter()
+            for gram in _bigrams(query):
+                shared.update(self._grams.get(gram, ()))
+            candidates = [(key, self._representative(key)) for key, _ in shared.most_common(self.max_candidates)]
+
+        scored = [(ship_id, SequenceMatcher(None, query, key).ratio()) for key, ship_id in candidates]
+        scored = [item for item in scored if item[1] >= min_score]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def match(self, text: str, min_score: float = 0.8) -> Optional[Tuple[str, float]]:
+        """返回相似度不低于 min_score 的最佳船号，没有时返回 None"""
+        results = self.search(text, limit=1, min_score=min_score)
+        return results[0] if results else None
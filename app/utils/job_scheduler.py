@@ -0,0 +1,159 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class JobScheduler:
+    """
+    持久化任务队列的工作线程池
+
+    队列本身保存在外部存储中（例如数据库表），调度器只负责用固定数量的工作线程领取并执行任务：
+    claim_fn() 原子地领取优先级最高的一个排队任务并标记为运行中，没有任务时返回 None。
+    有新任务入队时调用 notify() 立即唤醒空闲线程，否则每 poll_interval 秒轮询一次（兼容其他进程入队的任务）。
+    运行中的任务通过传给 run_fn 的 threading.Event 协作取消。
+    设置 heartbeat_fn 时每 heartbeat_interval 秒用本进程正在执行的任务ID调用一次（列表可能为空），
+    用于在存储中刷新任务的心跳，让其他进程能识别出已经失联的任务。
+    """
+
+    def __init__(
+        self,
+        claim_fn: Callable[[], Optional[Tuple[Any, Tuple]]],
+        run_fn: Callable[..., None],
+        workers: int = 1,
+        poll_interval: float = 5.0,
+        name: str = "job",
+        heartbeat_fn: Optional[Callable[[List[Any]], None]] = None,
+        heartbeat_interval: float = 15.0,
+    ):
+        """
+        Args:
+            claim_fn (Callable): 领取任务，返回 (任务ID, run_fn 的位置参数) 或 None
+            run_fn (Callable): 执行任务 run_fn(*args, cancel_event=event)
+            workers (int): 同时执行的任务数
+            poll_interval (float): 空闲时轮询队列的间隔（秒）
+            name (str): 调度器名称，用于线程名和日志
+            heartbeat_fn (Callable, optional): 心跳 heartbeat_fn(正在执行的任务ID列表)
+            heartbeat_interval (float): 心跳间隔（秒）
+        """
+        self.claim_fn = claim_fn
+        self.run_fn = run_fn
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.name = name
+        self.heartbeat_fn = heartbeat_fn
+        self.heartbeat_interval = heartbeat_interval
+
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._running: Dict[Any, Tuple[threading.Event, float]] = {}
+        self._claimed = 0
+        self._finished = 0
+        self._errors = 0
+        self._cancel_requests = 0
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.heartbeat_fn is not None:
+            threading.Thread(target=self._heartbeat, name=f"{self.name}-heartbeat", daemon=True).start()
+
+    def stop(self):
+        """
+        停止领取新任务
+
+        不等待、也不取消正在执行的任务：进程退出后它们在存储中仍是运行中状态，由下次启动时重新入队。
+        """
+        self._stopping = True
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads) and not self._stopping
+
+    def notify(self):
+        """有新任务入队，唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def cancel(self, job_id: Any) -> bool:
+        """请求取消本进程中正在执行的任务，返回该任务是否在运行"""
+        with self._lock:
+            entry = self._running.get(job_id)
+            if entry is None:
+                return False
+            self._cancel_requests += 1
+        entry[0].set()
+        return True
+
+    def is_running(self, job_id: Any) -> bool:
+        with self._lock:
+            return job_id in self._running
+
+    def _claim(self) -> Optional[Tuple[Any, Tuple]]:
+        try:
+            return self.claim_fn()
+        except Exception as e:
+            print(f"{self.name} 领取任务失败: {e}")
+            return None
+
+    def _heartbeat(self):
+        # 停止领取后，仍在执行的任务继续发送心跳，直到全部结束
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                job_ids = list(self._running)
+            if self._stopping and not job_ids:
+                return
+            try:
+                self.heartbeat_fn(job_ids)
+            except Exception as e:
+                print(f"{self.name} 心跳失败: {e}")
+
+    def _worker(self):
+        while not self._stopping:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, args = job
+            cancel_event = threading.Event()
+            with self._lock:
+                self._claimed += 1
+                self._running[job_id] = (cancel_event, time.time())
+            print(f"{self.name} 开始执行任务 {job_id}")
+            try:
+                self.run_fn(*args, cancel_event=cancel_event)
+            except Exception as e:
+                print(f"{self.name} 任务 {job_id} 异常退出: {e}")
+                with self._lock:
+                    self._errors += 1
+            finally:
+                with self._lock:
+                    self._running.pop(job_id, None)
+                    self._finished += 1
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "name": self.name,
+                "running": self.running,
+                "workers": self.workers,
+                "busy_workers": len(self._running),
+                "running_jobs": {
+                    str(job_id): {"seconds": round(now - started_at, 1), "cancelling": event.is_set()}
+                    for job_id, (event, started_at) in self._running.items()
+                },
+                "claimed": self._claimed,
+                "finished": self._finished,
+                "errors": self._errors,
+                "cancel_requests": self._cancel_requests,
+            }
@@ -0,0 +1,155 @@
+import os
+import threading
+import cv2
+import numpy as np
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MOTION_DIFF = "diff"
+MOTION_HIST = "hist"
+
+# 判定结果的原因
+REASON_FIRST = "first"
+REASON_CHANGED = "changed"
+REASON_REFRESH = "refresh"
+REASON_STATIC = "static"
+REASON_DISABLED = "disabled"
+
+
+class MotionGate:
+    """
+    检测前的场景变化门控
+
+    把帧缩小到 width 像素宽的模糊灰度图，与上一次实际推理的帧比较：
+    - diff：灰度差超过 pixel_threshold 的像素占比不低于 area_threshold 视为有变化
+    - hist：32 级灰度直方图的 Bhattacharyya 距离不低于 hist_threshold 视为有变化
+
+    与“上一次推理的帧”而不是“上一帧”比较，缓慢的累积变化最终也会触发推理；
+    距上一次推理超过 refresh_seconds 时无论是否变化都强制推理一次。
+    一个门控对应一路视频（一个任务），不能在不同视频之间共用。
+    """
+
+    def __init__(
+        self,
+        method: str = MOTION_DIFF,
+        width: int = 160,
+        pixel_threshold: float = 25.0,
+        area_threshold: float = 0.002,
+        hist_threshold: float = 0.05,
+        refresh_seconds: float = 30.0,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            method (str): diff 或 hist
+            width (int): 比较用缩略图的宽度
+            pixel_threshold (float): diff 方法中单个像素灰度差的阈值
+            area_threshold (float): diff 方法中变化像素占比的阈值
+            hist_threshold (float): hist 方法中直方图距离的阈值
+            refresh_seconds (float): 强制推理的间隔（视频时间，秒），0 表示不强制
+            enabled (bool): 关闭时每帧都推理
+        """
+        if method not in (MOTION_DIFF, MOTION_HIST):
+            raise ValueError(f"Unknown motion gate method: {method}")
+        self.method = method
+        self.width = max(8, width)
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.hist_threshold = hist_threshold
+        self.refresh_seconds = refresh_seconds
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._reference = None
+        self._reference_time: Optional[float] = None
+        self._inferred = 0
+        self._skipped = 0
+        self._reasons = Counter()
+
+    def _signature(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        h, w = gray.shape[:2]
+        height = max(1, int(round(h * self.width / max(w, 1))))
+        small = cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        if self.method == MOTION_HIST:
+            hist = cv2.calcHist([small], [0], None, [32], [0, 256])
+            return cv2.normalize(hist, hist).flatten()
+        return small
+
+    def _score(self, signature: np.ndarray) -> float:
+        if self.method == MOTION_HIST:
+            return float(cv2.compareHist(self._reference, signature, cv2.HISTCMP_BHATTACHARYYA))
+        if self._reference.shape != signature.shape:
+            return 1.0
+        return float(np.count_nonzero(cv2.absdiff(self._reference, signature) > self.pixel_threshold)) / signature.size
+
+    def _threshold(self) -> float:
+        return self.hist_threshold if self.method == MOTION_HIST else self.area_threshold
+
+    def check(self, frame: np.ndarray, timestamp: float) -> Tuple[bool, str, float]:
+        """
+        Args:
+            frame (np.ndarray): BGR 帧（或 ROI 区域）
+            timestamp (float): 帧在视频中的时间（秒）
+
+        Returns:
+            Tuple[bool, str, float]: (是否需要推理, 原因, 变化评分)
+        """
+        if not self.enabled:
+            with self._lock:
+                self._inferred += 1
+                self._reasons[REASON_DISABLED] += 1
+            return True, REASON_DISABLED, 0.0
+
+        signature = self._signature(frame)
+        with self._lock:
+            if self._reference is None:
+                infer, reason, score = True, REASON_FIRST, 1.0
+            else:
+                score = self._score(signature)
+                if score >= self._threshold():
+                    infer, reason = True, REASON_CHANGED
+                elif self.refresh_seconds > 0 and timestamp - self._reference_time >= self.refresh_seconds:
+                    infer, reason = True, REASON_REFRESH
+                else:
+                    infer, reason = False, REASON_STATIC
+
+            if infer:
+                self._reference = signature
+                self._reference_time = timestamp
+                self._inferred += 1
+            else:
+                self._skipped += 1
+            self._reasons[reason] += 1
+        return infer, reason, round(score, 4)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._inferred + self._skipped
+            return {
+                "enabled": self.enabled,
+                "method": self.method,
+                "threshold": self._threshold(),
+                "refresh_seconds": self.refresh_seconds,
+                "inferred": self._inferred,
+                "skipped": self._skipped,
+                "skip_rate": round(self._skipped / total, 4) if total else 0.0,
+                "reasons": dict(self._reasons),
+            }
+
+
+def create_motion_gate() -> MotionGate:
+    """按环境变量创建场景变化门控（每个视频任务/视频流各创建一个）"""
+    return MotionGate(
+        method=os.getenv("MOTION_GATE_METHOD", MOTION_DIFF).lower(),
+        width=int(os.getenv("MOTION_GATE_WIDTH", 160)),
+        pixel_threshold=float(os.getenv("MOTION_GATE_PIXEL_THRESHOLD", 25)),
+        area_threshold=float(os.getenv("MOTION_GATE_AREA_THRESHOLD", 0.002)),
+        hist_threshold=float(os.getenv("MOTION_GATE_HIST_THRESHOLD", 0.05)),
+        refresh_seconds=float(os.getenv("MOTION_GATE_REFRESH_SECONDS", 30)),
+        enabled=os.getenv("MOTION_GATE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def dhash(image: np.ndarray, hash_size: int = 8, margin: float = 2.0) -> int:
+    """
+    差值哈希（dHash）
+
+    灰度化后缩放到 (hash_size + 1) x hash_size，拉伸到 0~255 消除曝光差异，
+    再比较每行相邻像素的明暗得到 hash_size² 位整数。水面、天空等平坦区域相邻像素几乎相等，
+    只有差值超过 margin 才记为 1，避免噪声让这些位来回翻转。
+    对缩放、轻微平移、亮度和压缩噪声不敏感，相邻抽帧中同一艘停泊船的裁剪图哈希距离通常只有几位。
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray.astype(np.float32), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    low, high = float(small.min()), float(small.max())
+    if high > low:
+        small = (small - low) * (255.0 / (high - low))
+    bits = (small[:, 1:] - small[:, :-1] > margin).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class PerceptualHashCache:
+    """
+    以裁剪图感知哈希为键的 OCR 结果缓存
+
+    - 汉明距离不超过 max_distance 的哈希视为同一张图（先查完全相同的键，再线性扫描近似键）
+    - 宽高比差异过大、或作用域（如视频ID）不同的裁剪图不会互相命中
+    - 超过 max_entries 时淘汰最久未使用的条目，超过 ttl 秒的条目视为过期
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 300.0,
+        max_distance: int = 4,
+        hash_size: int = 8,
+        max_aspect_diff: float = 0.2,
+    ):
+        """
+        Args:
+            max_entries (int): 最大条目数
+            ttl (float): 条目有效期（秒），0 表示不过期
+            max_distance (int): 允许的最大汉明距离，0 表示只命中完全相同的哈希
+            hash_size (int): dHash 边长，哈希位数为其平方
+            max_aspect_diff (float): 允许的宽高比差异（对数），防止形状不同的裁剪图误命中
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.max_aspect_diff = max_aspect_diff
+        self._entries: "OrderedDict[Tuple[Any, int], Tuple[float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._exact_hits = 0
+        self._near_hits = 0
+        self._lru_evictions = 0
+        self._ttl_evictions = 0
+
+    def make_key(self, image: np.ndarray, scope: Any = None) -> Tuple[Any, int, float]:
+        """
+        返回 (作用域, 哈希, 对数宽高比)，供 get/put 使用
+
+        dHash 分辨不出船号中个别字符的差异，按视频/请求划分作用域可以避免不同来源的相似船舶互相命中。
+        """
+        h, w = image.shape[:2]
+        return scope, dhash(image, self.hash_size), math.log(max(w, 1) / max(h, 1))
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def _find(self, scope: Any, key: int, aspect: float, now: float) -> Optional[Tuple[Any, int]]:
+        entry = self._entries.get((scope, key))
+        if entry is not None and abs(entry[1] - aspect) <= self.max_aspect_diff:
+            if not self._expired(entry[0], now):
+                self._exact_hits += 1
+                return scope, key
+        if self.max_distance <= 0:
+            return None
+
+        best_key, best_distance = None, self.max_distance + 1
+        for other, (created_at, other_aspect, _) in self._entries.items():
+            if other[0] != scope or other[1] == key or abs(other_aspect - aspect) > self.max_aspect_diff \
+                    or self._expired(created_at, now):
+                continue
+            distance = hamming_distance(key, other[1])
+            if distance < best_distance:
+                best_key, best_distance = other, distance
+        if best_key is not None:
+            self._near_hits += 1
+        return best_key
+
+    def get(self, cache_key: Tuple[Any, int, float]) -> Optional[Any]:
+        scope, key, aspect = cache_key
+        now = time.time()
+        with self._lock:
+            self._lookups += 1
+            found = self._find(scope, key, aspect, now)
+            if found is None:
+                return None
+            self._entries.move_to_end(found)
+            return self._entries[found][2]
+
+    def put(self, cache_key: Tuple[Any, int, float], value: Any):
+        scope, key, aspect = cache_key
+        now = time.time()
+        with self._lock:
+            self._entries[(scope, key)] = (now, aspect, value)
+            self._entries.move_to_end((scope, key))
+            self._evict(now)
+
+    def _evict(self, now: float):
+        # 从最久未使用的一端清理过期条目；排在后面的过期条目查找时会被忽略，最终按 LRU 淘汰
+        while self._entries:
+            oldest_key, (created_at, _, _) = next(iter(self._entries.items()))
+            if not self._expired(created_at, now):
+                break
+            del self._entries[oldest_key]
+            self._ttl_evictions += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._lru_evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self._exact_hits + self._near_hits
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "max_distance": self.max_distance,
+                "lookups": self._lookups,
+                "hits": hits,
+                "exact_hits": self._exact_hits,
+                "near_hits": self._near_hits,
+                "misses": self._lookups - hits,
+                "hit_rate": round(hits / self._lookups, 4) if self._lookups else 0.0,
+                "lru_evictions": self._lru_evictions,
+                "ttl_evictions": self._ttl_evictions,
+            }
+
+
+def create_ocr_cache() -> Optional[PerceptualHashCache]:
+    """按环境变量创建 OCR 结果缓存，OCR_CACHE_ENABLED 为 false 时返回 None"""
+    if os.getenv("OCR_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return PerceptualHashCache(
+        max_entries=int(os.getenv("OCR_CACHE_MAX_ENTRIES", 1024)),
+        ttl=float(os.getenv("OCR_CACHE_TTL", 300)),
+        max_distance=int(os.getenv("OCR_CACHE_MAX_DISTANCE", 4)),
+        hash_size=int(os.getenv("OCR_CACHE_HASH_SIZE", 8)),
+    )
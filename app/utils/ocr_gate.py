@@ -0,0 +1,146 @@
+import os
+import threading
+import cv2
+import numpy as np
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 门控结论
+OCR_RUN = "ocr"
+OCR_SKIP = "skip"
+OCR_DEFER = "defer"
+
+# 跳过/推迟的原因
+REASON_CATEGORY_SKIP = "category_skip"
+REASON_CATEGORY_DEFER = "category_defer"
+REASON_TOO_SMALL = "too_small"
+REASON_TOO_BLURRY = "too_blurry"
+REASON_DEFER_OVERFLOW = "defer_overflow"
+
+
+def sharpness_score(crop: np.ndarray, max_side: int = 128) -> float:
+    """
+    清晰度评分：灰度图拉普拉斯算子的方差，越大越清晰
+
+    先把长边缩到 max_side，避免大图上计算开销，也让不同尺寸的裁剪图评分可比。
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    h, w = gray.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def parse_category_policy(value: str) -> Dict[int, str]:
+    """解析形如 "5:skip,6:defer" 的按类别策略（类别ID与 CATEGORY_MAP 一致，从1开始）"""
+    policy = {}
+    for item in value.split(","):
+        if ":" in item:
+            category_id, action = item.split(":", 1)
+            action = action.strip().lower()
+            if action not in (OCR_RUN, OCR_SKIP, OCR_DEFER):
+                raise ValueError(f"Unknown OCR policy '{action}' for category {category_id}")
+            policy[int(category_id)] = action
+    return policy
+
+
+class OCRGate:
+    """
+    OCR 前的门控：判断一个船舶裁剪图是否值得 OCR
+
+    依次检查：按类别策略（跳过/推迟）、裁剪图尺寸、清晰度（拉普拉斯方差）。
+    远处只有几十像素高的船和运动模糊的裁剪图几乎不可能识别出船号，直接跳过并记录原因。
+    """
+
+    def __init__(
+        self,
+        min_width: int = 0,
+        min_height: int = 0,
+        min_sharpness: float = 0.0,
+        category_policy: Optional[Dict[int, str]] = None,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            min_width (int): 最小宽度（像素）
+            min_height (int): 最小高度（像素）
+            min_sharpness (float): 最低清晰度评分，0 为不检查
+            category_policy (Dict[int, str], optional): 类别ID（从1开始）到 ocr / skip / defer 的映射
+            enabled (bool): 关闭时所有裁剪图都执行 OCR
+        """
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_sharpness = min_sharpness
+        self.category_policy = category_policy or {}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._decisions = Counter()
+        self._reasons = Counter()
+
+    def check(self, crop: np.ndarray, category_id: Optional[int] = None) -> Tuple[str, Optional[str], Dict]:
+        """
+        Args:
+            crop (np.ndarray): BGR 裁剪图
+            category_id (int, optional): 检测类别ID（从1开始）
+
+        Returns:
+            Tuple[str, Optional[str], Dict]: (结论 ocr/skip/defer, 原因, 计算出的指标)
+        """
+        decision, reason, metrics = self._check(crop, category_id)
+        with self._lock:
+            self._checked += 1
+            self._decisions[decision] += 1
+            if reason:
+                self._reasons[reason] += 1
+        return decision, reason, metrics
+
+    def _check(self, crop: np.ndarray, category_id: Optional[int]) -> Tuple[str, Optional[str], Dict]:
+        if not self.enabled:
+            return OCR_RUN, None, {}
+
+        action = self.category_policy.get(category_id, OCR_RUN)
+        if action == OCR_SKIP:
+            return OCR_SKIP, REASON_CATEGORY_SKIP, {}
+
+        h, w = crop.shape[:2]
+        metrics = {"width": w, "height": h}
+        if crop.size == 0 or w < self.min_width or h < self.min_height:
+            return OCR_SKIP, REASON_TOO_SMALL, metrics
+
+        if self.min_sharpness > 0:
+            metrics["sharpness"] = round(sharpness_score(crop), 2)
+            if metrics["sharpness"] < self.min_sharpness:
+                return OCR_SKIP, REASON_TOO_BLURRY, metrics
+
+        if action == OCR_DEFER:
+            return OCR_DEFER, REASON_CATEGORY_DEFER, metrics
+        return OCR_RUN, None, metrics
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "min_width": self.min_width,
+                "min_height": self.min_height,
+                "min_sharpness": self.min_sharpness,
+                "category_policy": {str(k): v for k, v in self.category_policy.items()},
+                "checked": self._checked,
+                "decisions": dict(self._decisions),
+                "reasons": dict(self._reasons),
+            }
+
+
+def create_ocr_gate() -> OCRGate:
+    """按环境变量创建 OCR 门控"""
+    return OCRGate(
+        min_width=int(os.getenv("OCR_GATE_MIN_WIDTH", 48)),
+        min_height=int(os.getenv("OCR_GATE_MIN_HEIGHT", 24)),
+        min_sharpness=float(os.getenv("OCR_GATE_MIN_SHARPNESS", 0)),
+        category_policy=parse_category_policy(os.getenv("OCR_GATE_CATEGORY_POLICY", "")),
+        enabled=os.getenv("OCR_GATE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    )
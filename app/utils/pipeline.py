@@ -0,0 +1,389 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# 阶段之间传递的结束信号
+_STOP = object()
+# 阻塞读写队列时检查取消标志的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+
+class PipelineCancelled(Exception):
+    """流水线因某个阶段出错或被外部停止而提前结束"""
+
+
+class PipelineStage:
+    """
+    流水线中的一个处理阶段
+
+    fn(items, emit) 每次处理最多 batch_size 个输入（队列中有多少取多少，不等待凑满），
+    调用 emit(output) 把任意数量的结果交给下一阶段。
+    输入全部处理完后，最后一个退出的线程调用 finish(emit)，可用于冲刷阶段内部积攒的数据。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[List[Any], Callable[[Any], None]], None],
+        workers: int = 1,
+        queue_size: int = 8,
+        batch_size: int = 1,
+        finish: Optional[Callable[[Callable[[Any], None]], None]] = None,
+    ):
+        """
+        Args:
+            name (str): 阶段名称，用于线程名和统计
+            fn (Callable): 处理函数 fn(items, emit)
+            workers (int): 并发执行该阶段的线程数
+            queue_size (int): 输入队列容量，队列满时上游阻塞（背压）
+            batch_size (int): 单次最多取出的输入数
+            finish (Callable, optional): 输入处理完后调用一次的收尾函数 finish(emit)
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.finish = finish
+        self.input: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+
+        self._lock = threading.Lock()
+        self._active = self.workers
+        self.processed = 0
+        self.emitted = 0
+        self.calls = 0
+        self.busy_time = 0.0
+        self.idle_time = 0.0
+        self.blocked_time = 0.0
+        self.max_queue_depth = 0
+
+    def record(self, processed: int = 0, emitted: int = 0, calls: int = 0,
+               busy: float = 0.0, idle: float = 0.0, blocked: float = 0.0):
+        with self._lock:
+            self.processed += processed
+            self.emitted += emitted
+            self.calls += calls
+            self.busy_time += busy
+            self.idle_time += idle
+            self.blocked_time += blocked
+
+    def worker_done(self) -> bool:
+        """一个线程退出，返回它是否是最后一个"""
+        with self._lock:
+            self._active -= 1
+            return self._active == 0
+
+    def stats(self, elapsed: float) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "batch_size": self.batch_size,
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "calls": self.calls,
+                "queue_depth": self.input.qsize(),
+                "queue_size": self.input.maxsize,
+                "max_queue_depth": self.max_queue_depth,
+                "throughput": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+                "avg_busy_ms": round(self.busy_time / self.calls * 1000, 2) if self.calls else 0.0,
+                # 忙碌时间占全部线程可用时间的比例，接近 1 的阶段就是瓶颈
+                "utilization": round(self.busy_time / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+                "idle_s": round(self.idle_time, 3),
+                "blocked_s": round(self.blocked_time, 3),
+            }
+
+
+class Pipeline:
+    """
+    多阶段并发流水线
+
+    数据源在单独的线程中迭代（例如解码视频帧），依次流经各个阶段；每个阶段有自己的线程和有界输入队列，
+    下游处理不过来时上游在 put 处阻塞，内存占用不随视频长度增长。
+    各阶段同时工作，整体吞吐由最慢的阶段决定，而不是所有阶段耗时之和。
+    任一阶段抛出异常时取消整条流水线，run() 在所有线程退出后重新抛出该异常。
+    """
+
+    def __init__(self, name: str, source: Iterable, stages: List[PipelineStage], source_name: str = "decode",
+                 cancel_event: Optional[threading.Event] = None):
+        """
+        Args:
+            name (str): 流水线名称
+            source (Iterable): 数据源，在单独线程中迭代
+            stages (List[PipelineStage]): 按顺序排列的处理阶段
+            source_name (str): 数据源在统计中的名称
+            cancel_event (threading.Event, optional): 外部取消信号，置位后流水线停止，join() 抛出 PipelineCancelled；
+                流水线只读取它，阶段出错时不会置位，调用方可以据此区分取消与失败
+        """
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.name = name
+        self.source = source
+        self.source_name = source_name
+        self.stages = stages
+        self._cancel_event = cancel_event
+        self._stopped = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._source_count = 0
+        self._source_time = 0.0
+        self._source_blocked = 0.0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._extra_stats: "OrderedDict[str, Callable[[], Dict]]" = OrderedDict()
+
+    def _fail(self, stage_name: str, error: BaseException):
+        with self._error_lock:
+            if self._error is None:
+                print(f"流水线 {self.name} 阶段 {stage_name} 出错: {error}")
+                self._error = error
+        self._stopped.set()
+
+    def _put(self, stage: PipelineStage, item: Any) -> float:
+        """放入下一阶段的输入队列，队列满时阻塞，返回阻塞时长"""
+        start = time.perf_counter()
+        while not self._is_stopped():
+            try:
+                stage.input.put(item, timeout=_POLL_INTERVAL)
+                depth = stage.input.qsize()
+                if depth > stage.max_queue_depth:
+                    stage.max_queue_depth = depth
+                return time.perf_counter() - start
+            except queue.Full:
+                continue
+        raise PipelineCancelled(self.name)
+
+    def _send_stop(self, index: int):
+        if index < len(self.stages):
+            for _ in range(self.stages[index].workers):
+                self._put(self.stages[index], _STOP)
+
+    def _run_source(self):
+        first = self.stages[0]
+        try:
+            iterator = iter(self.source)
+            while not self._is_stopped():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self._source_time += time.perf_counter() - start
+                self._source_blocked += self._put(first, item)
+                self._source_count += 1
+            self._send_stop(0)
+        except PipelineCancelled:
+            pass
+        except BaseException as e:
+            self._fail(self.source_name, e)
+
+    def _get(self, stage: PipelineStage) -> Any:
+        while not self._is_stopped():
+            try:
+                return stage.input.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        raise PipelineCancelled(self.name)
+
+    def _run_stage(self, index: int):
+        stage = self.stages[index]
+        downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        emitted = [0]
+        blocked = [0.0]
+
+        def emit(output: Any):
+            emitted[0] += 1
+            if downstream is not None:
+                blocked[0] += self._put(downstream, output)
+
+        try:
+            stopped = False
+            while not stopped:
+                wait_start = time.perf_counter()
+                first = self._get(stage)
+                idle = time.perf_counter() - wait_start
+                if first is _STOP:
+                    break
+
+                items = [first]
+                while len(items) < stage.batch_size:
+                    try:
+                        item = stage.input.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopped = True
+                        break
+                    items.append(item)
+
+                emitted[0], blocked[0] = 0, 0.0
+                start = time.perf_counter()
+                stage.fn(items, emit)
+                busy = time.perf_counter() - start - blocked[0]
+                stage.record(processed=len(items), emitted=emitted[0], calls=1,
+                             busy=busy, idle=idle, blocked=blocked[0])
+
+            if stage.worker_done():
+                if stage.finish is not None:
+                    emitted[0], blocked[0] = 0, 0.0
+                    start = time.perf_counter()
+                    stage.finish(emit)
+                    stage.record(emitted=emitted[0], busy=time.perf_counter() - start - blocked[0],
+                                 blocked=blocked[0])
+                self._send_stop(index + 1)
+        except PipelineCancelled:
+            pass
+        except BaseException as e:
+            self._fail(stage.name, e)
+
+    def start(self):
+        """启动数据源线程和所有阶段的线程"""
+        self._started_at = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, name=f"{self.name}-{self.source_name}", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                threads.append(threading.Thread(target=self._run_stage, args=(index,),
+                                                name=f"{self.name}-{stage.name}-{i}", daemon=True))
+        self._threads = threads
+        for thread in threads:
+            thread.start()
+
+    def join(self):
+        """等待所有线程退出，有阶段出错时抛出该异常"""
+        for thread in self._threads:
+            thread.join()
+        self._finished_at = time.perf_counter()
+        if self._error is None and self._is_stopped():
+            self._error = PipelineCancelled(self.name)
+        if self._error is not None:
+            raise self._error
+
+    def run(self) -> Dict:
+        """启动并等待流水线完成，返回统计信息"""
+        self.start()
+        self.join()
+        return self.stats()
+
+    def cancel(self):
+        """外部停止流水线，join() 之后抛出 PipelineCancelled"""
+        with self._error_lock:
+            if self._error is None:
+                self._error = PipelineCancelled(self.name)
+        self._stopped.set()
+
+    def _is_stopped(self) -> bool:
+        return self._stopped.is_set() or (self._cancel_event is not None and self._cancel_event.is_set())
+
+    def add_stats(self, name: str, fn: Callable[[], Dict]):
+        """附加统计项（例如门控、跟踪器的计数），stats() 中以 name 为键输出"""
+        self._extra_stats[name] = fn
+
+    @property
+    def finished(self) -> bool:
+        return self._finished_at is not None
+
+    @property
+    def stopped(self) -> bool:
+        """已出错或被取消（线程可能仍在退出）"""
+        return self._is_stopped()
+
+    def stats(self) -> Dict:
+        if self._started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        stages = OrderedDict()
+        stages[self.source_name] = {
+            "workers": 1,
+            "processed": self._source_count,
+            "throughput": round(self._source_count / elapsed, 2) if elapsed > 0 else 0.0,
+            "avg_busy_ms": round(self._source_time / self._source_count * 1000, 2) if self._source_count else 0.0,
+            "utilization": round(self._source_time / elapsed, 3) if elapsed > 0 else 0.0,
+            "blocked_s": round(self._source_blocked, 3),
+        }
+        for stage in self.stages:
+            stages[stage.name] = stage.stats(elapsed)
+        stats = {
+            "name": self.name,
+            "running": self._started_at is not None and not self.finished,
+            "elapsed_s": round(elapsed, 3),
+            "error": None if self._error is None else str(self._error) or type(self._error).__name__,
+            "stages": stages,
+        }
+        for name, fn in self._extra_stats.items():
+            stats[name] = fn()
+        return stats
+
+
+class PipelineGroup:
+    """
+    并发运行的一组流水线，按顺序取用各条的结果（例如长视频分段并行处理）
+
+    每条流水线在自己的线程中 run()，任一条出错时取消其余各条；wait(index) 等待第 index 条结束，
+    有流水线出错时抛出最先发生的异常。stop() 取消仍在运行的流水线并等待线程退出。
+    """
+
+    def __init__(self, pipelines: List[Pipeline]):
+        self.pipelines = pipelines
+        self._threads: List[threading.Thread] = []
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._run, args=(pipeline,), name=f"{pipeline.name}-run", daemon=True)
+                         for pipeline in self.pipelines]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self, pipeline: Pipeline):
+        try:
+            pipeline.run()
+        except BaseException as e:
+            with self._lock:
+                first = self._error is None
+                if first:
+                    self._error = e
+            if first:
+                for other in self.pipelines:
+                    if other is not pipeline and not other.finished:
+                        other.cancel()
+
+    def wait(self, index: int, timeout: Optional[float] = None) -> bool:
+        """等待第 index 条流水线结束，超时返回 False"""
+        thread = self._threads[index]
+        thread.join(timeout)
+        if thread.is_alive():
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def stop(self):
+        for pipeline in self.pipelines:
+            if not pipeline.finished:
+                pipeline.cancel()
+        for thread in self._threads:
+            thread.join()
+
+
+class PipelineRegistry:
+    """记录正在运行和最近完成的流水线，供统计接口查询"""
+
+    def __init__(self, keep_finished: int = 20):
+        self.keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._pipelines: "OrderedDict[str, Pipeline]" = OrderedDict()
+
+    def add(self, pipeline: Pipeline):
+        with self._lock:
+            self._pipelines.pop(pipeline.name, None)
+            self._pipelines[pipeline.name] = pipeline
+            finished = [name for name, p in self._pipelines.items() if p.finished]
+            for name in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._pipelines[name]
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            pipelines = list(self._pipelines.values())
+        return [pipeline.stats() for pipeline in pipelines]
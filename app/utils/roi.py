@@ -0,0 +1,120 @@
+import json
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+
+
+class RegionOfInterest:
+    """
+    摄像头/视频的感兴趣区域（多边形）
+
+    检测前把帧裁剪到多边形的外接矩形，阈值筛选前丢弃中心点不在多边形内的原始检测，
+    检测后把框平移回整帧坐标。
+    """
+
+    def __init__(self, polygon: List[List[float]]):
+        """
+        Args:
+            polygon (List[List[float]]): 整帧坐标下的多边形顶点 [[x, y], ...]，至少 3 个点
+        """
+        points = np.asarray(polygon, dtype=np.float32)
+        if points.ndim != 2 or points.shape[0] < 3 or points.shape[1] != 2:
+            raise ValueError("ROI polygon must be a list of at least 3 [x, y] points")
+        self.polygon = points
+        self._mask = None
+        self._mask_shape = None
+
+    @classmethod
+    def parse(cls, value: Union[None, str, List]) -> Optional["RegionOfInterest"]:
+        """从 JSON 字符串或点列表创建 ROI，空值返回 None"""
+        if value is None or value == "" or value == []:
+            return None
+        if isinstance(value, str):
+            value = json.loads(value)
+        return cls(value)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_list())
+
+    def to_list(self) -> List[List[float]]:
+        return [[round(float(x), 2), round(float(y), 2)] for x, y in self.polygon]
+
+    def scaled(self, factor: float) -> "RegionOfInterest":
+        """帧被缩放时，返回相应缩放后的 ROI"""
+        return RegionOfInterest(self.polygon * factor)
+
+    def bounding_rect(self, frame_shape) -> Tuple[int, int, int, int]:
+        """多边形外接矩形 (x1, y1, x2, y2)，已裁剪到帧范围内"""
+        h, w = frame_shape[:2]
+        x1, y1 = np.floor(self.polygon.min(axis=0)).astype(int)
+        x2, y2 = np.ceil(self.polygon.max(axis=0)).astype(int)
+        return max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+
+    def crop(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        裁剪到外接矩形（返回视图，不复制像素）
+
+        Returns:
+            Tuple[np.ndarray, Tuple[int, int]]: 裁剪后的图像和其在整帧中的偏移 (x, y)
+        """
+        x1, y1, x2, y2 = self.bounding_rect(frame.shape)
+        if x2 <= x1 or y2 <= y1:
+            return frame[0:0, 0:0], (0, 0)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def _get_mask(self, frame_shape) -> np.ndarray:
+        shape = tuple(frame_shape[:2])
+        if self._mask is None or self._mask_shape != shape:
+            mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(mask, [np.round(self.polygon).astype(np.int32)], 1)
+            self._mask = mask.astype(bool)
+            self._mask_shape = shape
+        return self._mask
+
+    def _inside(self, boxes: np.ndarray, frame_shape) -> np.ndarray:
+        """整帧坐标下 [N, 4] 框的中心点是否在多边形内"""
+        mask = self._get_mask(frame_shape)
+        h, w = mask.shape
+        cx = np.clip((boxes[:, 0] + boxes[:, 2]) // 2, 0, w - 1)
+        cy = np.clip((boxes[:, 1] + boxes[:, 3]) // 2, 0, h - 1)
+        return mask[cy, cx]
+
+    def filter_raw(self, dets: np.ndarray, offset: Tuple[int, int], frame_shape) -> np.ndarray:
+        """
+        丢弃中心点在多边形外的原始检测
+
+        在"高置信度优先、否则取最佳中等置信度"的筛选之前调用，
+        外接矩形内、多边形外的高分误检（如码头）不会挤掉多边形内的中等置信度船舶。
+
+        Args:
+            dets (np.ndarray): 裁剪图坐标下的 [N, 6] 检测数组
+            offset (Tuple[int, int]): crop 返回的偏移
+            frame_shape: 整帧的 (h, w, ...)
+        """
+        dets = np.asarray(dets).reshape(-1, 6)
+        if len(dets) == 0:
+            return dets
+        ox, oy = offset
+        boxes = dets[:, 2:6].astype(np.int64) + np.array([ox, oy, ox, oy])
+        return dets[self._inside(boxes, frame_shape)]
+
+    def restore(self, detections: List[Dict], offset: Tuple[int, int], frame_shape) -> List[Dict]:
+        """
+        把裁剪图上的检测结果平移回整帧坐标，并丢弃中心点在多边形外的框
+
+        Args:
+            detections (List[Dict]): 裁剪图坐标下的检测结果（含 bbox 字段）
+            offset (Tuple[int, int]): crop 返回的偏移
+            frame_shape: 整帧的 (h, w, ...)
+        """
+        if not detections:
+            return []
+        ox, oy = offset
+        boxes = np.asarray([d["bbox"] for d in detections], dtype=np.int64) + np.array([ox, oy, ox, oy])
+        inside = self._inside(boxes, frame_shape)
+
+        restored = []
+        for det, box, keep in zip(detections, boxes.tolist(), inside.tolist()):
+            if keep:
+                restored.append({**det, "bbox": box})
+        return restored
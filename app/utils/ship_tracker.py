@@ -0,0 +1,523 @@
+import base64
+import copy
+import math
+import os
+import threading
+import cv2
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from app.utils.hull_index import normalize_hull_number
+from app.utils.ocr_gate import sharpness_score
+
+load_dotenv()
+
+# OCR 未识别出船号时的占位文本（与 ppocr_routes 一致）
+UNRECOGNIZED = "无法检测"
+# 轨迹没有可供 OCR 的裁剪图（TRACK_OCR_CROPS=0 或裁剪图为空）
+REASON_NO_CROP = "no_crop"
+# 检查点中裁剪图的 JPEG 质量
+_STATE_JPEG_QUALITY = 95
+
+
+def iou(a, b) -> float:
+    """两个 [x1, y1, x2, y2] 框的交并比"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    if inter <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class BoxKalmanFilter:
+    """
+    匀速模型的边界框卡尔曼滤波
+
+    状态为 (cx, cy, w, h) 及其速度，时间步长取相邻抽帧的时间差（秒），抽帧间隔不固定时同样适用。
+    噪声按框的尺寸缩放，远处的小船和近处的大船使用相同的相对误差。
+    """
+
+    _H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+    def __init__(self, bbox, timestamp: float):
+        x1, y1, x2, y2 = map(float, bbox)
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=float)
+        size = max(self.x[2], self.x[3], 1.0)
+        # 初始速度未知，方差取大
+        self.P = np.diag([(0.1 * size) ** 2] * 4 + [(0.5 * size) ** 2] * 4)
+        self.timestamp = timestamp
+
+    def predict(self, timestamp: float) -> List[float]:
+        dt = max(0.0, timestamp - self.timestamp)
+        if dt > 0:
+            F = np.eye(8)
+            F[:4, 4:] = np.eye(4) * dt
+            size = max(self.x[2], self.x[3], 1.0)
+            q_pos = (0.05 * size * dt) ** 2
+            q_vel = (0.05 * size * dt) ** 2
+            self.x = F @ self.x
+            self.P = F @ self.P @ F.T + np.diag([q_pos] * 4 + [q_vel] * 4)
+            self.x[2] = max(self.x[2], 1.0)
+            self.x[3] = max(self.x[3], 1.0)
+            self.timestamp = timestamp
+        return self.bbox()
+
+    def update(self, bbox):
+        x1, y1, x2, y2 = map(float, bbox)
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        size = max(z[2], z[3], 1.0)
+        R = np.eye(4) * (0.05 * size) ** 2
+        y = z - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+    def bbox(self) -> List[float]:
+        cx, cy, w, h = self.x[:4]
+        return [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+
+    def state(self) -> Dict:
+        return {"x": self.x.tolist(), "P": self.P.tolist(), "timestamp": float(self.timestamp)}
+
+    def load_state(self, state: Dict):
+        self.x = np.array(state["x"], dtype=float)
+        self.P = np.array(state["P"], dtype=float)
+        self.timestamp = state["timestamp"]
+
+
+class Track:
+    """一艘船从进入画面到离开的轨迹，保留质量最高的若干张裁剪图供 OCR"""
+
+    def __init__(self, track_id: int, det: dict, frame_index: int, timestamp: float):
+        self.track_id = track_id
+        self.filter = BoxKalmanFilter(det["bbox"], timestamp)
+        self.first_bbox = [float(v) for v in det["bbox"]]
+        self.first_frame = self.last_frame = frame_index
+        self.first_timestamp = self.last_timestamp = timestamp
+        self.hits = 0
+        self.categories = Counter()
+        self.max_confidence = 0.0
+        self.best_det = det
+        # (质量评分, 帧号, 时间戳, 检测结果, 裁剪图)，按评分从高到低
+        self.crops: List[Tuple[float, int, float, dict, np.ndarray]] = []
+
+    def add(self, det: dict, frame_index: int, timestamp: float, crop: Optional[np.ndarray], max_crops: int):
+        self.last_frame = frame_index
+        self.last_timestamp = timestamp
+        self.hits += 1
+        # 类别按置信度加权投票，个别帧的误分类不影响结果
+        self.categories[det["category_id"]] += det.get("confidence", 1.0)
+        if det.get("confidence", 0.0) >= self.max_confidence:
+            self.max_confidence = det.get("confidence", 0.0)
+            self.best_det = det
+        if crop is None or not crop.size or max_crops <= 0:
+            return
+        score = crop_quality(crop, det)
+        if len(self.crops) >= max_crops and score <= self.crops[-1][0]:
+            return
+        self.crops.append((score, frame_index, timestamp, det, crop))
+        self.crops.sort(key=lambda item: item[0], reverse=True)
+        del self.crops[max_crops:]
+
+    def merge(self, other: "Track", max_crops: int):
+        """把同一艘船随后的一段轨迹（例如下一个视频分段中的）接到本轨迹之后"""
+        self.filter = other.filter
+        self.last_frame = other.last_frame
+        self.last_timestamp = other.last_timestamp
+        self.hits += other.hits
+        self.categories.update(other.categories)
+        if other.max_confidence >= self.max_confidence:
+            self.max_confidence = other.max_confidence
+            self.best_det = other.best_det
+        self.crops = sorted(self.crops + other.crops, key=lambda item: item[0], reverse=True)[:max(0, max_crops)]
+
+    def predict(self, timestamp: float) -> List[float]:
+        """预测 timestamp 时刻的位置，不改变滤波器状态"""
+        return copy.deepcopy(self.filter).predict(timestamp)
+
+    @property
+    def category_id(self) -> int:
+        return self.categories.most_common(1)[0][0] if self.categories else self.best_det["category_id"]
+
+    def state(self) -> Dict:
+        """可 JSON 序列化的完整状态，裁剪图编码为 JPEG base64"""
+        return {
+            "track_id": self.track_id,
+            "filter": self.filter.state(),
+            "first_bbox": self.first_bbox,
+            "first_frame": int(self.first_frame),
+            "last_frame": int(self.last_frame),
+            "first_timestamp": float(self.first_timestamp),
+            "last_timestamp": float(self.last_timestamp),
+            "hits": self.hits,
+            "categories": {str(k): float(v) for k, v in self.categories.items()},
+            "max_confidence": float(self.max_confidence),
+            "best_det": _plain_det(self.best_det),
+            "crops": [[float(score), int(frame_index), float(timestamp), _plain_det(det), _encode_crop(crop)]
+                      for score, frame_index, timestamp, det, crop in self.crops],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "Track":
+        track = cls(state["track_id"], state["best_det"], state["first_frame"], state["first_timestamp"])
+        track.filter.load_state(state["filter"])
+        track.first_bbox = state.get("first_bbox", track.first_bbox)
+        track.last_frame = state["last_frame"]
+        track.last_timestamp = state["last_timestamp"]
+        track.hits = state["hits"]
+        track.categories = Counter({int(k): v for k, v in state["categories"].items()})
+        track.max_confidence = state["max_confidence"]
+        track.crops = [(score, frame_index, timestamp, det, _decode_crop(data))
+                       for score, frame_index, timestamp, det, data in state["crops"]]
+        return track
+
+    def summary(self) -> Dict:
+        return {
+            "track_id": self.track_id,
+            "category_id": self.category_id,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "first_timestamp": round(self.first_timestamp, 3),
+            "last_timestamp": round(self.last_timestamp, 3),
+            "hits": self.hits,
+            "max_confidence": round(self.max_confidence, 3),
+            "crops": len(self.crops),
+        }
+
+
+def _plain_det(det: dict) -> dict:
+    """检测结果中跟踪需要的字段，转换为 JSON 可序列化的类型"""
+    return {
+        "bbox": [int(v) for v in det["bbox"]],
+        "category_id": int(det["category_id"]),
+        "category": det.get("category"),
+        "confidence": float(det.get("confidence", 0.0)),
+    }
+
+
+def _encode_crop(crop: np.ndarray) -> str:
+    _, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, _STATE_JPEG_QUALITY])
+    return base64.b64encode(buffer).decode("ascii")
+
+
+def _decode_crop(data: str) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(base64.b64decode(data), np.uint8), cv2.IMREAD_COLOR)
+
+
+def crop_quality(crop: np.ndarray, det: dict) -> float:
+    """
+    裁剪图的 OCR 质量评分：检测置信度 × 尺寸 × 清晰度
+
+    尺寸取面积的平方根（与边长同量纲），清晰度取拉普拉斯方差的对数，避免单一因素主导。
+    """
+    h, w = crop.shape[:2]
+    return float(det.get("confidence", 1.0)) * math.sqrt(w * h) * math.log1p(sharpness_score(crop))
+
+
+class ShipTracker:
+    """
+    基于 IoU 与卡尔曼预测的多目标跟踪
+
+    每次抽帧先用卡尔曼滤波预测各轨迹的位置，再按 IoU 从高到低贪心匹配检测框；
+    未匹配的检测框新建轨迹，超过 max_age_seconds（视频时间）没有匹配的轨迹结束。
+    update() 必须按帧的时间顺序调用。结束的轨迹少于 min_hits 次命中时视为误检丢弃。
+    关闭时每个检测框各自成为一条只有一次命中的轨迹，相当于不跟踪。
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_age_seconds: float = 10.0,
+        min_hits: int = 1,
+        max_crops: int = 3,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            iou_threshold (float): 检测框与预测框匹配的最低 IoU
+            max_age_seconds (float): 轨迹连续未匹配超过该时长（秒）后结束
+            min_hits (int): 输出轨迹的最少命中次数
+            max_crops (int): 每条轨迹保留供 OCR 的最佳裁剪图数量
+            enabled (bool): 是否跟踪
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age_seconds = max_age_seconds
+        self.min_hits = max(1, min_hits)
+        self.max_crops = max_crops
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._active: List[Track] = []
+        self._detections = 0
+        self._tracks_started = 0
+        self._tracks_emitted = 0
+        self._tracks_dropped = 0
+
+    def update(self, frame_index: int, timestamp: float, detections: List[dict],
+               crops: Optional[List[Optional[np.ndarray]]] = None) -> List[Track]:
+        """
+        Args:
+            frame_index (int): 帧号
+            timestamp (float): 帧时间（秒）
+            detections (List[dict]): 本帧检测结果，bbox 为整帧坐标
+            crops (List[np.ndarray], optional): 与检测结果对应的裁剪图；沿用上一帧结果的静止帧为 None
+
+        Returns:
+            List[Track]: 本次结束的轨迹
+        """
+        crops = crops if crops is not None else [None] * len(detections)
+        with self._lock:
+            self._detections += len(detections)
+            if not self.enabled:
+                # 不跟踪时沿用的结果（静止帧）已经输出过，不再重复
+                finished = [self._new_track(det, frame_index, timestamp, crop)
+                            for det, crop in zip(detections, crops) if crop is not None]
+                return self._emit(finished)
+
+            predicted = [track.filter.predict(timestamp) for track in self._active]
+            pairs = sorted(
+                ((iou(box, det["bbox"]), t, d) for t, box in enumerate(predicted) for d, det in enumerate(detections)),
+                key=lambda pair: pair[0], reverse=True)
+            matched_tracks, matched_dets = set(), set()
+            for score, t, d in pairs:
+                if score < self.iou_threshold:
+                    break
+                if t in matched_tracks or d in matched_dets:
+                    continue
+                matched_tracks.add(t)
+                matched_dets.add(d)
+                track = self._active[t]
+                track.filter.update(detections[d]["bbox"])
+                track.add(detections[d], frame_index, timestamp, crops[d], self.max_crops)
+
+            for d, det in enumerate(detections):
+                # 沿用的结果（没有裁剪图）只延续已有轨迹，不新建
+                if d not in matched_dets and crops[d] is not None:
+                    self._active.append(self._new_track(det, frame_index, timestamp, crops[d]))
+
+            finished = [track for track in self._active if timestamp - track.last_timestamp > self.max_age_seconds]
+            if finished:
+                self._active = [track for track in self._active if track not in finished]
+            return self._emit(finished)
+
+    def finish(self) -> List[Track]:
+        """视频结束：结束所有活跃轨迹"""
+        with self._lock:
+            finished, self._active = self._active, []
+            return self._emit(finished)
+
+    def _new_track(self, det: dict, frame_index: int, timestamp: float, crop) -> Track:
+        track = Track(self._next_id, det, frame_index, timestamp)
+        self._next_id += 1
+        track.add(det, frame_index, timestamp, crop, self.max_crops)
+        self._tracks_started += 1
+        return track
+
+    def spawn(self, **overrides) -> "ShipTracker":
+        """创建参数相同（可覆盖部分参数）的新跟踪器，例如分段处理时每段一个"""
+        params = {
+            "iou_threshold": self.iou_threshold,
+            "max_age_seconds": self.max_age_seconds,
+            "min_hits": self.min_hits,
+            "max_crops": self.max_crops,
+            "enabled": self.enabled,
+        }
+        params.update(overrides)
+        return ShipTracker(**params)
+
+    @property
+    def next_id(self) -> int:
+        """下一条新轨迹的编号"""
+        return self._next_id
+
+    def active_ids(self) -> List[int]:
+        with self._lock:
+            return [track.track_id for track in self._active]
+
+    def state(self) -> Dict:
+        """检查点：活跃轨迹（含待 OCR 的裁剪图）与轨迹编号，可 JSON 序列化"""
+        with self._lock:
+            return {"next_id": self._next_id, "tracks": [track.state() for track in self._active]}
+
+    def load_state(self, state: Dict):
+        """从检查点恢复，之后的 update() 从检查点之后的帧继续"""
+        with self._lock:
+            self._next_id = state["next_id"]
+            self._active = [Track.from_state(item) for item in state["tracks"]]
+
+    def _emit(self, finished: List[Track]) -> List[Track]:
+        kept = [track for track in finished if track.hits >= self.min_hits]
+        self._tracks_emitted += len(kept)
+        self._tracks_dropped += len(finished) - len(kept)
+        return kept
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "detections": self._detections,
+                "active": len(self._active),
+                "started": self._tracks_started,
+                "emitted": self._tracks_emitted,
+                "dropped": self._tracks_dropped,
+            }
+
+
+class SegmentTrackMerger:
+    """
+    按时间顺序合并分段跟踪的轨迹
+
+    长视频切成若干段并行跟踪时，跨越分段边界的船在前一段末尾和后一段开头各有一条轨迹。
+    前一段结束时仍在跟踪（最后出现时间距段尾不超过 max_age_seconds）的轨迹用卡尔曼滤波预测到
+    后一段开头轨迹首次出现的时刻，时间间隔不超过 max_age_seconds 且与首次出现的框 IoU 达到阈值的合并为一条，
+    在画面中停留多段的船会逐段接起来。
+    各段的跟踪器由 segment_tracker() 创建，不按命中次数过滤，合并后再按 min_hits 丢弃误检；
+    输出的轨迹按首次出现时间排序并连续编号，与不分段处理时一致。
+    """
+
+    def __init__(self, tracker: ShipTracker):
+        """
+        Args:
+            tracker (ShipTracker): 提供跟踪参数的跟踪器（不用于跟踪）
+        """
+        self.tracker = tracker
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._open: List[Track] = []  # 上一段结束时仍在跟踪的轨迹
+        self._ready: List[Track] = []  # 已经完整、等待按时间顺序输出的轨迹
+        self._segments = 0
+        self._merged = 0
+        self._emitted = 0
+        self._dropped = 0
+
+    def segment_tracker(self) -> ShipTracker:
+        return self.tracker.spawn(min_hits=1)
+
+    def add_segment(self, tracks: List[Track], start_timestamp: float, end_timestamp: float) -> List[Track]:
+        """
+        加入一段的全部轨迹，各段必须按时间顺序加入
+
+        Args:
+            tracks (List[Track]): 该段跟踪器输出的全部轨迹（包括 finish() 结束的）
+            start_timestamp (float): 该段起始时间（秒）
+            end_timestamp (float): 该段结束时间（秒，不含），最后一段为 math.inf
+
+        Returns:
+            List[Track]: 可以输出的轨迹，已按首次出现时间排序并重新编号
+        """
+        max_age = self.tracker.max_age_seconds
+        tracks = sorted(tracks, key=lambda t: t.first_timestamp)
+        with self._lock:
+            self._segments += 1
+            previous, self._open = self._open, []
+            if previous and self.tracker.enabled:
+                head = [i for i, t in enumerate(tracks) if t.first_timestamp - start_timestamp <= max_age]
+                pairs = []
+                for p, track in enumerate(previous):
+                    for h in head:
+                        gap = tracks[h].first_timestamp - track.last_timestamp
+                        if 0 <= gap <= max_age:
+                            pairs.append((iou(track.predict(tracks[h].first_timestamp), tracks[h].first_bbox), p, h))
+                pairs.sort(key=lambda pair: pair[0], reverse=True)
+                matched_previous, matched_head = set(), set()
+                for score, p, h in pairs:
+                    if score < self.tracker.iou_threshold:
+                        break
+                    if p in matched_previous or h in matched_head:
+                        continue
+                    matched_previous.add(p)
+                    matched_head.add(h)
+                    previous[p].merge(tracks[h], self.tracker.max_crops)
+                    tracks[h] = previous[p]
+                    self._merged += 1
+                self._ready.extend(track for p, track in enumerate(previous) if p not in matched_previous)
+            else:
+                self._ready.extend(previous)
+
+            # 本段末尾仍在跟踪的轨迹可能在下一段继续
+            for track in tracks:
+                if self.tracker.enabled and track.last_timestamp >= end_timestamp - max_age:
+                    self._open.append(track)
+                else:
+                    self._ready.append(track)
+            return self._release()
+
+    def finish(self) -> List[Track]:
+        """所有分段加入后调用，输出剩余的轨迹"""
+        with self._lock:
+            self._ready.extend(self._open)
+            self._open = []
+            return self._release()
+
+    def _release(self) -> List[Track]:
+        # 还可能与下一段合并的轨迹之前出现的轨迹才能输出，保证输出按首次出现时间排序
+        limit = min((t.first_timestamp for t in self._open), default=math.inf)
+        self._ready.sort(key=lambda t: t.first_timestamp)
+        count = 0
+        while count < len(self._ready) and self._ready[count].first_timestamp < limit:
+            count += 1
+        released, self._ready = self._ready[:count], self._ready[count:]
+        kept = []
+        for track in released:
+            if track.hits < self.tracker.min_hits:
+                self._dropped += 1
+                continue
+            track.track_id = self._next_id
+            self._next_id += 1
+            kept.append(track)
+        self._emitted += len(kept)
+        return kept
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "segments": self._segments,
+                "merged": self._merged,
+                "emitted": self._emitted,
+                "dropped": self._dropped,
+                "pending": len(self._open) + len(self._ready),
+            }
+
+
+def vote_hull_number(ocr_results: List[dict]) -> Tuple[dict, int]:
+    """
+    融合同一条轨迹多张裁剪图的 OCR 结果
+
+    归一化后相同的船号按置信度累加投票，得票最高的一组中取置信度最高的一次识别作为结果；
+    置信度取该组的平均值。没有任何有效识别时返回第一个结果（保留跳过原因）。
+
+    Returns:
+        Tuple[dict, int]: (融合后的结果，格式与 ppocr_v4 相同；结果在 ocr_results 中的下标)
+    """
+    groups = defaultdict(list)
+    for i, result in enumerate(ocr_results):
+        key = normalize_hull_number(result.get("ship_id", ""))
+        if result.get("skip_reason") or not key or result.get("ship_id") == UNRECOGNIZED:
+            continue
+        groups[key].append(i)
+    if not groups:
+        return dict(ocr_results[0]), 0
+
+    winner = max(groups.values(), key=lambda idx: sum(ocr_results[i].get("confidence", 0.0) for i in idx))
+    best = max(winner, key=lambda i: ocr_results[i].get("confidence", 0.0))
+    fused = dict(ocr_results[best])
+    fused["confidence"] = round(sum(ocr_results[i].get("confidence", 0.0) for i in winner) / len(winner), 3)
+    fused["votes"] = len(winner)
+    return fused, best
+
+
+def create_ship_tracker() -> ShipTracker:
+    """按环境变量创建跟踪器（每个视频任务各创建一个）"""
+    return ShipTracker(
+        iou_threshold=float(os.getenv("TRACK_IOU_THRESHOLD", 0.3)),
+        max_age_seconds=float(os.getenv("TRACK_MAX_AGE_SECONDS", 10)),
+        min_hits=int(os.getenv("TRACK_MIN_HITS", 1)),
+        max_crops=int(os.getenv("TRACK_OCR_CROPS", 3)),
+        enabled=os.getenv("TRACK_ENABLED", "true").lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+from typing import BinaryIO, Dict, Iterator, Optional
+from dotenv import load_dotenv
+
+from app.utils.video_source import GrowingFile
+
+load_dotenv()
+
+# 上传视频：分块大小（KB）、最大大小（MB，0 为不限）、内容哈希算法
+UPLOAD_CHUNK_KB = int(os.getenv("UPLOAD_CHUNK_KB", 1024))
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", 4096))
+UPLOAD_HASH_ALGORITHM = os.getenv("UPLOAD_HASH_ALGORITHM", "sha256")
+
+
+def upload_max_bytes() -> int:
+    return int(UPLOAD_MAX_MB * 1024 * 1024) if UPLOAD_MAX_MB > 0 else 0
+
+
+def detach_upload_file(upload) -> BinaryIO:
+    """
+    返回一个独立于 UploadFile 的只读文件对象，指向同一个临时文件
+
+    FastAPI 在接口函数返回后就会关闭上传的临时文件，流式响应中还要继续读取时需要先复制文件描述符。
+    内存中的小文件会先落到磁盘。
+    """
+    fd = os.dup(upload.file.fileno())
+    stream = os.fdopen(fd, "rb")
+    stream.seek(0)
+    return stream
+
+
+class UploadCopy(GrowingFile):
+    """
+    把上传的临时文件分块复制到目标路径，同时增量计算内容哈希
+
+    内存中只保留一个分块；可以 start() 在后台复制，由 VideoSource.from_growing_file 边复制边解码。
+    """
+
+    action = "上传"
+
+    def __init__(
+        self,
+        src: BinaryIO,
+        path: str,
+        chunk_size: int = 1024 * 1024,
+        max_bytes: int = 0,
+        hash_algorithm: str = "sha256",
+        total_bytes: Optional[int] = None,
+        close_src: bool = False,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            src (BinaryIO): 上传的文件对象（UploadFile.file）
+            path (str): 保存路径
+            chunk_size (int): 分块大小（字节）
+            max_bytes (int): 最大字节数，0 为不限
+            hash_algorithm (str): hashlib 支持的哈希算法名
+            total_bytes (int, optional): 已知的文件大小，超过上限时不开始复制
+            close_src (bool): 复制结束后是否关闭 src
+            cancel_event (threading.Event, optional): 置位后停止复制
+        """
+        super().__init__(path, max_bytes=max_bytes, cancel_event=cancel_event)
+        self.src = src
+        self.chunk_size = max(1, chunk_size)
+        self.close_src = close_src
+        self.total_bytes = total_bytes
+        self._hasher = hashlib.new(hash_algorithm)
+        self.hash_algorithm = hash_algorithm
+
+    def _chunks(self) -> Iterator[bytes]:
+        try:
+            if self.total_bytes is not None:
+                self._check_size(self.total_bytes)
+            while True:
+                chunk = self.src.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            if self.close_src:
+                self.src.close()
+
+    def _on_chunk(self, chunk: bytes):
+        self._hasher.update(chunk)
+
+    @property
+    def hexdigest(self) -> Optional[str]:
+        """复制完成后的内容哈希，未完成或失败时为 None"""
+        if not self.done or self.error is not None:
+            return None
+        return self._hasher.hexdigest()
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats[self.hash_algorithm] = self.hexdigest
+        return stats
+
+
+def create_upload_copy(upload, path: str, detach: bool = False,
+                       cancel_event: Optional[threading.Event] = None) -> UploadCopy:
+    """
+    按环境变量创建上传复制器
+
+    Args:
+        upload (UploadFile): 上传的文件
+        path (str): 保存路径
+        detach (bool): 是否复制文件描述符，接口返回后仍需继续复制时（流式响应）使用
+        cancel_event (threading.Event, optional): 置位后停止复制
+    """
+    src = detach_upload_file(upload) if detach else upload.file
+    if not detach:
+        src.seek(0)
+    return UploadCopy(
+        src,
+        path,
+        chunk_size=UPLOAD_CHUNK_KB * 1024,
+        max_bytes=upload_max_bytes(),
+        hash_algorithm=UPLOAD_HASH_ALGORITHM,
+        total_bytes=getattr(upload, "size", None),
+        close_src=detach,
+        cancel_event=cancel_event,
+    )
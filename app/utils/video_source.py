@@ -0,0 +1,431 @@
+import os
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+import requests
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+from app.utils.frame_sampler import FrameSampler
+
+load_dotenv()
+
+SOURCE_LOCAL = "local"
+URL_MODE_DOWNLOAD = "download"
+URL_MODE_PROGRESSIVE = "progressive"
+URL_MODE_DIRECT = "direct"
+
+# 远程视频的打开方式：download 下载完再处理 / progressive 边下载边解码 / direct 由解码后端直接打开 URL
+VIDEO_URL_MODE = os.getenv("VIDEO_URL_MODE", URL_MODE_DOWNLOAD).lower()
+# 下载限制：最大大小（MB，0 为不限）、连接/读取超时（秒）、总时长上限（秒，0 为不限）、分块大小（KB）
+VIDEO_DOWNLOAD_MAX_MB = float(os.getenv("VIDEO_DOWNLOAD_MAX_MB", 4096))
+VIDEO_DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("VIDEO_DOWNLOAD_CONNECT_TIMEOUT", 10))
+VIDEO_DOWNLOAD_READ_TIMEOUT = float(os.getenv("VIDEO_DOWNLOAD_READ_TIMEOUT", 60))
+VIDEO_DOWNLOAD_MAX_SECONDS = float(os.getenv("VIDEO_DOWNLOAD_MAX_SECONDS", 3600))
+VIDEO_DOWNLOAD_CHUNK_KB = int(os.getenv("VIDEO_DOWNLOAD_CHUNK_KB", 1024))
+# 下载临时文件目录，默认为系统临时目录
+VIDEO_DOWNLOAD_DIR = os.getenv("VIDEO_DOWNLOAD_DIR", "") or None
+# 边下载边解码：开始解码前、以及解码追上下载进度后再次尝试前需要新增的数据量（MB）
+VIDEO_PROGRESSIVE_MIN_MB = float(os.getenv("VIDEO_PROGRESSIVE_MIN_MB", 8))
+
+# 直播/分片流只能由解码后端直接打开
+_STREAM_SUFFIXES = (".m3u8", ".mpd")
+
+
+class GrowingFileError(Exception):
+    """分块写入文件失败、超过限制或被取消"""
+
+
+class FileTooLargeError(GrowingFileError):
+    """写入的数据超过大小上限"""
+
+
+class VideoDownloadError(GrowingFileError):
+    """下载失败或超时"""
+
+
+def is_remote_url(video_url: str) -> bool:
+    return video_url.startswith(("http://", "https://"))
+
+
+def open_capture(source: str) -> cv2.VideoCapture:
+    """打开视频；远程 URL 使用 FFmpeg 后端并设置打开/读取超时"""
+    if not is_remote_url(source):
+        return cv2.VideoCapture(source)
+    params = []
+    if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        params = [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(VIDEO_DOWNLOAD_CONNECT_TIMEOUT * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(VIDEO_DOWNLOAD_READ_TIMEOUT * 1000),
+        ]
+    return cv2.VideoCapture(source, cv2.CAP_FFMPEG, params)
+
+
+class GrowingFile:
+    """
+    分块写入磁盘的文件
+
+    子类实现 _chunks() 按顺序产出数据块，内存中只保留一个分块；累计大小超过 max_bytes、
+    总时长超过 max_seconds 或被取消时失败。可以同步 run()，也可以 start() 在后台线程写入，
+    同时用 wait() 等待写入进度，VideoSource 据此边写入边解码。
+    """
+
+    error_class = GrowingFileError
+    action = "写入"
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 0,
+        max_seconds: float = 0.0,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            path (str): 保存路径
+            max_bytes (int): 最大字节数，0 为不限
+            max_seconds (float): 总时长上限（秒），0 为不限
+            cancel_event (threading.Event, optional): 置位后停止写入
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.cancel_event = cancel_event
+
+        self.bytes_written = 0
+        self.total_bytes: Optional[int] = None
+        self.done = False
+        self.error: Optional[Exception] = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def _chunks(self) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def _on_chunk(self, chunk: bytes):
+        """每写入一个分块后调用，子类可用于计算哈希等"""
+
+    def _check_size(self, size: int):
+        if self.max_bytes and size > self.max_bytes:
+            raise FileTooLargeError(f"视频大小 {size} 字节超过上限 {self.max_bytes}")
+
+    def _write(self):
+        deadline = self._started_at + self.max_seconds if self.max_seconds > 0 else None
+        with open(self.path, "wb") as f:
+            for chunk in self._chunks():
+                if self._stop.is_set() or (self.cancel_event is not None and self.cancel_event.is_set()):
+                    raise self.error_class(f"{self.action}已取消")
+                if deadline is not None and time.time() > deadline:
+                    raise self.error_class(f"{self.action}超过 {self.max_seconds} 秒")
+                if not chunk:
+                    continue
+                self._check_size(self.bytes_written + len(chunk))
+                f.write(chunk)
+                f.flush()  # 边写入边解码时解码器要能读到已写入的数据
+                self._on_chunk(chunk)
+                with self._cond:
+                    self.bytes_written += len(chunk)
+                    self._cond.notify_all()
+
+    def run(self):
+        """写入到完成，失败时抛出异常"""
+        self._started_at = time.time()
+        try:
+            self._write()
+        except Exception as e:
+            self.error = e if isinstance(e, GrowingFileError) else self.error_class(f"{self.action}失败: {e}")
+        finally:
+            self._finished_at = time.time()
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+        if self.error is not None:
+            raise self.error
+
+    def start(self) -> "GrowingFile":
+        """在后台线程中写入"""
+        def target():
+            try:
+                self.run()
+            except GrowingFileError as e:
+                print(f"视频{self.action}失败: {e}")
+
+        self._thread = threading.Thread(target=target, name=f"video-{type(self).__name__}", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, min_bytes: int, timeout: Optional[float] = None) -> bool:
+        """等待已写入字节数达到 min_bytes 或写入结束，返回是否满足条件"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done or self.bytes_written >= min_bytes, timeout)
+
+    def stop(self):
+        """停止后台写入（在下一个分块时生效）"""
+        self._stop.set()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict:
+        end = self._finished_at or time.time()
+        seconds = end - self._started_at if self._started_at else 0.0
+        return {
+            "bytes": self.bytes_written,
+            "total_bytes": self.total_bytes,
+            "done": self.done,
+            "seconds": round(seconds, 2),
+            "mb_per_s": round(self.bytes_written / seconds / 1e6, 2) if seconds > 0 else 0.0,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class VideoDownload(GrowingFile):
+    """
+    流式分块下载远程视频到磁盘
+
+    Content-Length 超过上限时不开始下载；单次读取超过超时时间时失败。
+    """
+
+    error_class = VideoDownloadError
+    action = "下载"
+
+    def __init__(
+        self,
+        url: str,
+        path: str,
+        max_bytes: int = 0,
+        chunk_size: int = 1024 * 1024,
+        timeout: Tuple[float, float] = (10.0, 60.0),
+        max_seconds: float = 0.0,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            url (str): 视频 URL
+            path (str): 保存路径
+            max_bytes (int): 最大字节数，0 为不限
+            chunk_size (int): 分块大小（字节）
+            timeout (Tuple[float, float]): (连接超时, 读取超时) 秒
+            max_seconds (float): 下载总时长上限（秒），0 为不限
+            cancel_event (threading.Event, optional): 置位后停止下载
+        """
+        super().__init__(path, max_bytes=max_bytes, max_seconds=max_seconds, cancel_event=cancel_event)
+        self.url = url
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+
+    def _chunks(self) -> Iterator[bytes]:
+        with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit():
+                self.total_bytes = int(length)
+                self._check_size(self.total_bytes)
+            yield from response.iter_content(chunk_size=self.chunk_size)
+
+
+class VideoSource:
+    """
+    视频帧来源，迭代得到 (帧号, 时间戳秒, BGR 帧)
+
+    - 本地文件：直接打开
+    - download：流式下载到临时文件后再解码
+    - progressive：后台下载的同时解码已下载的部分；解码追上下载进度时等待更多数据，
+      再从下一个要抽的帧号重新打开文件继续。需要视频索引在文件头部（faststart MP4、TS、MKV 等），
+      否则要等下载完成才能打开
+    - direct：由 FFmpeg 后端直接打开 URL（也用于 m3u8 等分片流），不落盘
+    """
+
+    def __init__(
+        self,
+        video_url: str,
+        sample_interval: float,
+        url_mode: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        start_frame: int = 0,
+        end_frame: Optional[int] = None,
+    ):
+        """
+        Args:
+            video_url (str): 本地路径或 http(s) URL
+            sample_interval (float): 抽帧间隔（秒）
+            url_mode (str, optional): 远程视频的打开方式，默认读取 VIDEO_URL_MODE
+            cancel_event (threading.Event, optional): 置位后停止下载与解码
+            start_frame (int): 从该帧号开始抽帧（从检查点恢复），见 FrameSampler
+            end_frame (int, optional): 只抽取该帧号之前的帧（分段处理），默认到视频结尾
+        """
+        self.video_url = video_url
+        self.sample_interval = sample_interval
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.cancel_event = cancel_event
+        if not is_remote_url(video_url):
+            self.mode = SOURCE_LOCAL
+        elif urlparse(video_url).path.lower().endswith(_STREAM_SUFFIXES):
+            self.mode = URL_MODE_DIRECT
+        else:
+            self.mode = (url_mode or VIDEO_URL_MODE).lower()
+        if self.mode not in (SOURCE_LOCAL, URL_MODE_DOWNLOAD, URL_MODE_PROGRESSIVE, URL_MODE_DIRECT):
+            raise ValueError(f"Unknown video URL mode: {self.mode}")
+
+        self.download: Optional[GrowingFile] = None
+        self.temp_path: Optional[str] = None
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.sampler: Optional[FrameSampler] = None
+        self.fps: Optional[float] = None
+        self.step: Optional[int] = None
+        self.reopens = 0
+        self._sampler_stats: Dict[str, int] = {"grabbed": 0, "retrieved": 0, "seeks": 0}
+
+    @classmethod
+    def from_growing_file(
+        cls,
+        writer: GrowingFile,
+        sample_interval: float,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> "VideoSource":
+        """解码一个仍在写入的本地文件（例如正在接收的上传），按 progressive 方式边写入边解码，关闭时删除该文件"""
+        source = cls(writer.path, sample_interval, cancel_event=cancel_event)
+        source.mode = URL_MODE_PROGRESSIVE
+        source.download = writer
+        source.temp_path = writer.path
+        return source
+
+    def _new_download(self) -> VideoDownload:
+        fd, self.temp_path = tempfile.mkstemp(suffix=".mp4", dir=VIDEO_DOWNLOAD_DIR)
+        os.close(fd)
+        return VideoDownload(
+            self.video_url,
+            self.temp_path,
+            max_bytes=int(VIDEO_DOWNLOAD_MAX_MB * 1024 * 1024),
+            chunk_size=VIDEO_DOWNLOAD_CHUNK_KB * 1024,
+            timeout=(VIDEO_DOWNLOAD_CONNECT_TIMEOUT, VIDEO_DOWNLOAD_READ_TIMEOUT),
+            max_seconds=VIDEO_DOWNLOAD_MAX_SECONDS,
+            cancel_event=self.cancel_event,
+        )
+
+    def _open_sampler(self, source: str, start_frame: int = 0) -> Optional[FrameSampler]:
+        self.cap = open_capture(source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            return None
+        self.sampler = FrameSampler(self.cap, self.sample_interval, fps=self.fps, start_frame=start_frame,
+                                    end_frame=self.end_frame)
+        self.fps, self.step = self.sampler.fps, self.sampler.step
+        return self.sampler
+
+    def _release(self):
+        if self.sampler is not None:
+            for key in self._sampler_stats:
+                self._sampler_stats[key] += getattr(self.sampler, key)
+            self.sampler = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def open(self) -> "VideoSource":
+        """
+        打开视频：download 模式在这里下载完成，progressive 模式启动后台下载并等待首批数据
+
+        Raises:
+            FileNotFoundError / VideoDownloadError / RuntimeError: 视频不存在、下载失败或无法打开
+        """
+        if self.mode == SOURCE_LOCAL:
+            if not os.path.exists(self.video_url):
+                raise FileNotFoundError(f"视频文件不存在: {self.video_url}")
+            if self._open_sampler(self.video_url, self.start_frame) is None:
+                raise RuntimeError(f"无法打开视频: {self.video_url}")
+        elif self.mode == URL_MODE_DIRECT:
+            if self._open_sampler(self.video_url, self.start_frame) is None:
+                raise RuntimeError(f"无法打开视频流: {self.video_url}")
+        elif self.mode == URL_MODE_DOWNLOAD:
+            self.download = self._new_download()
+            self.download.run()
+            if self._open_sampler(self.temp_path, self.start_frame) is None:
+                raise RuntimeError(f"无法打开下载的视频: {self.video_url}")
+        else:
+            if self.download is None:
+                self.download = self._new_download().start()
+            self.download.wait(int(VIDEO_PROGRESSIVE_MIN_MB * 1024 * 1024))
+            if self.download.error is not None:
+                raise self.download.error
+        return self
+
+    def __iter__(self) -> Iterator[Tuple[int, float, np.ndarray]]:
+        if self.mode != URL_MODE_PROGRESSIVE:
+            yield from self.sampler
+            return
+
+        next_frame = self.start_frame
+        min_bytes = int(VIDEO_PROGRESSIVE_MIN_MB * 1024 * 1024)
+        while True:
+            finished = self.download.done
+            if self.download.error is not None:
+                raise self.download.error
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                return
+
+            if self._open_sampler(self.temp_path, next_frame) is not None:
+                for frame_index, timestamp, frame in self.sampler:
+                    next_frame = frame_index + self.step
+                    yield frame_index, timestamp, frame
+            self._release()
+
+            if finished:
+                if self.fps is None:
+                    raise RuntimeError(f"无法打开下载的视频: {self.video_url}")
+                return
+            # 解码追上了下载进度（或文件头还不完整），等待更多数据后从下一个抽帧位置重新打开
+            self.reopens += 1
+            self.download.wait(self.download.bytes_written + min_bytes)
+
+    @property
+    def local_path(self) -> Optional[str]:
+        """已完整保存在本地的视频文件路径（本地文件或下载完成的临时文件），可以再次打开做分段处理"""
+        if self.mode == SOURCE_LOCAL:
+            return self.video_url
+        if self.mode == URL_MODE_DOWNLOAD and self.download is not None and self.download.done:
+            return self.temp_path
+        return None
+
+    @property
+    def frame_count(self) -> int:
+        """视频总帧数，容器中没有记录时为 0"""
+        return self.sampler.frame_count if self.sampler is not None else 0
+
+    def describe(self) -> str:
+        sampler_mode = self.sampler.mode if self.sampler is not None else "-"
+        start = f"，从第 {self.sampler.start_frame} 帧开始" if self.sampler is not None and self.sampler.start_frame else ""
+        end = f"，到第 {self.end_frame} 帧之前" if self.end_frame is not None else ""
+        return f"来源 {self.mode}，FPS: {self.fps}，每 {self.step} 帧抽一帧（{sampler_mode}）{start}{end}"
+
+    def stats(self) -> Dict:
+        stats = dict(self._sampler_stats)
+        if self.sampler is not None:
+            for key in stats:
+                stats[key] += getattr(self.sampler, key)
+        stats.update({"source": self.mode, "fps": self.fps, "step": self.step, "reopens": self.reopens})
+        if self.download is not None:
+            stats["download"] = self.download.stats()
+        return stats
+
+    def release(self):
+        """只释放解码器，保留下载的临时文件（例如分段处理时由各段重新打开），close() 时再删除"""
+        self._release()
+
+    def close(self):
+        """释放解码器，停止仍在进行的后台下载并删除临时文件"""
+        self._release()
+        if self.download is not None and self.mode == URL_MODE_PROGRESSIVE:
+            self.download.stop()
+            self.download.join()
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -0,0 +1,382 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 推理进程数，0 表示不启用进程池，在当前进程内推理
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", 0))
+# 每个推理进程使用的 CPU 线程数
+INFER_WORKER_THREADS = int(os.getenv("INFER_WORKER_THREADS", 4))
+# 是否把每个进程绑定到固定的 CPU 核（仅 Linux）
+INFER_WORKER_PIN_CORES = os.getenv("INFER_WORKER_PIN_CORES", "false").lower() in ("1", "true", "yes")
+# 进程异常退出（包括模型加载失败）后的重启：首次等待时间（秒，之后每次翻倍，最长 INFER_WORKER_RESTART_BACKOFF_MAX），
+# 连续失败超过 INFER_WORKER_MAX_RESTARTS 次后不再重启，该进程标记为失败
+INFER_WORKER_RESTART_BACKOFF = float(os.getenv("INFER_WORKER_RESTART_BACKOFF", 5))
+INFER_WORKER_RESTART_BACKOFF_MAX = float(os.getenv("INFER_WORKER_RESTART_BACKOFF_MAX", 300))
+INFER_WORKER_MAX_RESTARTS = int(os.getenv("INFER_WORKER_MAX_RESTARTS", 5))
+
+
+def _worker_main(worker_id: int, threads: int, pin_cores: bool, task_queue, result_queue):
+    """推理子进程入口：加载独立的检测与 OCR 模型，循环处理任务"""
+    # 必须在导入 paddle 之前限制线程数
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    os.environ["YOLOV8_CPU_THREADS"] = str(threads)
+    if pin_cores and hasattr(os, "sched_setaffinity"):
+        cpu_count = os.cpu_count() or 1
+        cores = {(worker_id * threads + i) % cpu_count for i in range(threads)}
+        os.sched_setaffinity(0, cores)
+
+    import cv2
+
+    cv2.setNumThreads(1)
+    try:
+        from app.models.model_factory import create_yolov8_model, create_ocr_model
+
+        detector = create_yolov8_model(threshold=0.3)
+        ocr_engine = create_ocr_model(cpu_threads=threads)
+    except Exception as e:
+        result_queue.put((worker_id, None, "failed", repr(e)))
+        result_queue.close()
+        result_queue.join_thread()
+        os._exit(1)
+    result_queue.put((worker_id, None, "ready", os.getpid()))
+
+    while True:
+        item = task_queue.get()
+        if item is None:
+            break
+        task_id, task, payload = item
+        try:
+            if task == "detect":
+                frames, threshold, input_size = payload
+                # 同时返回实际使用的输入尺寸，固定尺寸的静态图模型会忽略请求的尺寸
+                result = (detector.predict_arrays_raw(frames, threshold=threshold, input_size=input_size),
+                          detector.effective_input_size(input_size))
+            elif task == "ocr":
+                result = ocr_engine.detect_and_recognize(payload)
+            elif task == "ocr_batch":
+                result = ocr_engine.recognize_batch(payload)
+            elif task == "ping":
+                result = "pong"
+            else:
+                raise ValueError(f"Unknown task: {task}")
+            result_queue.put((worker_id, task_id, "ok", result))
+        except Exception as e:
+            result_queue.put((worker_id, task_id, "error", repr(e)))
+
+
+class _WorkerHandle:
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process = None
+        self.task_queue = None
+        self.ready = False
+        self.pid = None
+        self.inflight: Dict[int, Future] = {}
+        self.last_seen = time.time()
+        self.restarts = 0
+        self.completed = 0
+        self.failures = 0  # 上次就绪以来连续异常退出的次数
+        self.next_restart_at: Optional[float] = None
+        self.failed = False  # 连续失败次数超过上限，不再重启
+        self.last_error: Optional[str] = None
+
+
+class InferenceWorkerPool:
+    """
+    多进程推理池
+
+    每个子进程持有独立的 YOLOv8 与 PaddleOCR 实例并固定 CPU 线程数，
+    主进程把任务分发给在途任务最少的就绪进程，并定期做健康检查，异常退出或卡死的进程会被重启。
+    异常退出（例如模型加载失败）后按指数退避重启，连续失败超过 max_restarts 次的进程标记为失败；
+    所有进程都失败时 submit() 直接抛出异常，不再等待。
+    """
+
+    def __init__(
+        self,
+        num_workers: int,
+        threads_per_worker: int = 4,
+        pin_cores: bool = False,
+        health_interval: float = 10.0,
+        task_timeout: float = 120.0,
+        restart_backoff: float = 5.0,
+        restart_backoff_max: float = 300.0,
+        max_restarts: int = 5,
+    ):
+        """
+        Args:
+            num_workers (int): 推理进程数
+            threads_per_worker (int): 每个进程的 CPU 线程数
+            pin_cores (bool): 是否绑定 CPU 核
+            health_interval (float): 健康检查间隔（秒）
+            task_timeout (float): 有在途任务但超过该时间没有任何响应时视为卡死（秒）
+            restart_backoff (float): 异常退出后首次重启前的等待时间（秒），之后每次翻倍
+            restart_backoff_max (float): 重启等待时间的上限（秒）
+            max_restarts (int): 连续异常退出的最大重启次数，进程就绪后重新计数
+        """
+        self.num_workers = max(1, num_workers)
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.pin_cores = pin_cores
+        self.health_interval = health_interval
+        self.task_timeout = task_timeout
+        self.restart_backoff = restart_backoff
+        self.restart_backoff_max = restart_backoff_max
+        self.max_restarts = max(0, max_restarts)
+
+        self._ctx = mp.get_context("spawn")
+        self._result_queue = self._ctx.Queue()
+        self._workers = [_WorkerHandle(i) for i in range(self.num_workers)]
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready_cond = threading.Condition(self._lock)
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for handle in self._workers:
+            self._spawn(handle)
+        threading.Thread(target=self._collect_results, name="worker-pool-collector", daemon=True).start()
+        threading.Thread(target=self._health_check, name="worker-pool-health", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            for handle in self._workers:
+                self._fail_inflight(handle, RuntimeError("worker pool stopped"))
+                if handle.process and handle.process.is_alive():
+                    handle.task_queue.put(None)
+        for handle in self._workers:
+            if handle.process:
+                handle.process.join(timeout=5)
+                if handle.process.is_alive():
+                    handle.process.terminate()
+
+    def _spawn(self, handle: _WorkerHandle):
+        handle.task_queue = self._ctx.Queue()
+        handle.ready = False
+        handle.last_seen = time.time()
+        handle.process = self._ctx.Process(
+            target=_worker_main,
+            args=(handle.worker_id, self.threads_per_worker, self.pin_cores, handle.task_queue, self._result_queue),
+            name=f"infer-worker-{handle.worker_id}",
+            daemon=True,
+        )
+        handle.process.start()
+        print(f"推理进程 {handle.worker_id} 启动中 (pid={handle.process.pid})")
+
+    def _fail_inflight(self, handle: _WorkerHandle, error: Exception):
+        for future in handle.inflight.values():
+            if not future.done():
+                future.set_exception(error)
+        handle.inflight.clear()
+
+    def _restart(self, handle: _WorkerHandle, reason: str):
+        """调用方需持有 self._lock"""
+        print(f"推理进程 {handle.worker_id} {reason}，正在重启")
+        self._fail_inflight(handle, RuntimeError(f"inference worker {handle.worker_id} {reason}"))
+        if handle.process and handle.process.is_alive():
+            handle.process.terminate()
+        handle.restarts += 1
+        self._spawn(handle)
+
+    def _on_exit(self, handle: _WorkerHandle):
+        """进程异常退出：按退避时间安排重启，连续失败次数超过上限时标记为失败。调用方需持有 self._lock"""
+        code = handle.process.exitcode
+        handle.ready = False
+        handle.next_restart_at = None
+        handle.failures += 1
+        if handle.last_error is None or code != 1:
+            handle.last_error = f"exited with code {code}"
+        self._fail_inflight(handle, RuntimeError(f"inference worker {handle.worker_id} exited with code {code}"))
+        if handle.failures > self.max_restarts:
+            handle.failed = True
+            print(f"推理进程 {handle.worker_id} 连续 {handle.failures} 次异常退出，不再重启: {handle.last_error}")
+            self._ready_cond.notify_all()
+            return
+        delay = min(self.restart_backoff_max, self.restart_backoff * 2 ** (handle.failures - 1))
+        handle.next_restart_at = time.time() + delay
+        print(f"推理进程 {handle.worker_id} 异常退出 (code={code})，{delay:.1f} 秒后重启")
+
+    def _all_failed(self) -> bool:
+        return all(h.failed for h in self._workers)
+
+    def _reap_dead(self):
+        """已退出但还没处理的进程立即按异常退出处理，不再等到下一次健康检查。调用方需持有 self._lock"""
+        for handle in self._workers:
+            if handle.failed or handle.next_restart_at is not None or handle.process is None:
+                continue
+            if not handle.process.is_alive():
+                self._on_exit(handle)
+
+    def _ready_or_all_failed(self) -> bool:
+        self._reap_dead()
+        return any(h.ready for h in self._workers) or self._all_failed()
+
+    def _collect_results(self):
+        last_reap = 0.0
+        while self._running:
+            # 每秒检查一次进程是否退出，退出进程的在途任务立即失败
+            if time.time() - last_reap >= 1.0:
+                with self._lock:
+                    self._reap_dead()
+                last_reap = time.time()
+            try:
+                worker_id, task_id, status, result = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                handle = self._workers[worker_id]
+                handle.last_seen = time.time()
+                if task_id is None:
+                    if status == "ready":
+                        handle.ready = True
+                        handle.pid = result
+                        handle.failures = 0
+                        print(f"推理进程 {worker_id} 已就绪 (pid={result})")
+                        self._ready_cond.notify_all()
+                    else:
+                        handle.last_error = f"init failed: {result}"
+                        print(f"推理进程 {worker_id} 初始化失败: {result}")
+                    continue
+                future = handle.inflight.pop(task_id, None)
+                handle.completed += 1
+            if future is None or future.done():
+                continue
+            if status == "ok":
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _health_check(self):
+        while self._running:
+            time.sleep(self.health_interval)
+            with self._lock:
+                for handle in self._workers:
+                    if handle.failed:
+                        continue
+                    if not handle.process.is_alive():
+                        if handle.next_restart_at is None:
+                            self._on_exit(handle)
+                        if handle.next_restart_at is not None and time.time() >= handle.next_restart_at:
+                            handle.next_restart_at = None
+                            self._restart(handle, f"exited with code {handle.process.exitcode}")
+                    elif handle.inflight and time.time() - handle.last_seen > self.task_timeout:
+                        self._restart(handle, "is not responding")
+                    elif handle.ready and not handle.inflight:
+                        # 空闲进程发送心跳，刷新 last_seen
+                        self._dispatch(handle, "ping", None)
+
+    def _dispatch(self, handle: _WorkerHandle, task: str, payload: Any) -> Future:
+        """调用方需持有 self._lock"""
+        task_id = next(self._task_ids)
+        future = Future()
+        if not handle.inflight:
+            # 从空闲开始计时，避免把空闲时间算成卡死
+            handle.last_seen = time.time()
+        handle.inflight[task_id] = future
+        handle.task_queue.put((task_id, task, payload))
+        return future
+
+    def submit(self, task: str, payload: Any, timeout: Optional[float] = None) -> Future:
+        """
+        把任务交给在途任务最少的就绪进程
+
+        Args:
+            task (str): 任务类型，detect / ocr / ocr_batch
+            payload (Any): 任务参数
+            timeout (float, optional): 等待有进程就绪的最长时间（秒）
+
+        Raises:
+            RuntimeError: 进程池未启动、等待超时，或所有进程都已启动失败
+        """
+        if not self._running:
+            raise RuntimeError("worker pool is not running")
+        with self._ready_cond:
+            if not self._ready_cond.wait_for(self._ready_or_all_failed, timeout):
+                raise RuntimeError("no inference worker is ready")
+            if not any(h.ready for h in self._workers):
+                errors = "; ".join(f"{h.worker_id}: {h.last_error}" for h in self._workers)
+                raise RuntimeError(f"all inference workers failed to start ({errors})")
+            handle = min((h for h in self._workers if h.ready), key=lambda h: len(h.inflight))
+            return self._dispatch(handle, task, payload)
+
+    def detect_batch(self, frames: List, threshold: float, input_size: Optional[int] = None) -> Future:
+        """结果为 (检测数组列表, 实际使用的输入尺寸)"""
+        return self.submit("detect", (frames, threshold, input_size))
+
+    def ocr(self, image) -> Future:
+        return self.submit("ocr", image)
+
+    def ocr_batch(self, images: List) -> Future:
+        """整批交给同一个进程，文字行才能合并成大批次识别"""
+        return self.submit("ocr_batch", images)
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return any(h.ready for h in self._workers)
+
+    def stats(self) -> Dict:
+        """各推理进程的健康状态与负载"""
+        with self._lock:
+            return {
+                "num_workers": self.num_workers,
+                "threads_per_worker": self.threads_per_worker,
+                "failed": self._all_failed(),
+                "workers": [{
+                    "worker_id": h.worker_id,
+                    "pid": h.pid,
+                    "alive": bool(h.process and h.process.is_alive()),
+                    "ready": h.ready,
+                    "inflight": len(h.inflight),
+                    "completed": h.completed,
+                    "restarts": h.restarts,
+                    "failures": h.failures,
+                    "failed": h.failed,
+                    "next_restart_in": round(max(0.0, h.next_restart_at - time.time()), 1)
+                    if h.next_restart_at is not None else None,
+                    "last_error": h.last_error,
+                    "last_seen": round(time.time() - h.last_seen, 1),
+                } for h in self._workers],
+            }
+
+
+_pool: Optional[InferenceWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> Optional[InferenceWorkerPool]:
+    """返回全局推理进程池，INFER_WORKERS 为 0 时返回 None"""
+    global _pool
+    if INFER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferenceWorkerPool(
+                num_workers=INFER_WORKERS,
+                threads_per_worker=INFER_WORKER_THREADS,
+                pin_cores=INFER_WORKER_PIN_CORES,
+                restart_backoff=INFER_WORKER_RESTART_BACKOFF,
+                restart_backoff_max=INFER_WORKER_RESTART_BACKOFF_MAX,
+                max_restarts=INFER_WORKER_MAX_RESTARTS,
+            )
+            _pool.start()
+    return _pool
+
+
+def shutdown_worker_pool():
+    """停止全局推理进程池（未启用时什么也不做）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop()
+            _pool = None
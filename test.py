@@ -29,4 +29,6 @@ print("Results:", results3)
 # PPOCR = PPOCRModel()
 # image_path = os.path.join(os.path.dirname(__file__), 'resources/images/000008.jpg')
 # results_det = PPOCR.detect_text_regions(image_path, save_crops=True)
-# print("Detection Results:", results_det)
\ No newline at end of file
+# print("Detection Results:", results_det)
+results4 = model.predict_array(img_np, threshold=0.2)
+print("Results:", results4)